@@ -0,0 +1,118 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Benchmarks run a real uvicorn worker in a subprocess against a throwaway SQLite database and
+drive it with plain `http.client` connections, so they need nothing beyond requirements.txt.
+Run them from the backend directory, e.g. `python benchmarks/kdf_flood.py`.
+"""
+import contextlib
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def run_server(env: Optional[Dict[str, str]] = None, workers: int = 1) -> Iterator[Tuple[str, int]]:
+    """Start `uvicorn main:app` on a free port with a temporary database; yield (host, port)."""
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        proc_env = dict(os.environ)
+        proc_env.setdefault("DATABASE_URL", f"sqlite:///{tmp}/bench.db")
+        # every client comes from 127.0.0.1: signup/login storms would be throttled as one caller
+        proc_env.setdefault("RATE_LIMIT_ENABLED", "0")
+        proc_env.update(env or {})
+        cmd = [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+            # open SSE streams never finish on their own; don't let them block shutdown
+            "--timeout-graceful-shutdown", "2",
+        ]
+        proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=proc_env)
+        try:
+            wait_ready("127.0.0.1", port)
+            yield "127.0.0.1", port
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def wait_ready(host: str, port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            Client(host, port).request("GET", "/")
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on {host}:{port} did not become ready")
+
+
+class Client:
+    """Keep-alive JSON client over a single `http.client` connection (one per thread)."""
+
+    def __init__(self, host: str, port: int, token: Optional[str] = None, timeout: float = 60.0) -> None:
+        self.conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.token = token
+
+    def request(self, method: str, path: str, body: Any = None, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Any, Dict[str, str]]:
+        hdrs = {"Content-Type": "application/json"}
+        if self.token:
+            hdrs["Authorization"] = f"Bearer {self.token}"
+        hdrs.update(headers or {})
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        try:
+            self.conn.request(method, path, body=payload, headers=hdrs)
+            resp = self.conn.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # server closed the keep-alive connection; reconnect once
+            self.conn.close()
+            self.conn.request(method, path, body=payload, headers=hdrs)
+            resp = self.conn.getresponse()
+        raw = resp.read()
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = raw
+        return resp.status, data, {k.lower(): v for k, v in resp.getheaders()}
+
+
+def signup(host: str, port: int, name: str, password: str = "bench-password", pin: Optional[str] = "1234") -> Tuple[str, Dict[str, Any]]:
+    """Create a user through the API and return (access_token, user)."""
+    status, data, _ = Client(host, port).request(
+        "POST", "/auth/signup",
+        {"name": name, "email": f"{name}@example.com", "password": password, "pin": pin},
+    )
+    if status != 200:
+        raise RuntimeError(f"signup failed for {name}: {status} {data}")
+    return data["access_token"], data["user"]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max of latency samples (seconds), reported in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {"count": len(ordered), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": pick(1.0)}
@@ -0,0 +1,89 @@
+"""
+Read-heavy endpoints on the thread-pool (sync) vs. the AsyncSession database path.
+
+Runs the same mix of GET /auth/me, /transactions and /auth/search against two fresh servers,
+one with DB_ASYNC=0 and one with DB_ASYNC=1, from many client threads at once. The user
+cache is disabled so every /auth/me really reads the database. Prints requests/sec, latency
+and the pool counters for both.
+
+Usage (from backend/):
+    python benchmarks/async_db.py [--users 20] [--threads 64] [--duration 10]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+from _common import Client, percentiles, run_server, signup
+
+PATHS = ["/auth/me", "/transactions?limit=20", "/auth/search?q=async"]
+
+
+def reader(host: str, port: int, tokens: list, stop: threading.Event, out: dict, lock: threading.Lock) -> None:
+    rng = random.Random()
+    client = Client(host, port, rng.choice(tokens))
+    samples, codes = [], {}
+    while not stop.is_set():
+        path = rng.choice(PATHS)
+        start = time.perf_counter()
+        status, _, _ = client.request("GET", path)
+        samples.append(time.perf_counter() - start)
+        codes[status] = codes.get(status, 0) + 1
+    with lock:
+        out["samples"].extend(samples)
+        for code, n in codes.items():
+            out["codes"][code] = out["codes"].get(code, 0) + n
+
+
+def measure(db_async: bool, users: int, threads: int, duration: float) -> dict:
+    env = {"DB_ASYNC": "1" if db_async else "0", "USER_CACHE_TTL_SECONDS": "0"}
+    with run_server(env) as (host, port):
+        accounts = [signup(host, port, f"async{i}") for i in range(users)]
+        tokens = [token for token, _ in accounts]
+        # a little history so /transactions has rows to page through
+        for i, (token, _) in enumerate(accounts):
+            _, receiver = accounts[(i + 1) % len(accounts)]
+            Client(host, port, token).request("POST", "/transfer", {"receiver_email": receiver["email"], "amount": 1, "pin": "1234"})
+
+        out = {"samples": [], "codes": {}}
+        lock = threading.Lock()
+        stop = threading.Event()
+        workers = [threading.Thread(target=reader, args=(host, port, tokens, stop, out, lock)) for _ in range(threads)]
+        started = time.perf_counter()
+        for t in workers:
+            t.start()
+        time.sleep(duration)
+        stop.set()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - started
+        _, stats, _ = Client(host, port).request("GET", "/stats")
+    ok = out["codes"].get(200, 0)
+    return {
+        "requests_ok": ok,
+        "requests_per_second": round(ok / elapsed, 1),
+        "status_codes": {str(k): v for k, v in sorted(out["codes"].items())},
+        "latency": percentiles(out["samples"]),
+        "db_pool": stats.get("db_pool"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    sync = measure(False, args.users, args.threads, args.duration)
+    async_ = measure(True, args.users, args.threads, args.duration)
+    print(json.dumps({
+        "thread_pool": sync,
+        "async_session": async_,
+        "speedup": round(async_["requests_per_second"] / sync["requests_per_second"], 2) if sync["requests_per_second"] else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Bulk synthetic data for scale testing: millions of users, tens of millions of transfers.
+
+Creating users through the API hashes a password per user and commits row by row; this
+loader writes straight into the database instead:
+
+- one precomputed password/PIN hash fixture shared by every generated user, so they can
+  still log in (password from --password, PIN 1234);
+- secondary indexes (and the user search index) are dropped for the load and rebuilt once
+  at the end, then the tables are analyzed;
+- rows go in with executemany in large transactions on SQLite (synchronous=OFF for the
+  load) and with COPY on Postgres (psycopg 3 or psycopg2).
+
+The data is skewed like real payments: --hot-accounts merchants receive --hot-share of all
+transfers, the remaining receivers follow a Zipf (power-law) distribution over users, amounts
+are log-normal (median ~20, capped at 500), and transfers are spread evenly over the last
+--days days in id order, as the app would have written them. Balances are set to the initial
+balance plus the generated credits minus debits, so money is conserved (a rare heavy sender
+can end up below zero). Generated users are appended after any existing ones; emails are
+`load<id>@load.example`.
+
+Usage (from backend/):
+    python benchmarks/bulk_load.py [--database-url sqlite:///./data.db] [--users 1000000] [--transfers 10000000]
+                                   [--hot-accounts 100] [--hot-share 0.3] [--zipf 1.1] [--days 365]
+                                   [--batch 50000] [--seed 1] [--password loadtest-password]
+"""
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Sequence
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_NAMES = [
+    "Alice", "Bob", "Carol", "David", "Emma", "Farah", "George", "Hana", "Ivan", "Julia", "Kenji", "Lena",
+    "Mateo", "Nora", "Omar", "Priya", "Quinn", "Rosa", "Sven", "Tara", "Umar", "Vera", "Wei", "Yusuf", "Zoe",
+]
+LAST_NAMES = [
+    "Smith", "Garcia", "Chen", "Okafor", "Müller", "Rossi", "Kowalski", "Silva", "Nguyen", "Haddad", "Ivanova",
+    "Kim", "Patel", "Dubois", "Andersen", "Tanaka", "Mensah", "Novak", "Costa", "Schmidt", "Reyes", "Larsen",
+]
+NOTES = ["rent", "dinner", "groceries", "refund", "invoice", "gift", "taxi", "coffee", "tickets", "utilities"]
+
+
+def log(message: str) -> None:
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", file=sys.stderr, flush=True)
+
+
+class Writer:
+    """Bulk row writer over a raw DBAPI connection: executemany on SQLite, COPY on Postgres."""
+
+    def __init__(self, engine: Any) -> None:
+        self.engine = engine
+        self.dialect = engine.dialect.name
+        self.raw = engine.raw_connection()
+        if self.dialect == "sqlite":
+            cur = self.raw.cursor()
+            # durability doesn't matter for a load that is re-run from scratch if it fails
+            cur.execute("PRAGMA synchronous=OFF")
+            cur.execute("PRAGMA cache_size=-262144")
+            cur.close()
+
+    def insert(self, table: str, columns: Sequence[str], rows: List[tuple]) -> None:
+        cur = self.raw.cursor()
+        try:
+            if self.dialect == "sqlite":
+                marks = ",".join("?" * len(columns))
+                cur.executemany(f"INSERT INTO {table} ({','.join(columns)}) VALUES ({marks})", rows)
+            elif hasattr(cur, "copy"):
+                # psycopg 3
+                with cur.copy(f"COPY {table} ({','.join(columns)}) FROM STDIN") as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            else:
+                # psycopg2
+                buf = io.StringIO()
+                csv.writer(buf).writerows(rows)
+                buf.seek(0)
+                cur.copy_expert(f"COPY {table} ({','.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+            self.raw.commit()
+        finally:
+            cur.close()
+
+    def update_balances(self, balances: Dict[int, Decimal]) -> None:
+        cur = self.raw.cursor()
+        try:
+            mark = "?" if self.dialect == "sqlite" else "%s"
+            cur.executemany(
+                f"UPDATE users SET balance = {mark} WHERE id = {mark}",
+                [(str(balance), user_id) for user_id, balance in balances.items()],
+            )
+            self.raw.commit()
+        finally:
+            cur.close()
+
+    def close(self) -> None:
+        self.raw.close()
+
+
+@contextlib.contextmanager
+def deferred_indexes(engine: Any, tables: Sequence[Any]) -> Iterator[None]:
+    """Drop the tables' secondary indexes and the search index for the load, rebuild after."""
+    from sqlalchemy.schema import CreateIndex, DropIndex
+
+    indexes = [index for table in tables for index in table.indexes]
+    with engine.begin() as conn:
+        for index in indexes:
+            conn.execute(DropIndex(index, if_exists=True))
+        if engine.dialect.name == "sqlite":
+            # per-row FTS triggers; install_search_index recreates and rebuilds them
+            for trigger in ("users_fts_ai", "users_fts_ad", "users_fts_au"):
+                conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+            conn.exec_driver_sql("DROP TABLE IF EXISTS users_fts")
+        elif engine.dialect.name == "postgresql":
+            conn.exec_driver_sql("DROP INDEX IF EXISTS ix_users_name_trgm")
+            conn.exec_driver_sql("DROP INDEX IF EXISTS ix_users_email_trgm")
+    yield
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for index in indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+    from user.search_index import install_search_index
+
+    backend = install_search_index(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    log(f"indexes rebuilt (search: {backend}) in {time.perf_counter() - started:.1f}s")
+
+
+def load_users(writer: Writer, first_id: int, count: int, batch: int, rng: random.Random, hashed_password: str, hashed_pin: str, initial: Decimal) -> None:
+    columns = ("id", "name", "email", "hashed_password", "hashed_pin", "balance", "created_at")
+    now = datetime.now(timezone.utc)
+    created_at = now.strftime("%Y-%m-%d %H:%M:%S") if writer.dialect == "sqlite" else now
+    started = time.perf_counter()
+    for offset in range(0, count, batch):
+        rows = []
+        for user_id in range(first_id + offset, first_id + min(count, offset + batch)):
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            rows.append((user_id, name, f"load{user_id}@load.example", hashed_password, hashed_pin, str(initial), created_at))
+        writer.insert("users", columns, rows)
+        done = min(count, offset + batch)
+        log(f"users {done}/{count} ({done / (time.perf_counter() - started):.0f}/s)")
+
+
+def load_transfers(writer: Writer, args: argparse.Namespace, first_id: int, rng: random.Random) -> Dict[int, Decimal]:
+    """Insert the transfers and return each touched user's net balance change."""
+    columns = ("sender_id", "receiver_id", "amount", "note", "status", "created_at")
+    ids = list(range(first_id, first_id + args.users))
+    rng.shuffle(ids)
+    hot = ids[: args.hot_accounts]
+    # Zipf over a random order of the users: rank r is paid with weight 1 / r^s
+    cum_weights = list(itertools.accumulate(1.0 / (rank ** args.zipf) for rank in range(1, len(ids) + 1)))
+
+    deltas: Dict[int, int] = {}
+    end = datetime.now(timezone.utc).replace(microsecond=0)
+    start = end - timedelta(days=args.days)
+    span = (end - start).total_seconds()
+    sqlite = writer.dialect == "sqlite"
+    started = time.perf_counter()
+
+    for offset in range(0, args.transfers, args.batch):
+        size = min(args.batch, args.transfers - offset)
+        receivers = rng.choices(ids, cum_weights=cum_weights, k=size)
+        rows = []
+        for i, receiver in enumerate(receivers):
+            if hot and rng.random() < args.hot_share:
+                receiver = rng.choice(hot)
+            sender = ids[rng.randrange(len(ids))]
+            if sender == receiver:
+                sender = first_id + (sender - first_id + 1) % args.users
+            cents = max(1, min(50000, int(rng.lognormvariate(3.0, 1.0) * 100)))
+            deltas[sender] = deltas.get(sender, 0) - cents
+            deltas[receiver] = deltas.get(receiver, 0) + cents
+            created = start + timedelta(seconds=int(span * (offset + i) / args.transfers))
+            rows.append((
+                sender, receiver, f"{cents // 100}.{cents % 100:02d}",
+                rng.choice(NOTES) if rng.random() < 0.1 else None, "SUCCESS",
+                created.strftime("%Y-%m-%d %H:%M:%S") if sqlite else created,
+            ))
+        writer.insert("audit_logs", columns, rows)
+        done = offset + size
+        log(f"transfers {done}/{args.transfers} ({done / (time.perf_counter() - started):.0f}/s)")
+    return {user_id: Decimal(cents) / 100 for user_id, cents in deltas.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(BACKEND_DIR, 'data.db')}"))
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--transfers", type=int, default=10_000_000)
+    parser.add_argument("--hot-accounts", type=int, default=100)
+    parser.add_argument("--hot-share", type=float, default=0.3)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--password", default="loadtest-password")
+    args = parser.parse_args()
+    if args.users < 2:
+        parser.error("--users must be at least 2")
+
+    # the app modules read DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = args.database_url
+    sys.path.insert(0, BACKEND_DIR)
+    import database
+    import sse.models  # noqa: F401  (create every table the app expects)
+    import transaction.models
+    import user.models
+    from sqlalchemy import func, select
+    from user.auth import hash_password
+    from user.controller import INITIAL_BALANCE
+
+    engine = database.engine
+    database.Base.metadata.create_all(engine)
+    if engine.dialect.name == "postgresql":
+        # monthly audit_logs partitions for the whole generated history
+        from transaction.partitions import ensure_partitions, install_partitions
+
+        install_partitions(engine)
+        with engine.begin() as conn:
+            now = datetime.now(timezone.utc)
+            ensure_partitions(conn, now - timedelta(days=args.days), now)
+    with engine.connect() as conn:
+        first_id = (conn.execute(select(func.max(user.models.User.id))).scalar() or 0) + 1
+
+    rng = random.Random(args.seed)
+    hashed_password, hashed_pin = hash_password(args.password), hash_password("1234")
+    log(f"loading {args.users} users (ids from {first_id}) and {args.transfers} transfers into {engine.url.render_as_string()}")
+
+    started = time.perf_counter()
+    writer = Writer(engine)
+    try:
+        with deferred_indexes(engine, [user.models.User.__table__, transaction.models.AuditLog.__table__]):
+            load_users(writer, first_id, args.users, args.batch, rng, hashed_password, hashed_pin, INITIAL_BALANCE)
+            deltas = load_transfers(writer, args, first_id, rng)
+            writer.update_balances({user_id: INITIAL_BALANCE + delta for user_id, delta in deltas.items()})
+            log(f"balances updated for {len(deltas)} users")
+        if writer.dialect == "postgresql":
+            with engine.begin() as conn:
+                conn.exec_driver_sql("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT max(id) FROM users))")
+    finally:
+        writer.close()
+    log(f"done in {time.perf_counter() - started:.1f}s")
+    if writer.dialect == "sqlite":
+        log("run `python -m transaction.partitions maintain` to seal past months into segment tables")
+
+
+if __name__ == "__main__":
+    main()
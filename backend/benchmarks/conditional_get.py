@@ -0,0 +1,80 @@
+"""
+Conditional GETs on the per-user read endpoints: full 200 responses vs. 304 revalidations.
+
+Seeds an account with --rows audit rows, then for GET /auth/me, a GET /transactions page and a
+200-row page measures --requests plain requests and --requests requests that send the
+previous ETag back in If-None-Match. After a transfer to the account, the old ETags must get
+a 200 with the new data again. Prints latency percentiles and bytes per response as JSON;
+exits 1 if an unchanged read isn't answered with 304 or a changed one still is.
+
+Usage (from backend/):
+    python benchmarks/conditional_get.py [--rows 200000] [--requests 300]
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+
+from _common import Client, percentiles, run_server, signup
+from suite import seed_history
+
+PATHS = ["/auth/me", "/transactions", "/transactions?limit=200"]
+
+
+def timed(client: Client, path: str, count: int, headers: dict, expect: int) -> tuple:
+    samples, size = [], 0
+    for _ in range(count):
+        start = time.perf_counter()
+        client.conn.request("GET", path, headers={"Authorization": f"Bearer {client.token}", **headers})
+        resp = client.conn.getresponse()
+        body = resp.read()
+        samples.append(time.perf_counter() - start)
+        if resp.status != expect:
+            raise SystemExit(f"GET {path} returned {resp.status}, expected {expect}")
+        size = len(body)
+    return percentiles(samples), size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{tmp}/conditional.db"
+        with run_server({"DATABASE_URL": db_url}) as (host, port):
+            token, owner = signup(host, port, "owner")
+            peer_token, _ = signup(host, port, "peer")
+            seed_history(db_url, owner["id"], [signup(host, port, f"peer{i}")[1]["id"] for i in range(5)], args.rows)
+            client = Client(host, port, token)
+
+            results, etags = {}, {}
+            for path in PATHS:
+                _, _, headers = client.request("GET", path)
+                etags[path] = headers.get("etag")
+                if not etags[path]:
+                    sys.exit(f"GET {path} sent no ETag")
+                full, full_bytes = timed(client, path, args.requests, {}, 200)
+                revalidated, revalidated_bytes = timed(client, path, args.requests, {"If-None-Match": etags[path]}, 304)
+                results[path] = {
+                    "200": {**full, "bytes": full_bytes},
+                    "304": {**revalidated, "bytes": revalidated_bytes},
+                }
+
+            status, data, _ = Client(host, port, peer_token).request(
+                "POST", "/transfer", {"receiver_email": "owner@example.com", "amount": "1.25", "pin": "1234"}
+            )
+            if status != 200:
+                sys.exit(f"transfer failed: {status} {data}")
+            for path in PATHS:
+                status, _, headers = client.request("GET", path, headers={"If-None-Match": etags[path]})
+                if status != 200 or headers.get("etag") == etags[path]:
+                    sys.exit(f"GET {path} still matched the old ETag after a transfer ({status})")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Query-plan check for the per-user history queries.
+
+Seeds a throwaway database with enough audit rows for the planner to care, spread over three
+months of which the first two are sealed into segment tables (or uses --database-url). Runs
+the real controller functions behind GET /transactions (every filter combination),
+/transactions/changes and /transactions/export, captures the SQL they send, and EXPLAINs each
+statement with the same parameters. Exits 1 if any plan reads audit_logs or a segment with a
+full table scan (SQLite `SCAN audit_logs[_YYYYMM]` without an index, Postgres `Seq Scan on
+audit_logs_*`) instead of the sender/receiver range scans. Prints the plans with --verbose.
+
+Usage (from backend/):
+    python benchmarks/explain_history.py [--database-url sqlite:///...] [--rows 50000] [--verbose]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FULL_SCAN = {
+    # "SCAN audit_logs" / "SCAN audit_logs USING ..." are table scans; COVERING INDEX / INDEX scans walk an index
+    "sqlite": re.compile(r"\bSCAN audit_logs(_\d{6})?\b(?! USING (COVERING )?INDEX)"),
+    "postgresql": re.compile(r"Seq Scan on audit_logs"),
+}
+
+
+BASE = datetime(2024, 1, 1)
+# seconds between seeded rows: 50k rows span January to March
+STEP = 150
+
+
+def seed(engine, rows: int) -> None:
+    from sqlalchemy import text
+    from transaction.partitions import seal_months
+
+    base = BASE
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO users (id, name, email, hashed_password, balance) VALUES (:id, :name, :email, 'x', 0)"),
+            [{"id": i, "name": f"user{i}", "email": f"user{i}@example.com"} for i in range(1, 201)],
+        )
+        conn.execute(
+            text(
+                "INSERT INTO audit_logs (sender_id, receiver_id, amount, status, created_at) "
+                "VALUES (:s, :r, 1, 'SUCCESS', :t)"
+            ),
+            [
+                {"s": i % 200 + 1, "r": (i * 7 + 3) % 200 + 1 if (i * 7 + 3) % 200 != i % 200 else (i + 1) % 200 + 1,
+                 "t": base + timedelta(seconds=i * STEP)}
+                for i in range(rows)
+            ],
+        )
+    seal_months(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tmp.name}/explain.db"
+    sys.path.insert(0, BACKEND_DIR)
+    import database
+    import sse.models  # noqa: F401
+    from sqlalchemy import event
+    from transaction import controller
+    from transaction.models import AuditLog  # noqa: F401
+
+    engine = database.engine
+    database.init_db()
+    if not args.database_url:
+        seed(engine, args.rows)
+
+    captured = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "audit_logs" in statement and not statement.lstrip().upper().startswith("EXPLAIN"):
+            captured.append((statement, parameters))
+
+    user_id, other_id = 1, 8
+    cursor = (BASE + timedelta(seconds=args.rows // 2 * STEP), args.rows // 2)
+    window = {"start": datetime(2024, 2, 2), "end": datetime(2024, 2, 5)}
+    cases = {
+        "history": dict(),
+        "history before": dict(before=cursor),
+        "history debited": dict(direction="debited"),
+        "history credited": dict(direction="credited"),
+        "history counterparty": dict(counterparty_id=other_id),
+        "history debited counterparty": dict(direction="debited", counterparty_id=other_id),
+        "history from/to": window,
+        "history from/to before": dict(before=cursor, **window),
+        "history across months": dict(start=datetime(2024, 1, 25), end=datetime(2024, 3, 5)),
+    }
+
+    db = database.SessionLocal()
+    plans = []
+    try:
+        for name, filters in cases.items():
+            captured.clear()
+            controller.list_transactions(db, user_id, limit=50, **filters)
+            plans.append((name, list(captured)))
+        captured.clear()
+        controller.list_transaction_changes(db, user_id, since=args.rows // 2)
+        plans.append(("changes", list(captured)))
+        captured.clear()
+        for _ in zip(range(10), controller.iter_statement(db, user_id, batch_size=10)):
+            pass
+        plans.append(("export", list(captured)))
+    finally:
+        db.close()
+
+    dialect = engine.dialect.name
+    pattern = FULL_SCAN.get(dialect)
+    if pattern is None:
+        sys.exit(f"no plan check for dialect {dialect}")
+    failures = 0
+    raw = engine.raw_connection()
+    try:
+        for name, statements in plans:
+            for statement, parameters in statements:
+                cur = raw.cursor()
+                if dialect == "sqlite":
+                    cur.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+                    plan = "\n".join(row[-1] for row in cur.fetchall())
+                else:
+                    cur.execute("EXPLAIN " + statement, parameters)
+                    plan = "\n".join(row[0] for row in cur.fetchall())
+                cur.close()
+                bad = bool(pattern.search(plan))
+                failures += bad
+                print(f"{'FULL SCAN' if bad else 'ok':9} {name}")
+                if args.verbose or bad:
+                    print("    " + plan.replace("\n", "\n    "))
+    finally:
+        raw.close()
+        engine.dispose()
+        tmp.cleanup()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
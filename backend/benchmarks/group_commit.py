@@ -0,0 +1,69 @@
+"""
+Transfer throughput with per-request commits vs. the group-commit writer.
+
+Runs the same transfer load (see hot_accounts.py) against two fresh servers: one with the
+default per-request transaction, one with TRANSFER_GROUP_COMMIT=1. Uses more accounts than
+hot_accounts.py by default so the comparison is about commit cost rather than row contention.
+Prints transfers/sec, latency and the writer's batch sizes for both, and checks each run
+conserved money.
+
+Usage (from backend/):
+    python benchmarks/group_commit.py [--accounts 32] [--threads 32] [--duration 10] [--max-batch 64] [--max-wait-ms 0]
+"""
+import argparse
+import json
+import sys
+
+from _common import Client, percentiles, run_server
+from hot_accounts import LOAD_ENV, balance, run_load, setup_accounts
+
+
+def measure(env: dict, accounts_count: int, threads: int, duration: float) -> dict:
+    with run_server({**LOAD_ENV, **env}) as (host, port):
+        accounts = setup_accounts(host, port, accounts_count)
+        before = sum(balance(host, port, acc["token"]) for acc in accounts)
+        out, elapsed = run_load(host, port, accounts, threads, duration)
+        after = sum(balance(host, port, acc["token"]) for acc in accounts)
+        _, stats, _ = Client(host, port).request("GET", "/stats")
+    ok = out["codes"].get(200, 0)
+    return {
+        "transfers_ok": ok,
+        "transfers_per_second": round(ok / elapsed, 1),
+        "status_codes": {str(k): v for k, v in sorted(out["codes"].items())},
+        "latency": percentiles(out["samples"]),
+        "transaction_retries": stats.get("transactions"),
+        "writer": stats.get("transfer_writer"),
+        "conserved": before == after,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    per_request = measure({"TRANSFER_GROUP_COMMIT": "0"}, args.accounts, args.threads, args.duration)
+    grouped = measure(
+        {
+            "TRANSFER_GROUP_COMMIT": "1",
+            "TRANSFER_GROUP_COMMIT_MAX_BATCH": str(args.max_batch),
+            "TRANSFER_GROUP_COMMIT_MAX_WAIT_MS": str(args.max_wait_ms),
+        },
+        args.accounts, args.threads, args.duration,
+    )
+    speedup = grouped["transfers_per_second"] / per_request["transfers_per_second"] if per_request["transfers_per_second"] else None
+    print(json.dumps({
+        "per_request_commit": per_request,
+        "group_commit": grouped,
+        "speedup": round(speedup, 2) if speedup else None,
+    }, indent=2))
+    if not (per_request["conserved"] and grouped["conserved"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
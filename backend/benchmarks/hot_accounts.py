@@ -0,0 +1,146 @@
+"""
+Concurrent transfers between a few hot accounts.
+
+Many client threads move small random amounts between a handful of accounts, so nearly
+every transfer contends for the same rows, in both directions. Reports throughput, latency,
+response codes and the server's transaction retry counters, then checks conservation:
+every account's final balance must equal its initial balance plus the credits minus the
+debits of the transfers that returned 200, and the total must be unchanged. Exits non-zero
+if money was created or lost.
+
+Transfers use payment sessions so the run measures the transfer path, not PIN hashing.
+
+Usage (from backend/):
+    python benchmarks/hot_accounts.py [--accounts 4] [--threads 32] [--duration 10] [--workers 1]
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from decimal import Decimal
+from typing import Optional
+
+from _common import Client, percentiles, run_server, signup
+
+
+def hammer(host: str, port: int, accounts: list, stop: threading.Event, out: dict, lock: threading.Lock, groups: Optional[list] = None) -> None:
+    clients = {acc["user"]["id"]: Client(host, port, acc["token"]) for acc in accounts}
+    samples, codes = [], {}
+    moved = {acc["user"]["id"]: Decimal("0") for acc in accounts}
+    rng = random.Random()
+    while not stop.is_set():
+        sender, receiver = rng.sample(rng.choice(groups) if groups else accounts, 2)
+        amount = Decimal(rng.randint(1, 500)) / 100
+        start = time.perf_counter()
+        status, _, _ = clients[sender["user"]["id"]].request(
+            "POST", "/transfer",
+            {"receiver_email": receiver["user"]["email"], "amount": float(amount), "payment_token": sender["payment_token"]},
+        )
+        samples.append(time.perf_counter() - start)
+        codes[status] = codes.get(status, 0) + 1
+        if status == 200:
+            moved[sender["user"]["id"]] -= amount
+            moved[receiver["user"]["id"]] += amount
+    with lock:
+        out["samples"].extend(samples)
+        for code, n in codes.items():
+            out["codes"][code] = out["codes"].get(code, 0) + n
+        for user_id, delta in moved.items():
+            out["moved"][user_id] += delta
+
+
+def balance(host: str, port: int, token: str) -> Decimal:
+    # /transactions/changes reads the balance from the database, not a per-worker cache
+    status, data, _ = Client(host, port, token).request("GET", "/transactions/changes?limit=1")
+    if status != 200:
+        raise RuntimeError(f"balance read failed: {status} {data}")
+    return Decimal(str(data["balance"]))
+
+
+# payment sessions big enough for a whole run
+LOAD_ENV = {
+    "PAYMENT_SESSION_TTL_SECONDS": "3600",
+    "PAYMENT_SESSION_MAX_AMOUNT": "1000000000",
+    "PAYMENT_SESSION_MAX_COUNT": "1000000000",
+}
+
+
+def setup_accounts(host: str, port: int, count: int) -> list:
+    """Sign up `count` users, each with a payment session for the load."""
+    accounts = []
+    for i in range(count):
+        token, user = signup(host, port, f"hot{i}")
+        status, session, _ = Client(host, port, token).request(
+            "POST", "/auth/payment-session",
+            {"pin": "1234", "max_amount": 1000000000, "max_count": 1000000000},
+        )
+        if status != 200:
+            raise RuntimeError(f"payment session failed: {status} {session}")
+        accounts.append({"token": token, "user": user, "payment_token": session["payment_token"]})
+    return accounts
+
+
+def run_load(host: str, port: int, accounts: list, threads: int, duration: float, groups: Optional[list] = None) -> tuple:
+    """Transfer between random pairs of `accounts` from `threads` clients; return (results, elapsed).
+
+    With `groups` (lists of at least two of `accounts`) both parties of a transfer come from
+    the same group.
+    """
+    stop = threading.Event()
+    out = {"samples": [], "codes": {}, "moved": {acc["user"]["id"]: Decimal("0") for acc in accounts}}
+    lock = threading.Lock()
+    workers = [threading.Thread(target=hammer, args=(host, port, accounts, stop, out, lock, groups)) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in workers:
+        t.join()
+    return out, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    with run_server(LOAD_ENV, workers=args.workers) as (host, port):
+        accounts = setup_accounts(host, port, args.accounts)
+        initial = {acc["user"]["id"]: balance(host, port, acc["token"]) for acc in accounts}
+        out, elapsed = run_load(host, port, accounts, args.threads, args.duration)
+        final = {acc["user"]["id"]: balance(host, port, acc["token"]) for acc in accounts}
+        _, stats, _ = Client(host, port).request("GET", "/stats")
+
+    mismatched = {
+        user_id: {"expected": str(initial[user_id] + out["moved"][user_id]), "actual": str(final[user_id])}
+        for user_id in initial
+        if initial[user_id] + out["moved"][user_id] != final[user_id]
+    }
+    conserved = sum(initial.values()) == sum(final.values()) and not mismatched
+    ok = out["codes"].get(200, 0)
+    print(json.dumps({
+        "accounts": args.accounts,
+        "threads": args.threads,
+        "workers": args.workers,
+        "transfers_ok": ok,
+        "transfers_per_second": round(ok / elapsed, 1),
+        "status_codes": {str(k): v for k, v in sorted(out["codes"].items())},
+        "latency": percentiles(out["samples"]),
+        "transaction_retries": stats.get("transactions") if isinstance(stats, dict) else None,
+        "total_before": str(sum(initial.values())),
+        "total_after": str(sum(final.values())),
+        "conserved": conserved,
+        "mismatched_accounts": mismatched,
+    }, indent=2))
+    if not conserved:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
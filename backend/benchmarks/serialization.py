@@ -0,0 +1,198 @@
+"""
+Serialization cost of the hot JSON responses: bytes and CPU time per response.
+
+For each payload the previous encoding path is compared with the current one, in process and
+without a database (rows are built in memory the way the controller returns them):
+
+- history: a GET /transactions page (--page rows). Before: float amounts, isoformat dates,
+           `jsonable_encoder` + `json.dumps` (FastAPI's JSONResponse). Now: decimal strings
+           and datetimes rendered by `FastJSONResponse`.
+- search:  a GET /auth/search result (--search users). Before: `response_model` validation of
+           the ORM rows, `jsonable_encoder`, `json.dumps`. Now: `FastJSONResponse`.
+- me:      GET /auth/me, the same two paths for a single user.
+- sse:     one transfer event published to --subscribers streams of one user. Before: the dict
+           was queued and `json.dumps`-ed per subscriber. Now: encoded once per publish.
+
+Reports bytes per response and CPU microseconds (process_time) per response for both paths,
+using the encoder serialization.py picked (orjson when installed, JSON_ENCODER=json forces the
+standard library). Exits 1 if the two paths disagree on a payload's content (amounts compared
+as decimals) or if the current path is slower than the previous one for any payload.
+
+Usage (from backend/):
+    python benchmarks/serialization.py [--page 50] [--search 10] [--subscribers 100] [--seconds 1]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Callable, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Row = namedtuple("Row", "id sender_id receiver_id amount note created_at sender_name receiver_name")
+
+
+class FakeUser:
+    """Stand-in for a `User` row: plain attributes, as the ORM exposes them."""
+
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+        self.name = f"Priya Müller {user_id}"
+        self.email = f"user{user_id}@example.com"
+        self.balance = Decimal("10000.00") - Decimal(user_id * 137) / 100
+
+
+def history_rows(count: int) -> List[Row]:
+    base = datetime(2024, 3, 1, 12, 0, 0, tzinfo=timezone.utc)
+    return [
+        Row(
+            id=100000 - i, sender_id=1 if i % 2 else 2, receiver_id=2 if i % 2 else 1,
+            amount=Decimal(1000 + i * 37) / 100, note="dinner" if i % 5 == 0 else None,
+            created_at=base - timedelta(seconds=i * 97, microseconds=i * 1013),
+            sender_name="Alice Smith", receiver_name="Bob Okafor",
+        )
+        for i in range(count)
+    ]
+
+
+def measure(fn: Callable[[], Any], seconds: float) -> float:
+    """CPU microseconds per call of `fn`, run for about `seconds` of CPU time."""
+    fn()
+    calls, started = 0, time.process_time()
+    while True:
+        for _ in range(50):
+            fn()
+        calls += 50
+        elapsed = time.process_time() - started
+        if elapsed >= seconds:
+            return elapsed / calls * 1e6
+
+
+def as_decimals(value: Any) -> Any:
+    """Content for comparison: numbers and decimal strings of amounts become Decimals."""
+    if isinstance(value, dict):
+        return {key: as_decimals(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [as_decimals(item) for item in value]
+    if isinstance(value, (float, int)) and not isinstance(value, bool):
+        return Decimal(str(value))
+    if isinstance(value, str):
+        try:
+            return Decimal(value)
+        except Exception:
+            return value
+    return value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page", type=int, default=50)
+    parser.add_argument("--search", type=int, default=10)
+    parser.add_argument("--subscribers", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from pydantic import BaseModel, ConfigDict, TypeAdapter
+    from serialization import ENCODER, FastJSONResponse
+    from sse.sse_manager import Event
+    from transaction.routes import _history_item
+    from user.routes import _search_out, _user_out
+
+    class OldUserOut(BaseModel):
+        model_config = ConfigDict(from_attributes=True)
+        id: int
+        name: str
+        email: str
+        balance: float
+
+    class OldSearchOut(BaseModel):
+        model_config = ConfigDict(from_attributes=True)
+        id: int
+        name: str
+        email: str
+
+    old_user = TypeAdapter(OldUserOut)
+    old_search = TypeAdapter(List[OldSearchOut])
+
+    def old_history_item(r: Row, user_id: int) -> dict:
+        return {
+            "id": r.id,
+            "type": "debited" if r.sender_id == user_id else "credited",
+            "sender_name": r.sender_name,
+            "receiver_name": r.receiver_name,
+            "amount": float(r.amount) if r.amount is not None else None,
+            "note": r.note,
+            "created_at": r.created_at.isoformat() if r.created_at is not None else None,
+        }
+
+    def old_response(content: Any) -> bytes:
+        return JSONResponse(jsonable_encoder(content)).body
+
+    def old_model_response(adapter: TypeAdapter, value: Any) -> bytes:
+        # FastAPI's serialize_response: validate against response_model, dump, then encode
+        return old_response(adapter.dump_python(adapter.validate_python(value), mode="json"))
+
+    rows = history_rows(args.page)
+    users = [FakeUser(i) for i in range(1, args.search + 1)]
+    me = users[0]
+    event = {
+        "event": "transfer", "sender_id": 2, "receiver_id": 1, "event_id": 4242,
+        "amount": Decimal("12.50"), "sender_balance": Decimal("9987.50"), "receiver_balance": Decimal("10012.50"),
+        "transaction": {
+            "id": 4242, "sender_name": "Bob Okafor", "receiver_name": "Alice Smith", "amount": Decimal("12.50"),
+            "note": None, "created_at": datetime(2024, 3, 1, 12, 0, tzinfo=timezone.utc).isoformat(), "type": "credited",
+        },
+    }
+    old_event = json.loads(json.dumps(event, default=float))
+
+    def old_sse() -> List[bytes]:
+        # every subscriber formatted its own frame from the shared dict
+        return [
+            f"id: {old_event['event_id']}\ndata: {json.dumps(old_event)}\n\n".encode("utf-8")
+            for _ in range(args.subscribers)
+        ]
+
+    def new_sse() -> List[bytes]:
+        frame = Event(event)
+        return [frame.frame for _ in range(args.subscribers)]
+
+    cases = [
+        ("history", lambda: old_response([old_history_item(r, 1) for r in rows]),
+         lambda: FastJSONResponse([_history_item(r, 1) for r in rows]).body),
+        ("search", lambda: old_model_response(old_search, users), lambda: _search_out(users).body),
+        ("me", lambda: old_model_response(old_user, me), lambda: _user_out(me).body),
+        ("sse", old_sse, new_sse),
+    ]
+
+    print(f"encoder: {ENCODER}")
+    print(f"{'payload':10} {'old bytes':>10} {'new bytes':>10} {'old µs':>10} {'new µs':>10} {'speedup':>8}")
+    failures = 0
+    for name, old, new in cases:
+        old_body, new_body = old(), new()
+        if name == "sse":
+            old_sizes = sum(len(frame) for frame in old_body)
+            new_sizes = sum(len(frame) for frame in new_body)
+            old_body = old_body[0].split(b"data: ", 1)[1]
+            new_body = new_body[0].split(b"data: ", 1)[1]
+        else:
+            old_sizes, new_sizes = len(old_body), len(new_body)
+        if as_decimals(json.loads(old_body)) != as_decimals(json.loads(new_body)):
+            print(f"{name}: the two paths encode different content")
+            failures += 1
+        old_us, new_us = measure(old, args.seconds), measure(new, args.seconds)
+        failures += new_us > old_us
+        print(f"{name:10} {old_sizes:>10} {new_sizes:>10} {old_us:>10.1f} {new_us:>10.1f} {old_us / new_us:>7.1f}x")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
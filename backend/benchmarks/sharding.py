@@ -0,0 +1,89 @@
+"""
+Transfer throughput with the accounts spread over 1, 2, 4, ... shards (DB_SHARDS).
+
+For each shard count, starts a fresh server whose shards are separate SQLite files, signs up
+--accounts users (they land on shards by email) and runs the transfer load of
+hot_accounts.py. With --pairs local (default) both parties of a transfer are on the same
+shard, so every shard commits on its own database; --pairs random also sends cross-shard
+transfers (prepared on the sender's shard, applied on the receiver's). Reports transfers/sec
+and the scaling relative to the first shard count. After the load it waits until no
+cross-shard transfer is left prepared, then checks every account's balance; exits 1 if money
+was created or lost.
+
+Usage (from backend/):
+    python benchmarks/sharding.py [--shards 1,2,4] [--pairs local|random] [--accounts 32] [--threads 32]
+                                  [--duration 10] [--workers 4]
+"""
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+
+from _common import Client, percentiles, run_server
+from hot_accounts import LOAD_ENV, balance, run_load, setup_accounts
+
+
+def wait_settled(host: str, port: int, timeout: float = 60.0) -> dict:
+    """Poll /stats until no cross-shard transfer is prepared but not yet applied."""
+    deadline = time.monotonic() + timeout
+    while True:
+        _, stats, _ = Client(host, port).request("GET", "/stats")
+        if not stats["cross_shard"].get("prepared") or time.monotonic() > deadline:
+            return stats
+        time.sleep(0.5)
+
+
+def measure(shards: int, args: argparse.Namespace) -> dict:
+    env = {**LOAD_ENV, "DB_SHARDS": str(shards), "CROSS_SHARD_RECOVERY_SECONDS": "2"}
+    with run_server(env, workers=args.workers) as (host, port):
+        accounts = setup_accounts(host, port, args.accounts)
+        by_shard = defaultdict(list)
+        for acc in accounts:
+            by_shard[acc["user"]["id"] % shards].append(acc)
+        groups = [group for group in by_shard.values() if len(group) >= 2] if args.pairs == "local" else None
+        initial = {acc["user"]["id"]: balance(host, port, acc["token"]) for acc in accounts}
+        out, elapsed = run_load(host, port, accounts, args.threads, args.duration, groups)
+        stats = wait_settled(host, port)
+        final = {acc["user"]["id"]: balance(host, port, acc["token"]) for acc in accounts}
+    mismatched = {
+        user_id: {"expected": str(initial[user_id] + out["moved"][user_id]), "actual": str(final[user_id])}
+        for user_id in initial
+        if initial[user_id] + out["moved"][user_id] != final[user_id]
+    }
+    ok = out["codes"].get(200, 0)
+    return {
+        "shards": shards,
+        "accounts_per_shard": [len(by_shard[shard]) for shard in range(shards)],
+        "transfers_ok": ok,
+        "transfers_per_second": round(ok / elapsed, 1),
+        "status_codes": {str(k): v for k, v in sorted(out["codes"].items())},
+        "latency": percentiles(out["samples"]),
+        "transaction_retries": stats.get("transactions"),
+        "cross_shard": stats.get("cross_shard"),
+        "conserved": sum(initial.values()) == sum(final.values()) and not mismatched,
+        "mismatched_accounts": mismatched,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", default="1,2,4")
+    parser.add_argument("--pairs", choices=["local", "random"], default="local")
+    parser.add_argument("--accounts", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    runs = [measure(int(n), args) for n in args.shards.split(",")]
+    base = runs[0]["transfers_per_second"]
+    for run in runs:
+        run["scaling"] = round(run["transfers_per_second"] / base, 2) if base else None
+    print(json.dumps({"pairs": args.pairs, "workers": args.workers, "threads": args.threads, "runs": runs}, indent=2))
+    if not all(run["conserved"] for run in runs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Cross-process SSE delivery through the Unix-socket broker.
+
+Starts an SSE hub and two independent uvicorn workers that share one database. Receivers
+open their /sse/stream on worker A; the transfers are made on worker B. Every receiver must
+get its event, which only happens if the broker carries it between the processes. Prints
+delivery count and publish-to-receive latency, and exits non-zero if anything was lost.
+
+Usage (from backend/):
+    python benchmarks/sse_multiworker.py [--receivers 20] [--timeout 10]
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from _common import BACKEND_DIR, Client, percentiles, run_server, signup
+
+
+def read_stream(host: str, port: int, token: str, events: list, lock: threading.Lock) -> None:
+    # daemon thread: left blocked in readline when the run ends
+    conn = http.client.HTTPConnection(host, port, timeout=300)
+    conn.request("GET", f"/sse/stream?token={token}")
+    resp = conn.getresponse()
+    try:
+        while True:
+            line = resp.readline()
+            if not line:
+                break
+            if line.startswith(b"data: "):
+                with lock:
+                    events.append((time.perf_counter(), json.loads(line[6:])))
+    except OSError:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--receivers", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sock = os.path.join(tmp, "sse-hub.sock")
+        hub = subprocess.Popen([sys.executable, "-m", "sse.hub", "--socket", sock], cwd=BACKEND_DIR)
+        try:
+            deadline = time.monotonic() + 10
+            while not os.path.exists(sock):
+                if time.monotonic() > deadline:
+                    raise RuntimeError("SSE hub did not start")
+                time.sleep(0.1)
+
+            env = {"DATABASE_URL": f"sqlite:///{tmp}/shared.db", "SSE_BROKER": "unix", "SSE_BROKER_SOCKET": sock}
+            with run_server(env) as (host_a, port_a), run_server(env) as (host_b, port_b):
+                sender_token, _ = signup(host_a, port_a, "sender")
+                receivers = [signup(host_a, port_a, f"receiver{i}") for i in range(args.receivers)]
+
+                events: list = []
+                lock = threading.Lock()
+                readers = [
+                    threading.Thread(target=read_stream, args=(host_a, port_a, token, events, lock), daemon=True)
+                    for token, _ in receivers
+                ]
+                for t in readers:
+                    t.start()
+                # let the subscriptions reach the hub
+                time.sleep(1.0)
+
+                sent_at = {}
+                sender = Client(host_b, port_b, sender_token)
+                for _, user in receivers:
+                    sent_at[user["id"]] = time.perf_counter()
+                    status, data, _ = sender.request(
+                        "POST", "/transfer", {"receiver_email": user["email"], "amount": 1, "pin": "1234"}
+                    )
+                    if status != 200:
+                        raise RuntimeError(f"transfer failed: {status} {data}")
+
+                deadline = time.monotonic() + args.timeout
+                while time.monotonic() < deadline:
+                    with lock:
+                        if len(events) >= len(receivers):
+                            break
+                    time.sleep(0.05)
+
+        finally:
+            hub.terminate()
+            hub.wait(timeout=10)
+
+    latencies = [ts - sent_at[ev["receiver_id"]] for ts, ev in events if ev.get("receiver_id") in sent_at]
+    delivered = len({ev["receiver_id"] for _, ev in events})
+    print(json.dumps({
+        "expected": len(receivers),
+        "delivered": delivered,
+        "publish_to_receive": percentiles(latencies),
+    }, indent=2))
+    if delivered != len(receivers):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Memory and time of a full statement export as the history grows.
+
+Fills throwaway SQLite databases with one user's history (bulk inserted straight into
+audit_logs), then consumes `stream_statement` for CSV and NDJSON the way StreamingResponse
+does, recording Python peak memory (tracemalloc) and rows/sec. For comparison it also builds
+the whole statement as one list of dicts and one JSON document, as /transactions-style code
+would. Streaming peak memory should stay flat as the row count grows. Times include
+tracemalloc overhead, so compare them with each other only.
+
+Usage (from backend/):
+    python benchmarks/statement_export.py [--sizes 10000,100000,1000000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def fill(engine, users_table, audit_table, count: int) -> None:
+    base = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(users_table.insert(), [
+            {"id": 1, "name": "Statement Owner", "email": "owner@example.com", "hashed_password": "x", "balance": 0},
+            {"id": 2, "name": "Counterparty", "email": "other@example.com", "hashed_password": "x", "balance": 0},
+        ])
+        batch = []
+        for i in range(count):
+            sender, receiver = (1, 2) if i % 2 else (2, 1)
+            batch.append({
+                "sender_id": sender, "receiver_id": receiver, "amount": f"{i % 9999 + 1}.25",
+                "note": "rent" if i % 10 == 0 else None, "status": "SUCCESS",
+                "created_at": base + timedelta(seconds=i),
+            })
+            if len(batch) == 10000:
+                conn.execute(audit_table.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(audit_table.insert(), batch)
+
+
+def traced(fn) -> dict:
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(elapsed, 2), "peak_mb": round(peak / 2**20, 2), "bytes_out": size}
+
+
+def measure(size: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/export.db"
+        # fresh imports per size so SessionLocal points at this database
+        for name in [m for m in sys.modules if m.split(".")[0] in ("database", "user", "transaction", "sse")]:
+            del sys.modules[name]
+        import database
+        from user.models import User
+        from transaction.models import AuditLog
+        from transaction import export
+        from transaction.controller import _history_query
+
+        database.Base.metadata.create_all(database.engine, tables=[User.__table__, AuditLog.__table__])
+        fill(database.engine, User.__table__, AuditLog.__table__, size)
+
+        def streamed(fmt):
+            return lambda: sum(len(chunk) for chunk in export.stream_statement(1, fmt))
+
+        def buffered():
+            db = database.SessionLocal()
+            try:
+                rows = _history_query(db).filter((AuditLog.sender_id == 1) | (AuditLog.receiver_id == 1)).all()
+                items = [dict(zip(export.CSV_COLUMNS, export._fields(r, 1))) for r in rows]
+                return len(json.dumps(items))
+            finally:
+                db.close()
+
+        result = {
+            "rows": size,
+            "stream_csv": traced(streamed("csv")),
+            "stream_ndjson": traced(streamed("ndjson")),
+            "buffered_json": traced(buffered),
+        }
+        database.engine.dispose()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    args = parser.parse_args()
+    print(json.dumps([measure(int(size)) for size in args.sizes.split(",")], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Cost of serving the frontend build: plain StaticFiles vs. PrecompressedStaticFiles.
+
+Calls both ASGI apps directly (in process, no server) for index.html and every hashed asset of
+frontend/dist (or --directory), as a browser would: first with `Accept-Encoding: gzip, br`,
+then revalidating with the ETag it got. Reports CPU microseconds (process_time) and bytes sent
+per request, and the Cache-Control each one sends. Exits 1 if the precompressed server is
+slower or sends more bytes for any file.
+
+Usage (from backend/):
+    python benchmarks/static_files.py [--directory ../frontend/dist] [--seconds 1]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+async def fetch(app: Any, path: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], int]:
+    scope = {
+        "type": "http", "method": "GET", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "scheme": "http", "server": ("127.0.0.1", 80), "http_version": "1.1",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+    }
+    status, response_headers, size = 0, {}, 0
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        nonlocal status, response_headers, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            response_headers = {k.decode(): v.decode() for k, v in message["headers"]}
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, response_headers, size
+
+
+def measure(loop: asyncio.AbstractEventLoop, app: Any, path: str, headers: Dict[str, str], seconds: float) -> float:
+    """CPU microseconds per request, over about `seconds` of CPU time."""
+    calls, started = 0, time.process_time()
+    while True:
+        for _ in range(20):
+            loop.run_until_complete(fetch(app, path, headers))
+        calls += 20
+        elapsed = time.process_time() - started
+        if elapsed >= seconds:
+            return elapsed / calls * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--directory", type=Path, default=BACKEND_DIR.parent / "frontend" / "dist")
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    from starlette.staticfiles import StaticFiles
+    from static_files import PrecompressedStaticFiles
+
+    apps = {
+        "StaticFiles": StaticFiles(directory=args.directory, html=True),
+        "Precompressed": PrecompressedStaticFiles(directory=args.directory, html=True),
+    }
+    paths = ["/index.html"] + sorted(
+        "/" + p.relative_to(args.directory).as_posix()
+        for p in (args.directory / "assets").glob("*")
+        if p.suffix not in (".gz", ".br")
+    )
+    loop = asyncio.new_event_loop()
+    results: List[Dict[str, Any]] = []
+    failures = 0
+    for path in paths:
+        row: Dict[str, Any] = {"path": path}
+        for name, app in apps.items():
+            accept = {"Accept-Encoding": "gzip, br"}
+            status, headers, size = loop.run_until_complete(fetch(app, path, accept))
+            if status != 200:
+                sys.exit(f"{name} GET {path} returned {status}")
+            revalidate = {**accept, "If-None-Match": headers.get("etag", "")}
+            not_modified, _, _ = loop.run_until_complete(fetch(app, path, revalidate))
+            row[name] = {
+                "bytes": size,
+                "encoding": headers.get("content-encoding", "identity"),
+                "cache_control": headers.get("cache-control"),
+                "cpu_us": round(measure(loop, app, path, accept, args.seconds), 1),
+                "revalidate_status": not_modified,
+                "revalidate_cpu_us": round(measure(loop, app, path, revalidate, args.seconds), 1),
+            }
+        old, new = row["StaticFiles"], row["Precompressed"]
+        failures += new["bytes"] > old["bytes"] or new["cpu_us"] > old["cpu_us"] or new["revalidate_status"] != 304
+        results.append(row)
+    loop.close()
+    print(json.dumps(results, indent=2))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,572 @@
+"""
+Benchmark suite: every endpoint family under a realistic mix, with a regression check.
+
+Scenarios (run in this order against one fresh server):
+- auth_storm:    signup + login storms (POST /auth/signup, POST /auth/login)
+- transfers:     transfer-heavy traffic between many accounts via payment sessions (POST /transfer)
+- history:       GET /transactions paging, /transactions/changes and /auth/me for an account
+                 with a large audit_logs table (seeded straight into the database)
+- sse:           thousands of concurrent /sse/stream subscribers, one transfer event each;
+                 latency is transfer-request-to-event-received
+
+Targets:
+- uvicorn:   a real `uvicorn main:app` worker in a subprocess, driven over HTTP (default)
+- inprocess: the ASGI app from main.py called directly on an event loop in this process, so
+             the numbers exclude the network and HTTP parsing
+
+Each scenario reports throughput (successful operations per second), p50/p95/p99 latency and
+the error count. Results can be written to JSON (--out) and compared with a stored baseline
+(--baseline, default benchmarks/baseline.json): a scenario regresses if its throughput drops,
+or its p95 grows, by more than --tolerance; any regression makes the run exit 1.
+--save-baseline records this run as the baseline for its target. Baselines are per machine:
+record one before comparing.
+
+Usage (from backend/):
+    python benchmarks/suite.py [--target uvicorn|inprocess] [--scenarios auth_storm,transfers,history,sse]
+                               [--duration 10] [--threads 16] [--history-rows 200000] [--sse-streams 2000]
+                               [--out results.json] [--baseline benchmarks/baseline.json] [--save-baseline]
+                               [--tolerance 0.25]
+"""
+import argparse
+import asyncio
+import contextlib
+import http.client
+import itertools
+import json
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from _common import BACKEND_DIR, Client, percentiles, run_server
+
+SCENARIOS = ["auth_storm", "transfers", "history", "sse"]
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+# server configuration shared by both targets: payment sessions that last the whole run,
+# enough SSE streams per user for the fan-out scenario and no throttling of the auth storm
+# (every client has the same address)
+SERVER_ENV = {
+    "PAYMENT_SESSION_TTL_SECONDS": "3600",
+    "PAYMENT_SESSION_MAX_AMOUNT": "1000000000",
+    "PAYMENT_SESSION_MAX_COUNT": "1000000000",
+    "SSE_MAX_STREAMS_PER_USER": "100000",
+    "RATE_LIMIT_ENABLED": "0",
+}
+
+_names = itertools.count()
+
+
+# --- drivers -----------------------------------------------------------------------------
+
+class _HTTPStream:
+    """An open SSE stream; iterating yields the JSON payload of each event."""
+
+    def __init__(self, host: str, port: int, path: str) -> None:
+        self.conn = http.client.HTTPConnection(host, port, timeout=300)
+        self.conn.request("GET", path)
+        self.resp = self.conn.getresponse()
+
+    def __iter__(self) -> Iterator[dict]:
+        while True:
+            line = self.resp.readline()
+            if not line:
+                return
+            if line.startswith(b"data: "):
+                yield json.loads(line[6:])
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class HTTPDriver:
+    """Talks to a uvicorn worker; one keep-alive connection per client."""
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host, self.port = host, port
+
+    def client(self, token: Optional[str] = None) -> Client:
+        return Client(self.host, self.port, token)
+
+    def open_stream(self, path: str) -> "_HTTPStream":
+        return _HTTPStream(self.host, self.port, path)
+
+    def close(self) -> None:
+        pass
+
+
+class _InProcessClient:
+    def __init__(self, driver: "InProcessDriver", token: Optional[str]) -> None:
+        self.driver = driver
+        self.token = token
+
+    def request(self, method: str, path: str, body: Any = None, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Any, Dict[str, str]]:
+        hdrs = {"content-type": "application/json"}
+        if self.token:
+            hdrs["authorization"] = f"Bearer {self.token}"
+        hdrs.update({k.lower(): v for k, v in (headers or {}).items()})
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        status, resp_headers, raw = self.driver.call(method, path, payload, hdrs)
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = raw
+        return status, data, resp_headers
+
+
+class _InProcessStream:
+    """An SSE stream served by the in-process app; body chunks arrive through a queue."""
+
+    def __init__(self, driver: "InProcessDriver", path: str) -> None:
+        self.driver = driver
+        self.chunks: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self.disconnected: Optional[asyncio.Event] = None
+        driver._submit(self._run(path))
+
+    async def _run(self, path: str) -> None:
+        self.disconnected = asyncio.Event()
+        try:
+            await self.driver._call("GET", path, b"", {}, self.chunks.put, self.disconnected)
+        finally:
+            self.chunks.put(None)
+
+    def __iter__(self) -> Iterator[dict]:
+        buffer = b""
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                return
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                if line.startswith(b"data: "):
+                    yield json.loads(line[6:])
+
+    def close(self) -> None:
+        if self.disconnected is not None:
+            self.driver.loop.call_soon_threadsafe(self.disconnected.set)
+
+
+class InProcessDriver:
+    """Calls the ASGI app directly on an event loop running in a background thread."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        self._lifespan = app.router.lifespan_context(app)
+        self._submit(self._lifespan.__aenter__()).result()
+
+    def _submit(self, coro: Any) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def _scope(self, method: str, path: str, headers: Dict[str, str]) -> dict:
+        parts = urlsplit(path)
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": method, "scheme": "http", "path": parts.path, "raw_path": parts.path.encode(),
+            "query_string": parts.query.encode(), "root_path": "",
+            "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()],
+            "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+        }
+
+    async def _call(self, method: str, path: str, payload: bytes, headers: Dict[str, str], on_body: Callable[[bytes], None], disconnected: asyncio.Event) -> Tuple[int, Dict[str, str]]:
+        sent = False
+        status, resp_headers = 500, {}
+
+        async def receive() -> dict:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": payload, "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict) -> None:
+            nonlocal status, resp_headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                resp_headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in message.get("headers", [])}
+            elif message["type"] == "http.response.body":
+                on_body(message.get("body", b""))
+
+        await self.app(self._scope(method, path, headers), receive, send)
+        return status, resp_headers
+
+    def call(self, method: str, path: str, payload: bytes, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        chunks: List[bytes] = []
+
+        async def run() -> Tuple[int, Dict[str, str]]:
+            return await self._call(method, path, payload, headers, chunks.append, asyncio.Event())
+
+        status, resp_headers = self._submit(run()).result()
+        return status, resp_headers, b"".join(chunks)
+
+    def client(self, token: Optional[str] = None) -> _InProcessClient:
+        return _InProcessClient(self, token)
+
+    def open_stream(self, path: str) -> "_InProcessStream":
+        return _InProcessStream(self, path)
+
+    def close(self) -> None:
+        self._submit(self._lifespan.__aexit__(None, None, None)).result(timeout=30)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+@contextlib.contextmanager
+def start_target(target: str, db_url: str) -> Iterator[Any]:
+    env = {**SERVER_ENV, "DATABASE_URL": db_url}
+    if target == "uvicorn":
+        with run_server(env) as (host, port):
+            yield HTTPDriver(host, port)
+        return
+    os.environ.update(env)
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.chdir(BACKEND_DIR)
+    import main
+
+    driver = InProcessDriver(main.app)
+    try:
+        yield driver
+    finally:
+        driver.close()
+
+
+# --- helpers -------------------------------------------------------------------------------
+
+def signup(driver: Any, prefix: str) -> Tuple[str, dict]:
+    name = f"{prefix}{next(_names)}"
+    status, data, _ = driver.client().request(
+        "POST", "/auth/signup", {"name": name, "email": f"{name}@example.com", "password": "bench-password", "pin": "1234"}
+    )
+    if status != 200:
+        raise RuntimeError(f"signup failed: {status} {data}")
+    return data["access_token"], data["user"]
+
+
+def payment_session(driver: Any, token: str) -> str:
+    status, data, _ = driver.client(token).request(
+        "POST", "/auth/payment-session", {"pin": "1234", "max_amount": 1000000000, "max_count": 1000000000}
+    )
+    if status != 200:
+        raise RuntimeError(f"payment session failed: {status} {data}")
+    return data["payment_token"]
+
+
+def run_threads(threads: int, duration: float, make_op: Callable[[], Callable[[], int]]) -> dict:
+    """Call each thread's op in a loop for `duration` seconds; summarize statuses and latency."""
+    samples: List[float] = []
+    codes: Dict[int, int] = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def worker() -> None:
+        op = make_op()
+        local, local_codes = [], {}
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                status = op()
+            except Exception:
+                status = 0
+            local.append(time.perf_counter() - start)
+            local_codes[status] = local_codes.get(status, 0) + 1
+        with lock:
+            samples.extend(local)
+            for code, n in local_codes.items():
+                codes[code] = codes.get(code, 0) + n
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in workers:
+        t.join()
+    return summarize(samples, codes, time.perf_counter() - started)
+
+
+def summarize(samples: List[float], codes: Dict[int, int], elapsed: float) -> dict:
+    ok = codes.get(200, 0)
+    stats = percentiles(samples)
+    return {
+        "throughput": round(ok / elapsed, 1) if elapsed else 0.0,
+        "ok": ok,
+        "errors": sum(n for code, n in codes.items() if code != 200),
+        "p50_ms": stats.get("p50_ms"),
+        "p95_ms": stats.get("p95_ms"),
+        "p99_ms": stats.get("p99_ms"),
+        "status_codes": {str(k): v for k, v in sorted(codes.items())},
+    }
+
+
+# --- scenarios -----------------------------------------------------------------------------
+
+def scenario_auth_storm(driver: Any, args: argparse.Namespace, db_url: str) -> dict:
+    def make_op() -> Callable[[], int]:
+        client = driver.client()
+        pending: List[str] = []
+
+        def op() -> int:
+            # alternate: sign up a new user, then log in as them
+            if pending:
+                email = pending.pop()
+                status, _, _ = client.request("POST", "/auth/login", {"email": email, "password": "bench-password"})
+                return status
+            name = f"storm{next(_names)}"
+            status, _, _ = client.request(
+                "POST", "/auth/signup", {"name": name, "email": f"{name}@example.com", "password": "bench-password"}
+            )
+            if status == 200:
+                pending.append(f"{name}@example.com")
+            return status
+
+        return op
+
+    return run_threads(args.threads, args.duration, make_op)
+
+
+def scenario_transfers(driver: Any, args: argparse.Namespace, db_url: str) -> dict:
+    accounts = []
+    for _ in range(max(2, args.threads)):
+        token, user = signup(driver, "payer")
+        accounts.append((token, user, payment_session(driver, token)))
+
+    def make_op() -> Callable[[], int]:
+        rng = random.Random()
+        clients = {user["id"]: driver.client(token) for token, user, _ in accounts}
+
+        def op() -> int:
+            (_, sender, grant), (_, receiver, _) = rng.sample(accounts, 2)
+            status, _, _ = clients[sender["id"]].request(
+                "POST", "/transfer",
+                {"receiver_email": receiver["email"], "amount": rng.randint(1, 500) / 100, "payment_token": grant},
+            )
+            return status
+
+        return op
+
+    return run_threads(args.threads, args.duration, make_op)
+
+
+def seed_history(db_url: str, owner_id: int, counterparty_ids: List[int], rows: int) -> None:
+    """Bulk insert `rows` audit rows between the owner and its counterparties."""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(db_url)
+    base = datetime(2024, 1, 1)
+    stmt = text(
+        "INSERT INTO audit_logs (sender_id, receiver_id, amount, note, status, created_at) "
+        "VALUES (:sender_id, :receiver_id, :amount, :note, 'SUCCESS', :created_at)"
+    )
+    rng = random.Random(rows)
+    try:
+        for offset in range(0, rows, 10000):
+            batch = []
+            for i in range(offset, min(rows, offset + 10000)):
+                other = rng.choice(counterparty_ids)
+                sender, receiver = (owner_id, other) if i % 2 else (other, owner_id)
+                batch.append({
+                    "sender_id": sender, "receiver_id": receiver, "amount": f"{rng.randint(1, 99999) / 100:.2f}",
+                    "note": None, "created_at": (base + timedelta(seconds=i * 7)).strftime("%Y-%m-%d %H:%M:%S"),
+                })
+            with engine.begin() as conn:
+                conn.execute(stmt, batch)
+    finally:
+        engine.dispose()
+
+
+def scenario_history(driver: Any, args: argparse.Namespace, db_url: str) -> dict:
+    token, owner = signup(driver, "historic")
+    others = [signup(driver, "peer")[1]["id"] for _ in range(20)]
+    seed_history(db_url, owner["id"], others, args.history_rows)
+
+    def make_op() -> Callable[[], int]:
+        rng = random.Random()
+        client = driver.client(token)
+        cursor: List[Optional[str]] = [None]
+
+        def op() -> int:
+            pick = rng.random()
+            if pick < 0.6:
+                # page back through the history, restarting from the top every 20 pages or so
+                path = "/transactions?limit=50"
+                if cursor[0] and rng.random() > 0.05:
+                    path += f"&before={cursor[0]}"
+                status, _, headers = client.request("GET", path)
+                cursor[0] = headers.get("x-next-cursor")
+                return status
+            if pick < 0.8:
+                since = rng.randint(max(0, args.history_rows - 2000), args.history_rows)
+                status, _, _ = client.request("GET", f"/transactions/changes?since={since}")
+                return status
+            if pick < 0.9:
+                status, _, _ = client.request("GET", f"/transactions?limit=20&counterparty_id={rng.choice(others)}")
+                return status
+            status, _, _ = client.request("GET", "/auth/me")
+            return status
+
+        return op
+
+    return {**run_threads(args.threads, args.duration, make_op), "history_rows": args.history_rows}
+
+
+def scenario_sse(driver: Any, args: argparse.Namespace, db_url: str) -> dict:
+    receivers = [signup(driver, "listener") for _ in range(max(1, args.sse_streams // 100))]
+    sender_token, _ = signup(driver, "broadcaster")
+    grant = payment_session(driver, sender_token)
+
+    received: Dict[int, List[float]] = {user["id"]: [] for _, user in receivers}
+    lock = threading.Lock()
+    connected = threading.Semaphore(0)
+
+    def listen(token: str, user_id: int) -> None:
+        stream = driver.open_stream(f"/sse/stream?token={token}")
+        connected.release()
+        try:
+            for event in stream:
+                if event.get("event") == "transfer" and event.get("receiver_id") == user_id:
+                    with lock:
+                        received[user_id].append(time.perf_counter())
+                    break
+        except Exception:
+            pass
+        finally:
+            stream.close()
+
+    connect_start = time.perf_counter()
+    threads = []
+    for i in range(args.sse_streams):
+        token, user = receivers[i % len(receivers)]
+        t = threading.Thread(target=listen, args=(token, user["id"]), daemon=True)
+        t.start()
+        threads.append(t)
+    for _ in threads:
+        connected.acquire()
+    # a generator only connects on first iteration: give the subscriptions time to register
+    time.sleep(max(1.0, args.sse_streams / 1000))
+    connect_seconds = time.perf_counter() - connect_start
+
+    sender = driver.client(sender_token)
+    sent_at: Dict[int, float] = {}
+    codes: Dict[int, int] = {}
+    started = time.perf_counter()
+    for _, user in receivers:
+        sent_at[user["id"]] = time.perf_counter()
+        status, _, _ = sender.request("POST", "/transfer", {"receiver_email": user["email"], "amount": 0.01, "payment_token": grant})
+        codes[status] = codes.get(status, 0) + 1
+
+    deadline = time.monotonic() + args.duration
+    for t in threads:
+        t.join(timeout=max(0.0, deadline - time.monotonic()))
+    elapsed = time.perf_counter() - started
+
+    with lock:
+        latencies = [ts - sent_at[uid] for uid, stamps in received.items() for ts in stamps]
+    delivered = len(latencies)
+    stats = percentiles(latencies)
+    return {
+        "throughput": round(delivered / elapsed, 1) if elapsed else 0.0,
+        "ok": delivered,
+        "errors": args.sse_streams - delivered + sum(n for code, n in codes.items() if code != 200),
+        "p50_ms": stats.get("p50_ms"),
+        "p95_ms": stats.get("p95_ms"),
+        "p99_ms": stats.get("p99_ms"),
+        "streams": args.sse_streams,
+        "connect_seconds": round(connect_seconds, 2),
+    }
+
+
+SCENARIO_FUNCS = {
+    "auth_storm": scenario_auth_storm,
+    "transfers": scenario_transfers,
+    "history": scenario_history,
+    "sse": scenario_sse,
+}
+
+
+# --- baseline ------------------------------------------------------------------------------
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Human-readable regressions of `current` against `baseline` (empty if none)."""
+    problems = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base.get("throughput") and result["throughput"] < base["throughput"] * (1 - tolerance):
+            problems.append(f"{name}: throughput {result['throughput']}/s < baseline {base['throughput']}/s")
+        if base.get("p95_ms") and result.get("p95_ms") and result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{name}: p95 {result['p95_ms']} ms > baseline {base['p95_ms']} ms")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=["uvicorn", "inprocess"], default="uvicorn")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--history-rows", type=int, default=200000)
+    parser.add_argument("--sse-streams", type=int, default=2000)
+    parser.add_argument("--out")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{tmp}/suite.db"
+        with start_target(args.target, db_url) as driver:
+            for name in names:
+                print(f"running {name} ({args.target})...", file=sys.stderr)
+                results[name] = SCENARIO_FUNCS[name](driver, args, db_url)
+
+    report = {
+        "target": args.target,
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "settings": {"duration": args.duration, "threads": args.threads, "history_rows": args.history_rows, "sse_streams": args.sse_streams},
+        "scenarios": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2) + "\n")
+
+    baseline_path = Path(args.baseline)
+    stored = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    if args.save_baseline:
+        stored[args.target] = report
+        baseline_path.write_text(json.dumps(stored, indent=2) + "\n")
+        print(f"baseline for {args.target} saved to {baseline_path}", file=sys.stderr)
+        return
+
+    if args.target not in stored:
+        print(f"no {args.target} baseline in {baseline_path}; run with --save-baseline to record one", file=sys.stderr)
+        return
+    if stored[args.target].get("settings") != report["settings"]:
+        print(f"note: settings differ from the baseline's {stored[args.target].get('settings')}", file=sys.stderr)
+    problems = compare(results, stored[args.target]["scenarios"], args.tolerance)
+    for line in problems:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    if problems:
+        sys.exit(1)
+    print(f"no regressions beyond {args.tolerance:.0%} of the {args.target} baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
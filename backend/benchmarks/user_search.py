@@ -0,0 +1,106 @@
+"""
+Recipient search latency as the users table grows.
+
+Fills throwaway SQLite databases with synthetic users (bulk inserted straight into the
+table, so the sizes are reachable in seconds), installs the search index the way startup
+does, then times `search_users` against the previous `name ILIKE '%q%' OR email ILIKE '%q%'`
+query for autocomplete-style queries: keystroke prefixes, a mid-word substring and a miss.
+Prints p50/p95 per size. The indexed numbers should stay flat while the scan grows linearly.
+
+Usage (from backend/):
+    python benchmarks/user_search.py [--sizes 10000,100000,1000000] [--rounds 20]
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from _common import percentiles
+
+QUERIES = ["a", "al", "ali", "alic", "alice", "lic", "mple.co", "qqqzz"]
+
+
+def fake_name(rng: random.Random) -> str:
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))).capitalize()
+
+
+def fill(engine, users_table, count: int) -> None:
+    rng = random.Random(count)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(count):
+            name = fake_name(rng) + " " + fake_name(rng)
+            batch.append({
+                "name": name,
+                "email": f"{name.replace(' ', '.').lower()}{i}@example.com",
+                "hashed_password": "x",
+                "balance": 0,
+            })
+            if len(batch) == 10000:
+                conn.execute(insert(users_table), batch)
+                batch = []
+        batch.append({"name": "Alice Liddell", "email": "alice@example.com", "hashed_password": "x", "balance": 0})
+        conn.execute(insert(users_table), batch)
+
+
+def time_queries(fn, db, rounds: int) -> dict:
+    samples = []
+    for _ in range(rounds):
+        for q in QUERIES:
+            start = time.perf_counter()
+            fn(db, q)
+            samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def measure(size: int, rounds: int) -> dict:
+    from database import Base
+    from user.models import User
+    import transaction.models  # noqa: F401  (User's relationships need AuditLog mapped)
+    from user import search_index
+
+    def ilike_scan(db, q):
+        pattern = f"%{q}%"
+        return db.query(User).filter(User.email.ilike(pattern) | User.name.ilike(pattern)).limit(10).all()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/search.db")
+        Base.metadata.create_all(engine, tables=[User.__table__])
+        started = time.perf_counter()
+        fill(engine, User.__table__, size)
+        search_index.install_search_index(engine)
+        build_seconds = time.perf_counter() - started
+        db = sessionmaker(bind=engine)()
+        try:
+            result = {
+                "users": size,
+                "build_seconds": round(build_seconds, 1),
+                "indexed": time_queries(lambda s, q: search_index.search_users(s, q), db, rounds),
+                "ilike_scan": time_queries(ilike_scan, db, max(1, rounds // 4)),
+            }
+        finally:
+            db.close()
+            engine.dispose()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    results = [measure(int(size), args.rounds) for size in args.sizes.split(",")]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
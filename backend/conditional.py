@@ -0,0 +1,64 @@
+"""
+conditional.py
+
+ETag / If-None-Match support for the per-user read endpoints (GET /auth/me, GET /transactions).
+
+Every change to a user's balance, PIN or history bumps `users.version` in the same
+transaction (transfers, /auth/set-pin, audit archival). An ETag is a hash of the user id, that
+version and whatever else selects the response (the query parameters of a history page), so
+a request whose If-None-Match still matches is answered with 304 before the response is
+built: no audit_logs query and no serialization.
+
+- /auth/me takes the version from the authenticated snapshot it already renders (user_cache),
+  so the ETag always describes the body it is sent with.
+- /transactions reads the version with a primary-key lookup on users *before* the history
+  query. A transfer committing in between can only make the tag older than the body, which
+  costs one extra 200 later, never a 304 over changed data.
+
+Responses are sent with `Cache-Control: private, no-cache` and `Vary: Authorization`: browsers
+keep them and revalidate every time, adding If-None-Match themselves, so the frontend's
+polling and refetches get 304s without any client code.
+"""
+import hashlib
+from typing import Any, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+# bump when a payload shape changes so clients drop bodies cached by an older release
+PAYLOAD_REVISION = "1"
+
+CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+
+def make_etag(*parts: Any) -> str:
+    """Weak ETag over `parts` (user id, version, filters, ...)."""
+    key = "\x1f".join(str(part) for part in (PAYLOAD_REVISION, *parts))
+    return 'W/"%s"' % hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def if_none_match(request: Request, etag: str) -> bool:
+    """True when the request's If-None-Match matches `etag` (weak comparison, RFC 9110 13.1.2)."""
+    header: Optional[str] = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = _opaque(etag)
+    return any(_opaque(tag) == wanted for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, **CACHE_HEADERS})
+
+
+def tag_response(response: Response, etag: str) -> Response:
+    """Add the ETag and revalidation headers to a 200 response."""
+    response.headers["ETag"] = etag
+    response.headers.update(CACHE_HEADERS)
+    return response
@@ -10,13 +10,39 @@ Design notes:
   rolls back on exception, and always closes the session. This pattern makes request-level
   operations atomic by default; for multi-step transfers prefer `with db.begin():` inside
   your business logic to ensure a single transactional boundary.
+- Write paths that must not lose updates (transfers) go through `run_transaction`, which retries
+  the whole transaction on deadlocks/serialization failures and, on SQLite, starts it with
+  BEGIN IMMEDIATE so concurrent writers are serialized instead of silently overwriting each other.
+- Engine and pool settings come from a named profile (DB_ENGINE_PROFILE, see below); pool metrics
+  are collected in `pool_metrics`.
+- With DB_SHARDS the accounts are spread over several databases: `shard_engines` /
+  `shard_sessions` hold one engine and sessionmaker per shard, shard 0 being `engine` /
+  `SessionLocal`. Which shard a user or request goes to is decided in sharding.py.
 """
-from typing import Generator
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, Iterator, List, Optional, Tuple, TypeVar
+import asyncio
+import logging
 import os
+import random
+import threading
+import time
 
-from sqlalchemy import create_engine
+from sqlalchemy import Column, create_engine, event, inspect
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import DBAPIError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import Pool, QueuePool
+from sqlalchemy.schema import CreateColumn, CreateIndex
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 
+try:
+    import fcntl
+except ImportError:  # not on Windows: SQLite schema setup is not serialized across processes there
+    fcntl = None
+
 
 # Read DATABASE_URL from env. Examples:
 # - SQLite: sqlite:///./data.db
@@ -24,16 +50,221 @@ from sqlalchemy.orm import sessionmaker, declarative_base, Session
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data.db")
 
 
-# SQLite needs check_same_thread=False when used with multiple threads (FastAPI/uvicorn).
-# For other backends (Postgres) connect_args should be empty.
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+# Engine profiles (DB_ENGINE_PROFILE):
+# - auto (default): 'sqlite' or 'postgres' depending on DATABASE_URL
+# - sqlite: WAL journal, synchronous=NORMAL and a busy timeout applied to every new connection,
+#   so readers don't block the writer and a locked database waits instead of failing at once
+# - postgres: sized QueuePool with pre-ping (drops connections the server or a proxy closed)
+#   and recycling
+# - default: SQLAlchemy defaults, as before profiles existed
+# Pool sizing applies per worker process; GET /stats reports checkout waits and utilization
+# under "db_pool" to size it.
+DB_ENGINE_PROFILE = os.getenv("DB_ENGINE_PROFILE", "auto").lower()
+DB_POOL_SIZE = os.getenv("DB_POOL_SIZE")
+DB_MAX_OVERFLOW = os.getenv("DB_MAX_OVERFLOW")
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+class PoolMetrics:
+    """Connection pool counters: checkout wait times, utilization and connection churn."""
+
+    def __init__(self, window: int = 1024) -> None:
+        self._lock = threading.Lock()
+        self._waits: deque = deque(maxlen=window)
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+
+    def observe_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self._waits.append(seconds)
+
+    def snapshot(self, pool: Pool) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+        out: Dict[str, Any] = {
+            "profile": ENGINE_PROFILE,
+            "pool": type(pool).__name__,
+            "checkouts": self.checkouts,
+            "checkout_wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "checkout_wait_p95_ms": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))] * 1000, 3) if waits else 0.0,
+            "checkout_wait_max_ms": round(self.wait_max * 1000, 3),
+            "checkout_timeouts": self.timeouts,
+            "connections_opened": self.connects,
+            "connections_closed": self.closes,
+            "connections_invalidated": self.invalidations,
+        }
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + max(0, pool._max_overflow)
+            out.update(
+                size=pool.size(),
+                max_overflow=pool._max_overflow,
+                checked_out=pool.checkedout(),
+                idle=pool.checkedin(),
+                utilization=round(pool.checkedout() / capacity, 3) if capacity > 0 else None,
+            )
+        return out
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited (including opening a connection)."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        pool_metrics.observe_wait(time.perf_counter() - start)
+        return conn
+
+
+def _engine_options(url: str, profile: str) -> Tuple[str, Dict[str, Any]]:
+    """Resolve the profile for `url` and return it with its create_engine() keyword arguments."""
+    parsed = make_url(url)
+    is_sqlite = parsed.get_backend_name() == "sqlite"
+    if profile == "auto":
+        profile = "sqlite" if is_sqlite else "postgres"
+
+    # SQLite needs check_same_thread=False when used with multiple threads (FastAPI/uvicorn).
+    # For other backends (Postgres) connect_args should be empty.
+    options: Dict[str, Any] = {"connect_args": {"check_same_thread": False} if is_sqlite else {}, "future": True}
+    in_memory = is_sqlite and parsed.database in (None, "", ":memory:")
+
+    if profile == "sqlite" and is_sqlite and not in_memory:
+        options["connect_args"]["timeout"] = SQLITE_BUSY_TIMEOUT_MS / 1000
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=int(DB_POOL_SIZE or 5),
+            max_overflow=int(DB_MAX_OVERFLOW or 10),
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    elif profile == "postgres" and not is_sqlite:
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=int(DB_POOL_SIZE or 10),
+            max_overflow=int(DB_MAX_OVERFLOW or 10),
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+    elif profile not in ("default", "sqlite", "postgres"):
+        raise ValueError(f"Unknown DB_ENGINE_PROFILE {profile!r}")
+    else:
+        profile = "default"
+    return profile, options
+
+
+ENGINE_PROFILE, _options = _engine_options(DATABASE_URL, DB_ENGINE_PROFILE)
+engine = create_engine(DATABASE_URL, **_options)
+
+IS_SQLITE = engine.dialect.name == "sqlite"
+
+logger = logging.getLogger(__name__)
+
+
+def _on_connect(dbapi_conn, connection_record) -> None:
+    pool_metrics.connects += 1
+    if ENGINE_PROFILE == "sqlite":
+        cursor = dbapi_conn.cursor()
+        try:
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        finally:
+            cursor.close()
 
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args, future=True)
+def _on_close(dbapi_conn, connection_record) -> None:
+    pool_metrics.closes += 1
+
+
+def _on_invalidate(dbapi_conn, connection_record, exception) -> None:
+    pool_metrics.invalidations += 1
+
+
+def _instrument(sync_engine) -> None:
+    event.listen(sync_engine, "connect", _on_connect)
+    event.listen(sync_engine, "close", _on_close)
+    event.listen(sync_engine, "invalidate", _on_invalidate)
+
+
+_instrument(engine)
+
+
+# Horizontal sharding (see sharding.py). DB_SHARDS is either the number of shards or a
+# comma-separated list of the URLs of shards 1..N-1; shard 0 is always DATABASE_URL. With a
+# number, the other shards are SQLite files next to DATABASE_URL's: data.db, data.shard1.db,
+# data.shard2.db, ... Unset (or 1) means a single database, as before sharding existed.
+def shard_urls(url: str, spec: str) -> List[str]:
+    """The database URL of every shard, shard 0 (`url`) first."""
+    spec = spec.strip()
+    if not spec.isdigit():
+        return [url] + [part.strip() for part in spec.split(",") if part.strip()]
+    count = int(spec)
+    if count <= 1:
+        return [url]
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite" or parsed.database in (None, "", ":memory:"):
+        raise ValueError("DB_SHARDS=<count> needs a SQLite file DATABASE_URL; list the shard URLs instead")
+    path = Path(parsed.database)
+    return [url] + [
+        parsed.set(database=str(path.with_name(f"{path.stem}.shard{k}{path.suffix}"))).render_as_string(hide_password=False)
+        for k in range(1, count)
+    ]
+
+
+SHARD_URLS = shard_urls(DATABASE_URL, os.getenv("DB_SHARDS", ""))
+SHARDED = len(SHARD_URLS) > 1
+
+shard_engines: List[Engine] = [engine]
+for _url in SHARD_URLS[1:]:
+    _shard_engine = create_engine(_url, **_engine_options(_url, DB_ENGINE_PROFILE)[1])
+    if _shard_engine.dialect.name != engine.dialect.name:
+        # run_transaction and the per-connection setup assume one kind of database
+        raise ValueError(f"DB_SHARDS mixes {engine.dialect.name} and {_shard_engine.dialect.name} databases")
+    _instrument(_shard_engine)
+    shard_engines.append(_shard_engine)
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Pool metrics of this process's engine(s) (for GET /stats).
+
+    Checkout waits are measured on the sync pools only (summed over shards); connection churn
+    counts every engine.
+    """
+    stats = pool_metrics.snapshot(engine.pool)
+    if SHARDED:
+        stats["shards"] = [
+            {"checked_out": e.pool.checkedout(), "idle": e.pool.checkedin()} if isinstance(e.pool, QueuePool) else type(e.pool).__name__
+            for e in shard_engines
+        ]
+    if async_engine is not None:
+        pool = async_engine.sync_engine.pool
+        stats["async_pool"] = {"checked_out": pool.checkedout(), "idle": pool.checkedin(), "size": pool.size()} if isinstance(pool, QueuePool) else type(pool).__name__
+    return stats
 
 
 # Configure sessionmaker: do not autocommit, do not autoflush by default.
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True, class_=Session)
+shard_sessions: List[sessionmaker] = [SessionLocal] + [
+    sessionmaker(bind=e, autoflush=False, autocommit=False, future=True, class_=Session) for e in shard_engines[1:]
+]
 
 
 # Declarative base for ORM models
@@ -68,6 +299,221 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
-def init_db() -> None:
-    """Utility to create DB tables. Call from a startup script or REPL if needed."""
-    Base.metadata.create_all(bind=engine)
+# indexes replaced by newer ones; dropped from existing databases by init_db
+OBSOLETE_INDEXES = ["ix_audit_logs_sender", "ix_audit_logs_receiver"]
+
+
+# pg_advisory_lock key held while a process creates or migrates the schema
+SCHEMA_LOCK_KEY = 0x66696E61
+
+
+@contextmanager
+def schema_lock(bind: Engine) -> Iterator[None]:
+    """Serialize schema setup (`init_db` and the other startup DDL) across processes.
+
+    Every worker runs the startup DDL on the same database; unserialized, two of them on a
+    fresh database race in CREATE TABLE / ALTER TABLE and the loser fails. Postgres holds a
+    session advisory lock, a SQLite file database an flock on "<file>.lock" next to it.
+    In-memory databases and other dialects are not locked.
+    """
+    if bind.dialect.name == "postgresql":
+        with bind.connect() as conn:
+            conn.exec_driver_sql(f"SELECT pg_advisory_lock({SCHEMA_LOCK_KEY})")
+            try:
+                yield
+            finally:
+                conn.exec_driver_sql(f"SELECT pg_advisory_unlock({SCHEMA_LOCK_KEY})")
+        return
+    database = bind.url.database if bind.dialect.name == "sqlite" else None
+    if not database or database == ":memory:" or database.startswith("file:") or fcntl is None:
+        yield
+        return
+    with open(f"{database}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _add_column(conn, table_name: str, column: Column) -> None:
+    """ALTER TABLE ... ADD COLUMN that is a no-op if a concurrent `init_db` added it first."""
+    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {ddl}")
+        return
+    try:
+        conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {ddl}")
+    except OperationalError as exc:
+        # SQLite/MySQL have no IF NOT EXISTS here; the failed statement leaves the transaction usable
+        if "duplicate column" not in str(exc.orig).lower():
+            raise
+
+
+def init_db(bind: Optional[Engine] = None) -> None:
+    """Utility to create DB tables in `bind` (default: `engine`). Call from a startup script or
+    REPL if needed; sharded setups call it once per shard.
+
+    `create_all` skips tables that already exist, so indexes added to a model later are
+    created here as well, and superseded ones dropped. Columns added to a model later are
+    added to the existing table (a no-op if a concurrent run added them first); they need a
+    server default (or to be nullable). When several processes may run it at once, hold
+    `schema_lock(bind)` around it (main.py does): create_all itself is not safe to race.
+    """
+    bind = engine if bind is None else bind
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    _add_column(conn, table.name, column)
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+        for name in OBSOLETE_INDEXES:
+            conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+
+
+# Bounded retry for write transactions. Deadlocks (Postgres 40P01), serialization failures
+# (40001) and SQLite lock timeouts abort the whole transaction, so the unit of work is re-run
+# from the start after a randomized backoff.
+TX_RETRY_ATTEMPTS = max(1, int(os.getenv("TX_RETRY_ATTEMPTS", "5")))
+TX_RETRY_BASE_DELAY = float(os.getenv("TX_RETRY_BASE_DELAY", "0.01"))
+
+# counters for observability
+retry_stats: Dict[str, int] = {"retries": 0, "exhausted": 0}
+
+_RETRYABLE_SQLSTATES = {"40001", "40P01"}
+
+T = TypeVar("T")
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """True for errors where re-running the transaction may succeed."""
+    if not isinstance(exc, DBAPIError):
+        return False
+    orig = exc.orig
+    sqlstate = getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+    if sqlstate in _RETRYABLE_SQLSTATES:
+        return True
+    message = str(orig).lower()
+    return "database is locked" in message or "deadlock" in message
+
+
+def run_transaction(db: Session, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run `fn(db, *args, **kwargs)` in its own write transaction and commit it.
+
+    Retryable failures roll back and re-run `fn` up to TX_RETRY_ATTEMPTS times with
+    jittered exponential backoff; other exceptions propagate after rollback. `db` must not
+    have a transaction open, since that work could not be retried along with `fn`.
+    """
+    if db.in_transaction():
+        raise RuntimeError("run_transaction needs a session without an open transaction")
+    for attempt in range(TX_RETRY_ATTEMPTS):
+        try:
+            with db.begin():
+                if IS_SQLITE:
+                    # pysqlite defers BEGIN until the first write and SQLite ignores FOR UPDATE,
+                    # so two transfers could both read a balance before either writes it.
+                    # BEGIN IMMEDIATE takes the write lock up front; concurrent writers wait
+                    # (up to the driver's busy timeout) instead of losing updates.
+                    db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+                return fn(db, *args, **kwargs)
+        except DBAPIError as exc:
+            time.sleep(_retry_delay(exc, attempt))
+    raise AssertionError("unreachable")
+
+
+def _retry_delay(exc: DBAPIError, attempt: int) -> float:
+    """Re-raise `exc` unless another attempt is allowed; otherwise return the backoff delay."""
+    if not is_retryable_error(exc):
+        raise exc
+    if attempt == TX_RETRY_ATTEMPTS - 1:
+        retry_stats["exhausted"] += 1
+        raise exc
+    retry_stats["retries"] += 1
+    delay = random.uniform(0, TX_RETRY_BASE_DELAY * (2 ** attempt))
+    logger.debug("Retrying transaction after %s (attempt %d, sleeping %.3fs)", exc.orig, attempt + 1, delay)
+    return delay
+
+
+# --- async path -------------------------------------------------------------------------
+# With DB_ASYNC=1 the I/O-bound endpoints (/auth/me, /auth/search, /transactions, /transfer)
+# run on an AsyncSession, so a request waiting on the database holds no threadpool thread.
+# The async driver is derived from DATABASE_URL (sqlite -> aiosqlite, postgresql -> psycopg's
+# async mode) or given explicitly with ASYNC_DATABASE_URL. The engine is created on first use,
+# so the sync path works without an async driver installed.
+DB_ASYNC = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes")
+if DB_ASYNC and SHARDED:
+    # the async engine only knows DATABASE_URL
+    logger.warning("DB_ASYNC is not supported with DB_SHARDS; using the sync path")
+    DB_ASYNC = False
+
+_async_sessionmaker: Optional[async_sessionmaker] = None
+async_engine: Optional[AsyncEngine] = None
+
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if backend == "postgresql" and parsed.get_driver_name() in ("psycopg2", "psycopg", ""):
+        return parsed.set(drivername="postgresql+psycopg").render_as_string(hide_password=False)
+    return url
+
+
+def get_async_sessionmaker() -> async_sessionmaker:
+    """Create the async engine (same profile and pool sizing as the sync one) on first call."""
+    global _async_sessionmaker, async_engine
+    if _async_sessionmaker is None:
+        url = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+        _, options = _engine_options(url, ENGINE_PROFILE)
+        # the async engine picks its own (async-adapted) pool class
+        options.pop("poolclass", None)
+        if make_url(url).get_backend_name() == "sqlite":
+            options["connect_args"].pop("check_same_thread", None)
+        async_engine = create_async_engine(url, **options)
+        _instrument(async_engine.sync_engine)
+        # rows stay readable after commit; handlers build their responses from them
+        _async_sessionmaker = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Async counterpart of `get_db`: commits after the handler, rolls back on error, always closes."""
+    db: AsyncSession = get_async_sessionmaker()()
+    try:
+        yield db
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        await db.close()
+
+
+async def run_transaction_async(db: AsyncSession, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """`run_transaction` for an AsyncSession.
+
+    `fn` is the same sync unit of work (it receives a sync Session) and runs through
+    `AsyncSession.run_sync`, so its queries use the async driver without a thread.
+    """
+    if db.in_transaction():
+        raise RuntimeError("run_transaction_async needs a session without an open transaction")
+    for attempt in range(TX_RETRY_ATTEMPTS):
+        try:
+            async with db.begin():
+                if IS_SQLITE:
+                    conn = await db.connection()
+                    await conn.exec_driver_sql("BEGIN IMMEDIATE")
+                return await db.run_sync(fn, *args, **kwargs)
+        except DBAPIError as exc:
+            await asyncio.sleep(_retry_delay(exc, attempt))
+    raise AssertionError("unreachable")
+
+
+async def dispose_async_engine() -> None:
+    if async_engine is not None:
+        await async_engine.dispose()
@@ -1,30 +1,54 @@
 import logging
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+import math
 import os
 from pathlib import Path
 import asyncio
 
 # Handle relative vs absolute imports based on execution context
 try:
-    from .database import init_db
+    from .database import shard_engines, init_db, schema_lock, retry_stats, pool_stats, dispose_async_engine
+    from .sharding import misplaced_users
     from .user import models as user_models
     from .transaction import models as tx_models
     from .user import routes as user_routes
     from .transaction import routes as transaction_routes
     # sse support
+    from .sse import models as sse_models
     from .sse import routes as sse_routes
     from .sse.sse_manager import sse_manager
+    from .sse.outbox import outbox_drainer
+    from .user.kdf_pool import kdf_pool, KDFPoolBusy
+    from .user.user_cache import user_cache
+    from .user.search_index import install_search_index
+    from .transaction.partitions import install_partitions
+    from .metrics import MetricsMiddleware, render_metrics
+    from .transaction.group_commit import transfer_writer
+    from .transaction.cross_shard import cross_shard_recovery
+    from .static_files import PrecompressedStaticFiles, CompressionMiddleware
+    from .rate_limit import RateLimited, rate_limiter
 except (ImportError, Exception):
-    from database import init_db
+    from database import shard_engines, init_db, schema_lock, retry_stats, pool_stats, dispose_async_engine
+    from sharding import misplaced_users  # type: ignore
     import user.models as user_models  # type: ignore
     import transaction.models as tx_models  # type: ignore
     import user.routes as user_routes  # type: ignore
     import transaction.routes as transaction_routes  # type: ignore
+    import sse.models as sse_models  # type: ignore
     from sse import routes as sse_routes  # type: ignore
     from sse.sse_manager import sse_manager  # type: ignore
+    from sse.outbox import outbox_drainer  # type: ignore
+    from user.kdf_pool import kdf_pool, KDFPoolBusy  # type: ignore
+    from user.user_cache import user_cache  # type: ignore
+    from user.search_index import install_search_index  # type: ignore
+    from transaction.partitions import install_partitions  # type: ignore
+    from metrics import MetricsMiddleware, render_metrics  # type: ignore
+    from transaction.group_commit import transfer_writer  # type: ignore
+    from transaction.cross_shard import cross_shard_recovery  # type: ignore
+    from static_files import PrecompressedStaticFiles, CompressionMiddleware  # type: ignore
+    from rate_limit import RateLimited, rate_limiter  # type: ignore
 
 # Setup Logging
 logger = logging.getLogger(__name__)
@@ -37,13 +61,19 @@ origins = [
     "*", 
 ]
 
+# innermost: gzip/brotli for large JSON bodies (see static_files.py)
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # let browser clients read the history paging cursor and the ETags of conditional GETs
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+# outermost: per-route latency, DB time and optional Server-Timing (see metrics.py)
+app.add_middleware(MetricsMiddleware)
 
 # --- ROUTER MOUNTING ---
 # mount user router under /auth
@@ -55,31 +85,109 @@ app.include_router(transaction_routes.router)
 app.include_router(sse_routes.router)
 
 
+@app.exception_handler(KDFPoolBusy)
+async def kdf_pool_busy_handler(request: Request, exc: KDFPoolBusy):
+    # password hashing is saturated: shed load instead of queueing without bound
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    # over the caller's login/signup/PIN budget: rejected before any hashing
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+
 @app.on_event("startup")
 def on_startup() -> None:
     try:
-        init_db()
-        # initialize sse manager event loop so publish can be called from sync code
-        try:
-            loop = asyncio.get_event_loop()
-            sse_manager.init_loop(loop)
-        except Exception:
-            pass
-
+        for shard, shard_engine in enumerate(shard_engines):
+            # all workers start at once; one at a time creates or migrates the schema
+            with schema_lock(shard_engine):
+                init_db(shard_engine)
+                # trigram / prefix indexes for /auth/search, also on databases created before them
+                logger.info("User search backend (shard %d): %s", shard, install_search_index(shard_engine))
+                # immutability triggers, plus this and the next months' partitions on Postgres
+                logger.info("Audit log partitioning (shard %d): %s", shard, install_partitions(shard_engine))
+        for shard, count in misplaced_users().items():
+            logger.error("Shard %d holds %d users whose id belongs to another shard; DB_SHARDS changed?", shard, count)
         logger.info("Database initialized")
     except Exception:
         logger.exception("Database initialization failed")
 
+    # Background tasks start even when schema setup failed: /transfer with group commit needs
+    # the writer either way, and the drainer and recovery retry their own database work.
+    try:
+        # initialize sse manager event loop so publish can be called from sync code
+        loop = asyncio.get_event_loop()
+        sse_manager.init_loop(loop)
+        # publish committed outbox events (including any left by a previous run)
+        outbox_drainer.start(loop)
+        # single writer task for /transfer when TRANSFER_GROUP_COMMIT is on
+        transfer_writer.start(loop)
+        # with DB_SHARDS: complete cross-shard transfers left prepared
+        cross_shard_recovery.start(loop)
+    except Exception:
+        logger.exception("Background task startup failed")
+
+    # spawn password hashing workers up front so the first login doesn't pay for it
+    try:
+        kdf_pool.start()
+    except Exception:
+        logger.exception("KDF pool startup failed")
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    kdf_pool.shutdown()
+    rate_limiter.close()
+    transfer_writer.close()
+    cross_shard_recovery.close()
+    outbox_drainer.close()
+    sse_manager.close()
+    await dispose_async_engine()
+
 
 @app.get("/")
 def health_check():
     return {"status": "ok"}
 
+
+@app.get("/stats")
+def stats():
+    """Per-process counters for sizing in-process caches and pools."""
+    return {
+        "user_cache": user_cache.stats(),
+        # write transactions re-run after a deadlock / lock timeout (see database.run_transaction)
+        "transactions": dict(retry_stats),
+        "db_pool": pool_stats(),
+        "transfer_writer": transfer_writer.stats(),
+        "cross_shard": cross_shard_recovery.stats(),
+        "sse": {**sse_manager.stats(), "outbox_published": outbox_drainer.published},
+        "static_files": frontend_files.stats(),
+        "rate_limit": rate_limiter.stats(),
+        "kdf_pool": {
+            "workers": kdf_pool.workers,
+            "max_pending": kdf_pool.max_pending,
+            "pending": kdf_pool.pending,
+            "completed": kdf_pool.completed,
+            "rejected": kdf_pool.rejected,
+        },
+    }
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text format: request/DB/KDF/SSE histograms plus the /stats values as gauges."""
+    return PlainTextResponse(render_metrics(stats()), media_type="text/plain; version=0.0.4")
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 FRONTEND_DIST = BASE_DIR / "frontend" / "dist"
 
+# the build is read, precompressed and cached in memory once per worker
+frontend_files = PrecompressedStaticFiles(directory=FRONTEND_DIST, html=True)
+
 app.mount(
     "/",
-    StaticFiles(directory=FRONTEND_DIST, html=True),
+    frontend_files,
     name="frontend",
 )
\ No newline at end of file
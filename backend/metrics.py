@@ -0,0 +1,240 @@
+"""
+metrics.py
+
+In-process metrics in the Prometheus text format, served by GET /metrics.
+
+- `MetricsMiddleware` (pure ASGI, so SSE and export streams pass through untouched) times
+  every request and records it per route template, method and status.
+- SQLAlchemy cursor hooks time every query. Queries run while a request is in flight are
+  also added to that request's totals (via a context variable, which Starlette copies into
+  the threadpool), giving per-route query counts and DB time.
+- `record_kdf` is called by the KDF pool with queue wait and hashing time.
+- Point-in-time values (pools, SSE queue depths, caches) are rendered from the same dicts
+  as /stats at scrape time.
+
+Values are per worker process; scrape each worker (or aggregate in Prometheus).
+
+Configuration (environment):
+- METRICS_SERVER_TIMING: '1' adds a `Server-Timing` header (app, db, kdf) to every response,
+  for profiling from the browser's network panel (default off).
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labelvalues -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for labelvalues, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                le_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {count}")
+        return lines
+
+
+request_seconds = Histogram(
+    "finapp_http_request_duration_seconds", "Request latency until the response body finished.", ("method", "route", "status")
+)
+request_db_queries = Histogram(
+    "finapp_http_request_db_queries", "Database queries issued per request.", ("method", "route"), COUNT_BUCKETS
+)
+request_db_seconds = Histogram(
+    "finapp_http_request_db_seconds", "Time spent in database queries per request.", ("method", "route")
+)
+db_query_seconds = Histogram("finapp_db_query_duration_seconds", "Duration of every database query (all callers).")
+kdf_seconds = Histogram(
+    "finapp_kdf_duration_seconds", "Password/PIN key derivation time in the KDF pool, by phase.", ("op", "phase")
+)
+sse_fanout_seconds = Histogram("finapp_sse_fanout_duration_seconds", "Time to queue one event on a user's local streams.")
+requests_started = Counter("finapp_http_requests_started_total", "Requests received.", ("method",))
+
+METRICS = [request_seconds, request_db_queries, request_db_seconds, db_query_seconds, kdf_seconds, sse_fanout_seconds, requests_started]
+
+
+class RequestTimings:
+    """DB and KDF totals of the request being served (see `_current`)."""
+
+    __slots__ = ("db_queries", "db_seconds", "kdf_seconds")
+
+    def __init__(self) -> None:
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.kdf_seconds = 0.0
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def record_kdf(op: str, wait: float, compute: float) -> None:
+    kdf_seconds.observe(wait, op, "wait")
+    kdf_seconds.observe(compute, op, "compute")
+    timings = _current.get()
+    if timings is not None:
+        timings.kdf_seconds += wait + compute
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    db_query_seconds.observe(elapsed)
+    timings = _current.get()
+    if timings is not None:
+        timings.db_queries += 1
+        timings.db_seconds += elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def _discard_failed_query(context) -> None:
+    # after_cursor_execute doesn't fire for a failed statement
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def _route_of(scope: dict) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "other")
+    # static frontend files and 404s: keep label cardinality bounded
+    return "other"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        status = 500
+        requests_started.inc(scope["method"])
+
+        async def send_with_timing(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    app_ms = (time.perf_counter() - start) * 1000
+                    value = (
+                        f'app;dur={app_ms:.1f}, db;dur={timings.db_seconds * 1000:.1f};desc="{timings.db_queries} queries", '
+                        f"kdf;dur={timings.kdf_seconds * 1000:.1f}"
+                    )
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"server-timing", value.encode("latin-1")),
+                        # lets cross-origin frontends read the timings
+                        (b"timing-allow-origin", b"*"),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            method, route = scope["method"], _route_of(scope)
+            request_seconds.observe(time.perf_counter() - start, method, route, str(status))
+            request_db_queries.observe(timings.db_queries, method, route)
+            request_db_seconds.observe(timings.db_seconds, method, route)
+
+
+def _gauge_lines(prefix: str, values: Dict[str, Any]) -> List[str]:
+    lines = []
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            lines.extend(_gauge_lines(name, value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+    return lines
+
+
+def render_metrics(gauges: Dict[str, Dict[str, Any]]) -> str:
+    """The Prometheus text exposition: all histograms/counters plus `gauges` flattened as
+    `finapp_<section>_<key>` (numeric values only)."""
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for section, values in gauges.items():
+        lines.extend(_gauge_lines(f"finapp_{section}", values))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,401 @@
+"""
+rate_limit.py
+
+Throttling of the endpoints that run PBKDF2 (login, signup, PIN set/checks).
+
+Every /auth/login, /auth/signup, /auth/set-pin, /auth/payment-session and PIN-authorized
+/transfer costs one or two 100k-iteration hashes. `rate_limiter.admit` is awaited before the
+handler does any of that work and raises `RateLimited` (429 with Retry-After, see main.py)
+once a caller has used up its budget, so a credential-stuffing burst is turned away for the
+price of a dictionary lookup.
+
+- Each action is limited by token buckets on several keys at once: the client IP, the account
+  email and/or the user id (`RULES`). An attempt is admitted only if every bucket has a token,
+  and then takes one from each; a rejected attempt takes nothing.
+- A bucket is one float per key: the time at which it would be full again (GCRA, the
+  "virtual scheduling" form of a token bucket). Keys are stored as 64-bit digests, so no email
+  or address is kept. Full buckets carry no information and are dropped, and at most
+  RATE_LIMIT_MAX_KEYS keys are kept (least recently used first out).
+- Buckets live in the worker (RATE_LIMIT_BACKEND=memory, default), so with N workers a caller
+  gets up to N times the budget. For a shared budget run the bucket server next to the workers
+  and point them at it (RATE_LIMIT_BACKEND=unix); while it is unreachable each worker falls
+  back to its own buckets:
+      python -m rate_limit --socket /tmp/finapp-ratelimit.sock
+- Admitted and rejected attempts per action, and the rule that rejected them, are reported
+  under "rate_limit" on GET /stats (and so on /metrics).
+
+Configuration (environment):
+- RATE_LIMIT_ENABLED: '0' turns throttling off (default on).
+- RATE_LIMIT_<ACTION>_<KEY>: "<attempts>/<seconds>" for one rule, e.g. RATE_LIMIT_LOGIN_EMAIL=5/60
+  allows bursts of 5 logins per account, refilled at 5 per minute; "0" disables the rule.
+  Defaults in `RULES`.
+- RATE_LIMIT_MAX_KEYS: buckets kept per process (or by the bucket server) (default 100000).
+- RATE_LIMIT_PROXY_HOPS: number of reverse proxies in front of the app; the client IP is then
+  taken from X-Forwarded-For that many entries from the right (default 0: the peer address).
+- RATE_LIMIT_BACKEND: memory|unix; RATE_LIMIT_SOCKET: the bucket server's socket path.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1").lower() not in ("0", "false", "no")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "0"))
+
+DEFAULT_SOCKET_PATH = "/tmp/finapp-ratelimit.sock"
+
+# action -> key -> default "<attempts>/<seconds>"
+RULES: Dict[str, Dict[str, str]] = {
+    "login": {"ip": "30/60", "email": "5/60"},
+    "signup": {"ip": "10/60"},
+    # set-pin, payment-session and /transfer with a PIN
+    "pin": {"ip": "30/60", "user": "10/60"},
+}
+
+# (key digest, seconds per token, burst in seconds): one bucket of one attempt
+Charge = Tuple[int, float, float]
+
+
+@dataclass(frozen=True)
+class Rule:
+    """A bucket of `attempts` tokens refilled over `seconds`."""
+
+    attempts: int
+    seconds: float
+
+    @classmethod
+    def parse(cls, spec: str) -> Optional["Rule"]:
+        attempts, _, seconds = spec.partition("/")
+        rule = cls(int(attempts), float(seconds or 1))
+        return rule if rule.attempts > 0 and rule.seconds > 0 else None
+
+
+class RateLimited(RuntimeError):
+    """Raised by `RateLimiter.admit` when an attempt is over its budget."""
+
+    def __init__(self, action: str, retry_after: float) -> None:
+        super().__init__("Too many attempts; try again later")
+        self.action = action
+        self.retry_after = retry_after
+
+
+def _digest(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class TokenBuckets:
+    """Bounded map of key digest -> time the bucket is full again (monotonic seconds)."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS) -> None:
+        self.max_keys = max(1, max_keys)
+        # least recently charged first
+        self._full_at: "OrderedDict[int, float]" = OrderedDict()
+        # charged from threadpool threads as well as the event loop
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def take(self, charges: Sequence[Charge]) -> List[float]:
+        """Take one token from every bucket of `charges`, or from none of them.
+
+        Returns, per bucket, the seconds until it has a token again (0 if it has one now);
+        the tokens were taken if all of them are 0.
+        """
+        now = time.monotonic()
+        with self._lock:
+            updates = []
+            waits = []
+            for key, interval, burst in charges:
+                full_at = max(self._full_at.get(key, now), now) + interval
+                # empty once taking a token would leave it more than `burst` seconds from full
+                wait = full_at - burst - now
+                # float slack: the last token of a burst computes as a few ulps over
+                waits.append(wait if wait > 1e-9 else 0.0)
+                updates.append((key, full_at))
+            if any(waits):
+                return waits
+            for key, full_at in updates:
+                self._full_at[key] = full_at
+                self._full_at.move_to_end(key)
+            self._expire(now)
+        return waits
+
+    def _expire(self, now: float) -> None:
+        entries = self._full_at
+        # buckets charged longest ago are usually full again by now
+        while entries:
+            key, full_at = next(iter(entries.items()))
+            if full_at > now and len(entries) <= self.max_keys:
+                break
+            entries.popitem(last=False)
+            if full_at > now:
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._full_at)
+
+
+class Backend:
+    """Where the buckets live. `take` has the semantics of `TokenBuckets.take`."""
+
+    name: str
+
+    async def take(self, charges: Sequence[Charge]) -> List[float]:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+    def close(self) -> None:
+        """Release connections."""
+
+
+class InMemoryBackend(Backend):
+    name = "memory"
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS) -> None:
+        self.buckets = TokenBuckets(max_keys)
+
+    async def take(self, charges: Sequence[Charge]) -> List[float]:
+        return self.buckets.take(charges)
+
+    def stats(self) -> Dict[str, int]:
+        return {"keys": len(self.buckets), "evictions": self.buckets.evictions}
+
+
+class UnixSocketBackend(Backend):
+    """Client of the bucket server (`serve` below), shared by all workers of a host.
+
+    Frames are newline-delimited JSON: {"i": seq, "c": [[key, interval, burst], ...]} answered
+    by {"i": seq, "w": [wait, ...]}. Requests are pipelined on one connection per worker. When the
+    server can't be reached, or doesn't answer within `timeout`, the worker's own buckets
+    decide; connecting is retried at most every `reconnect_delay` seconds.
+    """
+
+    name = "unix"
+
+    def __init__(self, path: str = DEFAULT_SOCKET_PATH, timeout: float = 0.25, reconnect_delay: float = 1.0) -> None:
+        self.path = path
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.local = InMemoryBackend()
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task | None = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._seq = 0
+        self._retry_at = 0.0
+        self.fallbacks = 0
+
+    async def _connect(self) -> Optional[asyncio.StreamWriter]:
+        if self._writer is not None:
+            return self._writer
+        if time.monotonic() < self._retry_at:
+            return None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(self.path), self.timeout)
+        except (OSError, asyncio.TimeoutError) as exc:
+            logger.warning("Rate limit server %s unreachable: %s", self.path, exc)
+            self._retry_at = time.monotonic() + self.reconnect_delay
+            return None
+        if self._writer is not None:
+            # another request connected while this one waited
+            writer.close()
+            return self._writer
+        self._writer = writer
+        self._reader_task = asyncio.get_running_loop().create_task(self._read(reader, writer))
+        return writer
+
+    async def _read(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                    future = self._pending.pop(int(msg["i"]), None)
+                    waits = [float(w) for w in msg["w"]]
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Malformed rate limit frame dropped")
+                    continue
+                if future is not None and not future.done():
+                    future.set_result(waits)
+        except OSError:
+            logger.exception("Rate limit server connection lost")
+        finally:
+            if self._writer is writer:
+                self._writer = None
+            writer.close()
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("rate limit server connection lost"))
+            self._pending.clear()
+
+    async def take(self, charges: Sequence[Charge]) -> List[float]:
+        writer = await self._connect()
+        if writer is not None:
+            self._seq += 1
+            seq = self._seq
+            future = asyncio.get_running_loop().create_future()
+            self._pending[seq] = future
+            try:
+                writer.write(_frame({"i": seq, "c": [list(c) for c in charges]}))
+                return await asyncio.wait_for(future, self.timeout)
+            except (OSError, ConnectionError, asyncio.TimeoutError):
+                self._pending.pop(seq, None)
+        self.fallbacks += 1
+        return await self.local.take(charges)
+
+    def stats(self) -> Dict[str, int]:
+        return {"connected": int(self._writer is not None), "fallbacks": self.fallbacks, "local_keys": len(self.local.buckets)}
+
+    def close(self) -> None:
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+
+
+def _frame(msg: dict) -> bytes:
+    return json.dumps(msg, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def backend_from_env() -> Backend:
+    kind = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    if kind == "unix":
+        return UnixSocketBackend(os.getenv("RATE_LIMIT_SOCKET", DEFAULT_SOCKET_PATH))
+    if kind != "memory":
+        logger.warning("Unknown RATE_LIMIT_BACKEND %r; using in-memory buckets", kind)
+    return InMemoryBackend()
+
+
+def client_ip(request: Request) -> str:
+    """The caller's address, skipping RATE_LIMIT_PROXY_HOPS trusted proxies."""
+    if RATE_LIMIT_PROXY_HOPS > 0:
+        forwarded = [a.strip() for a in request.headers.get("x-forwarded-for", "").split(",") if a.strip()]
+        if len(forwarded) >= RATE_LIMIT_PROXY_HOPS:
+            return forwarded[-RATE_LIMIT_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimiter:
+    def __init__(self, backend: Optional[Backend] = None, enabled: bool = RATE_LIMIT_ENABLED) -> None:
+        self.enabled = enabled
+        self.backend = backend or backend_from_env()
+        self.rules: Dict[str, Dict[str, Rule]] = {}
+        for action, keys in RULES.items():
+            for key, default in keys.items():
+                rule = Rule.parse(os.getenv(f"RATE_LIMIT_{action.upper()}_{key.upper()}", default))
+                if rule is not None:
+                    self.rules.setdefault(action, {})[key] = rule
+        # counters for observability
+        self.admitted: Dict[str, int] = {action: 0 for action in RULES}
+        self.rejected: Dict[str, int] = {action: 0 for action in RULES}
+        self.rejected_by: Dict[str, int] = {}
+
+    async def admit(self, action: str, **keys: object) -> None:
+        """Count one `action` attempt against the buckets of `keys` (ip=, email=, user=).
+
+        Raises RateLimited without taking a token when any of them is empty. Keys without
+        a rule, and None values, are ignored.
+        """
+        if not self.enabled:
+            return
+        rules = self.rules.get(action, {})
+        charges: List[Charge] = []
+        names: List[str] = []
+        for name, value in keys.items():
+            rule = rules.get(name)
+            if rule is None or value is None:
+                continue
+            if name == "email":
+                value = str(value).strip().lower()
+            charges.append((_digest(f"{action}:{name}:{value}"), rule.seconds / rule.attempts, rule.seconds))
+            names.append(name)
+        if not charges:
+            return
+        waits = await self.backend.take(charges)
+        if not any(waits):
+            self.admitted[action] += 1
+            return
+        self.rejected[action] += 1
+        for name, wait in zip(names, waits):
+            if wait:
+                label = f"{action}_{name}"
+                self.rejected_by[label] = self.rejected_by.get(label, 0) + 1
+        raise RateLimited(action, max(waits))
+
+    def close(self) -> None:
+        self.backend.close()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend.name,
+            "admitted": dict(self.admitted),
+            "rejected": dict(self.rejected),
+            "rejected_by": dict(self.rejected_by),
+            **self.backend.stats(),
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+# --- bucket server ------------------------------------------------------------------------
+
+class BucketServer:
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS) -> None:
+        self.buckets = TokenBuckets(max_keys)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                    charges = [(int(k), float(i), float(b)) for k, i, b in msg["c"]]
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Malformed frame dropped")
+                    continue
+                writer.write(_frame({"i": msg["i"], "w": self.buckets.take(charges)}))
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(path: str) -> None:
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(BucketServer().handle, path)
+    logger.info("Rate limit server listening on %s", path)
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="shared token buckets for multi-worker deployments")
+    parser.add_argument("--socket", default=os.getenv("RATE_LIMIT_SOCKET", DEFAULT_SOCKET_PATH))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+serialization.py
+
+One JSON encoding path for the hot responses: GET /transactions, /transactions/changes,
+/auth/me, /auth/search and SSE events.
+
+- `dumps` encodes with orjson (compiled; datetimes natively) when it is installed and with
+  the standard library otherwise. Both produce the same compact UTF-8 JSON for these payloads.
+- Money goes out as exact decimal strings ("12.50") built by `money`, never as floats.
+- `FastJSONResponse` renders with `dumps`. Handlers return it with the payload already
+  reduced to plain values, so FastAPI's `jsonable_encoder` pass and response-model
+  validation are skipped. The route's `response_model` still documents the shape.
+
+Configuration (environment):
+- JSON_ENCODER: 'orjson' (default when installed) or 'json' to force the standard library.
+"""
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Optional
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library encoder is used instead
+    orjson = None
+
+if os.getenv("JSON_ENCODER", "orjson").lower() == "json":
+    orjson = None
+
+ENCODER = "orjson" if orjson is not None else "json"
+
+
+def money(value: Optional[Decimal]) -> Optional[str]:
+    """Exact decimal string for an amount or balance ("12.50"), never in exponent form."""
+    return None if value is None else format(value, "f")
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return money(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value, default=_default)
+
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+    def dumps(value: Any) -> bytes:
+        return _encoder.encode(value).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,131 @@
+"""
+sharding.py
+
+Placement of accounts on the shards configured with DB_SHARDS (engines: database.py).
+
+- A user lives on shard `user_id % SHARD_COUNT`, together with everything that belongs to
+  them: their row, payment sessions, SSE outbox events and their side of every transfer in
+  audit_logs. Tokens carry the user id, so an authenticated request opens its session
+  directly on the right database (`user.routes.get_user_db`).
+- At signup the shard is picked from the email (`shard_for_email`) and the new id is
+  allocated from that shard's residue class (`allocate_user_id`), so the email and the id
+  always agree. Login and transfers, which only know an email, find the account by asking a
+  single shard.
+- Reads that span users fan out with `scatter`: /auth/search asks every shard in parallel
+  and merges, history pages fetch the names of counterparties on other shards by primary key.
+- A transfer between two shards can't be one transaction; it is prepared on the sender's
+  shard and applied on the receiver's (transaction/cross_shard.py).
+
+With one shard (the default) every function here answers shard 0 and nothing changes. Shards
+are chosen when the databases are created: existing data isn't moved when DB_SHARDS changes,
+and `misplaced_users` reports accounts that sit on the wrong shard.
+"""
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Generator, Iterable, List, Optional, TypeVar
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+try:
+    from .database import SHARDED, shard_engines, shard_sessions
+except Exception:
+    from database import SHARDED, shard_engines, shard_sessions
+
+SHARD_COUNT = len(shard_engines)
+
+# key of the Postgres advisory lock that serializes user id allocation on a shard
+USER_ID_LOCK = 0x75736572
+
+T = TypeVar("T")
+
+_scatter_pool: Optional[ThreadPoolExecutor] = None
+
+
+def shard_for_user(user_id: int) -> int:
+    return user_id % SHARD_COUNT
+
+
+def shard_for_email(email: str) -> int:
+    """The shard an account with `email` is created on (and found on)."""
+    if SHARD_COUNT == 1:
+        return 0
+    return zlib.crc32(email.encode("utf-8")) % SHARD_COUNT
+
+
+def shard_of_session(db: Session) -> int:
+    """The shard `db` is bound to."""
+    if SHARD_COUNT == 1:
+        return 0
+    return shard_engines.index(db.get_bind())
+
+
+def session_for_shard(shard: int) -> Session:
+    """A new session on `shard`; the caller closes it."""
+    return shard_sessions[shard]()
+
+
+def get_shard_db(shard: int) -> Generator[Session, None, None]:
+    """`database.get_db` on `shard`: commits after the caller, rolls back on error, always closes."""
+    db = session_for_shard(shard)
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def scatter(fn: Callable[[Session], T], shards: Optional[Iterable[int]] = None) -> List[T]:
+    """Run `fn(session)` on each of `shards` (default: all) in parallel; results in shard order.
+
+    Every call gets its own session, closed afterwards. `fn` can find out which shard it is
+    on with `shard_of_session`.
+    """
+    global _scatter_pool
+    shards = list(range(SHARD_COUNT)) if shards is None else sorted(shards)
+
+    def run(shard: int) -> T:
+        db = session_for_shard(shard)
+        try:
+            return fn(db)
+        finally:
+            db.close()
+
+    if len(shards) <= 1:
+        return [run(shard) for shard in shards]
+    if _scatter_pool is None:
+        _scatter_pool = ThreadPoolExecutor(max_workers=4 * SHARD_COUNT, thread_name_prefix="shard-scatter")
+    return list(_scatter_pool.map(run, shards))
+
+
+def allocate_user_id(db: Session) -> Optional[int]:
+    """The next user id of `db`'s shard (`id % SHARD_COUNT == shard`), or None when not sharded
+    (the database assigns it).
+
+    Call inside the inserting transaction, started with `run_transaction`: on SQLite its
+    BEGIN IMMEDIATE already serializes the signups of a shard, on Postgres an advisory lock
+    held until commit does.
+    """
+    if not SHARDED:
+        return None
+    shard = shard_of_session(db)
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": USER_ID_LOCK})
+    last = db.execute(text("SELECT max(id) FROM users")).scalar()
+    if last is None:
+        return shard or SHARD_COUNT
+    # the smallest id above `last` in the shard's residue class
+    return last + ((shard - last) % SHARD_COUNT or SHARD_COUNT)
+
+
+def misplaced_users() -> Dict[int, int]:
+    """Number of users on each shard whose id belongs to another shard (only shards with any)."""
+    if not SHARDED:
+        return {}
+    counts = scatter(lambda db: db.execute(
+        text("SELECT count(*) FROM users WHERE id % :n <> :shard"), {"n": SHARD_COUNT, "shard": shard_of_session(db)}
+    ).scalar())
+    return {shard: count for shard, count in enumerate(counts) if count}
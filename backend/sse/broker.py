@@ -0,0 +1,203 @@
+"""
+broker.py
+
+Transports that carry SSE events from the process that publishes them to the processes that
+hold the subscriber streams.
+
+`SSEManager` keeps the per-connection queues of its own process; a broker decides which
+processes see a published event:
+- InMemoryBroker (default): delivers straight to the local manager. Single worker only.
+- UnixSocketBroker: every worker connects to one hub process (`python -m sse.hub`) over a
+  Unix domain socket, registers the user ids it has streams for, and publishes through it.
+  The hub forwards each event to the workers subscribed to that user, including the sender.
+
+Selected with SSE_BROKER=memory|unix; the hub socket path comes from SSE_BROKER_SOCKET.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Callable, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "/tmp/finapp-sse.sock"
+
+# largest frame the hub and the workers read (the StreamReader limit on both ends); longer
+# frames are skipped instead of breaking the connection. Publishing an event that doesn't
+# fit sends a "resync" event in its place, so the client refetches instead of missing it.
+MAX_FRAME_BYTES = int(os.getenv("SSE_BROKER_MAX_FRAME_BYTES", str(1024 * 1024)))
+
+# deliver(user_id, data): hands an event to the local SSEManager; safe to call from any thread
+Deliver = Callable[[int, Any], None]
+
+
+class Broker:
+    """Interface used by SSEManager. Methods other than `publish` may be no-ops."""
+
+    def attach(self, deliver: Deliver) -> None:
+        """Register the local delivery callback. Called once by SSEManager."""
+        self._deliver = deliver
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Start any background I/O on the server's event loop."""
+
+    def subscribe(self, user_id: int) -> None:
+        """This process now has at least one stream for `user_id`."""
+
+    def unsubscribe(self, user_id: int) -> None:
+        """This process no longer has streams for `user_id`."""
+
+    def publish(self, user_id: int, data: Any) -> None:
+        """Send an event to every stream of `user_id`, in any process. Must be thread-safe."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Release connections and background tasks."""
+
+
+class InMemoryBroker(Broker):
+    def publish(self, user_id: int, data: Any) -> None:
+        self._deliver(user_id, data)
+
+
+class UnixSocketBroker(Broker):
+    """Client side of the hub in sse/hub.py.
+
+    Frames are newline-delimited JSON: {"op": "sub"|"unsub", "u": id} and
+    {"op": "pub", "u": id, "d": data}. Events published while the hub is unreachable are
+    dropped; the connection is retried every `reconnect_delay` seconds and the current
+    subscriptions are re-registered.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET_PATH, reconnect_delay: float = 1.0) -> None:
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._task: asyncio.Task | None = None
+        self._users: Set[int] = set()
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._task = loop.create_task(self._run())
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def subscribe(self, user_id: int) -> None:
+        self._call(self._subscribe, user_id)
+
+    def unsubscribe(self, user_id: int) -> None:
+        self._call(self._unsubscribe, user_id)
+
+    def publish(self, user_id: int, data: Any) -> None:
+        # encode in the caller's thread; only the socket write happens on the loop
+        frame = _frame({"op": "pub", "u": user_id, "d": data})
+        if len(frame) > MAX_FRAME_BYTES:
+            logger.warning("SSE event of %d bytes for user %s sent as resync", len(frame), user_id)
+            event_id = data.get("event_id") if isinstance(data, dict) else None
+            frame = _frame({"op": "pub", "u": user_id, "d": {"event": "resync", "event_id": event_id}})
+        self._call(self._write, frame)
+
+    def _call(self, fn: Callable[..., None], *args: Any) -> None:
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            fn(*args)
+        else:
+            loop.call_soon_threadsafe(fn, *args)
+
+    def _subscribe(self, user_id: int) -> None:
+        self._users.add(user_id)
+        self._write(_frame({"op": "sub", "u": user_id}))
+
+    def _unsubscribe(self, user_id: int) -> None:
+        self._users.discard(user_id)
+        self._write(_frame({"op": "unsub", "u": user_id}))
+
+    def _write(self, frame: bytes) -> None:
+        if self._writer is None:
+            return
+        try:
+            self._writer.write(frame)
+        except Exception:
+            logger.exception("SSE hub write failed")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=MAX_FRAME_BYTES)
+            except OSError as exc:
+                logger.warning("SSE hub %s unreachable: %s", self.path, exc)
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            self._writer = writer
+            for user_id in self._users:
+                self._write(_frame({"op": "sub", "u": user_id}))
+            try:
+                while True:
+                    line = await read_frame(reader)
+                    if line is None:
+                        logger.warning("Oversized SSE hub frame dropped")
+                        continue
+                    if not line:
+                        break
+                    try:
+                        msg = json.loads(line)
+                        self._deliver(int(msg["u"]), msg["d"])
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning("Malformed SSE hub frame dropped")
+            except Exception:
+                # reconnect whatever went wrong; a dead task would stop all cross-worker events
+                logger.exception("SSE hub connection lost")
+            finally:
+                self._writer = None
+                writer.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+
+def _frame(msg: dict) -> bytes:
+    return json.dumps(msg, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes | None:
+    """The next newline-terminated frame; b"" at EOF, None if the frame was longer than the
+    reader's limit (it is skipped entirely, so the next call returns the frame after it).
+
+    `readline` raises ValueError on such a frame and may leave its tail in the buffer, which
+    would then be read as a frame of its own.
+    """
+    try:
+        return await reader.readuntil(b"\n")
+    except asyncio.IncompleteReadError as exc:
+        return exc.partial
+    except asyncio.LimitOverrunError as exc:
+        overrun = exc
+    while True:
+        # drop what is buffered of the frame, then look for its end again
+        await reader.readexactly(overrun.consumed)
+        try:
+            await reader.readuntil(b"\n")
+            return None
+        except asyncio.IncompleteReadError:
+            return b""
+        except asyncio.LimitOverrunError as exc:
+            overrun = exc
+
+
+def broker_from_env() -> Broker:
+    kind = os.getenv("SSE_BROKER", "memory").lower()
+    if kind == "unix":
+        return UnixSocketBroker(os.getenv("SSE_BROKER_SOCKET", DEFAULT_SOCKET_PATH))
+    if kind != "memory":
+        logger.warning("Unknown SSE_BROKER %r; using in-memory broker", kind)
+    return InMemoryBroker()
@@ -0,0 +1,108 @@
+"""
+hub.py
+
+Fan-out hub for `UnixSocketBroker` (see sse/broker.py). Run one per host, next to the
+uvicorn workers, from the backend directory:
+
+    python -m sse.hub --socket /tmp/finapp-sse.sock
+
+and start the workers with SSE_BROKER=unix SSE_BROKER_SOCKET=/tmp/finapp-sse.sock.
+The hub keeps only routing state (which worker connection streams which user); published
+frames are forwarded as received, without re-encoding.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Set
+
+try:
+    from .broker import DEFAULT_SOCKET_PATH, MAX_FRAME_BYTES, read_frame
+except Exception:
+    from sse.broker import DEFAULT_SOCKET_PATH, MAX_FRAME_BYTES, read_frame
+
+logger = logging.getLogger("sse.hub")
+
+# a worker that stops reading is disconnected instead of buffering without bound;
+# it reconnects and re-registers its subscriptions
+MAX_WORKER_BUFFER = 8 * 1024 * 1024
+
+
+class Hub:
+    def __init__(self) -> None:
+        self._subs: Dict[int, Set[asyncio.StreamWriter]] = defaultdict(set)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        mine: Set[int] = set()
+        try:
+            while True:
+                line = await read_frame(reader)
+                if line is None:
+                    # never forwarded: workers read frames with the same limit
+                    logger.warning("Oversized frame dropped")
+                    continue
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                    op = msg["op"]
+                    user_id = int(msg["u"])
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Malformed frame dropped")
+                    continue
+                if op == "pub":
+                    self._forward(user_id, line)
+                elif op == "sub":
+                    self._subs[user_id].add(writer)
+                    mine.add(user_id)
+                elif op == "unsub":
+                    self._drop(user_id, writer)
+                    mine.discard(user_id)
+        except OSError:
+            pass
+        finally:
+            for user_id in mine:
+                self._drop(user_id, writer)
+            writer.close()
+
+    def _forward(self, user_id: int, line: bytes) -> None:
+        for w in list(self._subs.get(user_id, ())):
+            if w.transport.get_write_buffer_size() > MAX_WORKER_BUFFER:
+                logger.warning("Disconnecting slow worker")
+                w.close()
+                continue
+            w.write(line)
+
+    def _drop(self, user_id: int, writer: asyncio.StreamWriter) -> None:
+        writers = self._subs.get(user_id)
+        if writers is not None:
+            writers.discard(writer)
+            if not writers:
+                del self._subs[user_id]
+
+
+async def serve(path: str) -> None:
+    if os.path.exists(path):
+        os.unlink(path)
+    hub = Hub()
+    server = await asyncio.start_unix_server(hub.handle, path, limit=MAX_FRAME_BYTES)
+    logger.info("SSE hub listening on %s", path)
+    async with server:
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SSE fan-out hub for multi-worker deployments")
+    parser.add_argument("--socket", default=os.getenv("SSE_BROKER_SOCKET", DEFAULT_SOCKET_PATH))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, Index, func
+
+try:
+    from ..database import Base
+except Exception:
+    from database import Base
+
+
+class OutboxEvent(Base):
+    """An SSE event written in the same transaction as the change it announces.
+
+    The autoincrement id is the SSE event id: it only grows, so clients resume with
+    Last-Event-ID and receive just the rows after it. On SQLite that takes AUTOINCREMENT:
+    a plain rowid table hands out max(id) + 1, reusing ids once pruning deleted the newest rows.
+    """
+
+    __tablename__ = "event_outbox"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # recipient of the event
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # JSON-encoded event body
+    payload = Column(Text, nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # set when a drainer has claimed and published the event
+    published_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self) -> str:  # pragma: no cover - convenience
+        return f"<OutboxEvent id={self.id} user_id={self.user_id} published={self.published_at is not None}>"
+
+
+Index("ix_event_outbox_user_id", OutboxEvent.user_id, OutboxEvent.id)
+Index("ix_event_outbox_published", OutboxEvent.published_at)
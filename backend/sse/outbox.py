@@ -0,0 +1,198 @@
+"""
+outbox.py
+
+Transactional outbox for SSE events.
+
+Business code calls `enqueue_event(db, user_id, data)` inside its transaction; the event row
+commits or rolls back together with the change it announces, so users are never told about
+a transfer that didn't happen. After the commit the drainer task claims unpublished rows
+with one `UPDATE ... RETURNING` (so with several workers each row is published by exactly
+one of them) and hands them to `sse_manager.publish`.
+
+Each published event carries its row id as `event_id`; /sse/stream sends it as the SSE `id:`
+and uses `replay_events` to resend what a reconnecting client missed (Last-Event-ID).
+Delivery is at-least-once: a replayed event may also arrive live. When the replay can't be
+complete (more than REPLAY_LIMIT events, or some already pruned), `resync_event` tells the
+client to refetch instead.
+
+With several shards (sharding.py) each shard has its own outbox, holding the events of its
+users, so a user's event ids still only grow. A commit wakes the drainer for its shard; the
+periodic sweep covers all of them.
+
+Configuration (environment):
+- OUTBOX_POLL_SECONDS: sweep interval for rows not drained right after their commit,
+  e.g. because the committing worker died (default 1.0).
+- OUTBOX_BATCH_SIZE: rows claimed per round (default 200).
+- OUTBOX_RETENTION_SECONDS: how long published rows are kept for replay (default 86400).
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import event, select, update, func
+from sqlalchemy.orm import Session
+
+try:
+    from ..sharding import SHARD_COUNT, session_for_shard, shard_of_session
+    from .models import OutboxEvent
+    from .sse_manager import sse_manager
+except Exception:
+    from sharding import SHARD_COUNT, session_for_shard, shard_of_session
+    from sse.models import OutboxEvent
+    from sse.sse_manager import sse_manager
+
+logger = logging.getLogger(__name__)
+
+REPLAY_LIMIT = 1000
+
+
+def enqueue_event(db: Session, user_id: int, data: Dict[str, Any]) -> OutboxEvent:
+    """Add an event for `user_id` to the current transaction. Published after commit."""
+    row = OutboxEvent(user_id=user_id, payload=json.dumps(data, separators=(",", ":")))
+    db.add(row)
+    db.info.setdefault("outbox_pending", set()).add(shard_of_session(db))
+    return row
+
+
+def replay_events(db: Session, user_id: int, after_id: int, limit: int = REPLAY_LIMIT) -> List[Dict[str, Any]]:
+    """Events of `user_id` with id > `after_id`, oldest first, in the published format."""
+    rows = (
+        db.query(OutboxEvent.id, OutboxEvent.payload)
+        .filter(OutboxEvent.user_id == user_id, OutboxEvent.id > after_id)
+        .order_by(OutboxEvent.id)
+        .limit(limit)
+        .all()
+    )
+    return [{"event_id": r.id, **json.loads(r.payload)} for r in rows]
+
+
+def resync_event(
+    db: Session, user_id: int, after_id: int, replayed: List[Dict[str, Any]], limit: int = REPLAY_LIMIT
+) -> Optional[Dict[str, Any]]:
+    """The event to send after `replayed` when it isn't everything published after `after_id`,
+    else None.
+
+    That is the case when the replay was cut at `limit`, or when `after_id` is older than the
+    oldest retained row, so events after it may have been pruned. The event has no
+    `transaction` (clients catch up through /transactions/changes) and carries the user's
+    newest event id, so the stream and the next Last-Event-ID resume from there.
+    """
+    if len(replayed) < limit:
+        oldest = db.query(func.min(OutboxEvent.id)).scalar()
+        # pruning keeps the newest row, so an empty table never held any event
+        if oldest is None or after_id >= oldest - 1:
+            return None
+    latest = db.query(func.max(OutboxEvent.id)).filter(OutboxEvent.user_id == user_id).scalar()
+    return {"event": "resync", "event_id": max(latest or 0, after_id)}
+
+
+class OutboxDrainer:
+    def __init__(self) -> None:
+        self.poll_seconds = float(os.getenv("OUTBOX_POLL_SECONDS", "1.0"))
+        self.batch_size = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+        self.retention_seconds = int(os.getenv("OUTBOX_RETENTION_SECONDS", "86400"))
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        # shards with events committed since the last drain
+        self._dirty: Set[int] = set()
+        self._task: asyncio.Task | None = None
+        self._last_prune = 0.0
+        # counters for observability
+        self.published = 0
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def wake(self, shards: Iterable[int] = (0,)) -> None:
+        """Thread-safe: drain `shards` now instead of at the next poll."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._mark_dirty, set(shards))
+
+    def _mark_dirty(self, shards: Set[int]) -> None:
+        self._dirty |= shards
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                shards, self._dirty = self._dirty, set()
+            except asyncio.TimeoutError:
+                shards = set(range(SHARD_COUNT))
+            self._wakeup.clear()
+            try:
+                for shard in sorted(shards):
+                    while True:
+                        events = await loop.run_in_executor(None, self._claim_batch, shard)
+                        for user_id, data in events:
+                            sse_manager.publish(user_id, data)
+                        self.published += len(events)
+                        if len(events) < self.batch_size:
+                            break
+                if time.monotonic() - self._last_prune > 60:
+                    self._last_prune = time.monotonic()
+                    for shard in range(SHARD_COUNT):
+                        await loop.run_in_executor(None, self._prune, shard)
+            except Exception:
+                logger.exception("Outbox drain failed")
+
+    def _claim_batch(self, shard: int = 0) -> List[tuple]:
+        db = session_for_shard(shard)
+        try:
+            pending = (
+                select(OutboxEvent.id)
+                .where(OutboxEvent.published_at.is_(None))
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+            )
+            rows = db.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_(pending), OutboxEvent.published_at.is_(None))
+                .values(published_at=func.now())
+                .returning(OutboxEvent.id, OutboxEvent.user_id, OutboxEvent.payload)
+            ).all()
+            db.commit()
+        finally:
+            db.close()
+        rows.sort(key=lambda r: r.id)
+        return [(r.user_id, {"event_id": r.id, **json.loads(r.payload)}) for r in rows]
+
+    def _prune(self, shard: int = 0) -> None:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.retention_seconds)
+        # the newest row stays: tables created before sqlite_autoincrement would reuse its id
+        newest = select(func.max(OutboxEvent.id)).scalar_subquery()
+        db = session_for_shard(shard)
+        try:
+            db.query(OutboxEvent).filter(
+                OutboxEvent.published_at.is_not(None), OutboxEvent.created_at < cutoff, OutboxEvent.id < newest
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+outbox_drainer = OutboxDrainer()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_drainer_after_commit(session: Session) -> None:
+    shards = session.info.pop("outbox_pending", None)
+    if shards:
+        outbox_drainer.wake(shards)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop("outbox_pending", None)
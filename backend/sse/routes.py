@@ -1,24 +1,45 @@
-import json
+import asyncio
 from typing import AsyncGenerator
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 try:
+    from ..sharding import session_for_shard, shard_for_user
     from ..user.auth import decode_access_token
-    from .sse_manager import sse_manager
+    from .sse_manager import sse_manager, Event, SSECapacityError, EVICTED
+    from .outbox import replay_events, resync_event
 except Exception:
+    from sharding import session_for_shard, shard_for_user
     from user.auth import decode_access_token
-    from sse.sse_manager import sse_manager
+    from sse.sse_manager import sse_manager, Event, SSECapacityError, EVICTED
+    from sse.outbox import replay_events, resync_event
 
 
 router = APIRouter(prefix="/sse")
 
+HEARTBEAT = b": ping\n\n"
+
+
+def _load_missed(user_id: int, after_id: int):
+    # event ids come from the user's shard
+    db = session_for_shard(shard_for_user(user_id))
+    try:
+        replayed = replay_events(db, user_id, after_id)
+        return replayed, resync_event(db, user_id, after_id, replayed)
+    finally:
+        db.close()
+
 
 @router.get("/stream")
-async def stream(request: Request, token: str | None = None):
+async def stream(request: Request, token: str | None = None, last_event_id: int | None = None):
     """SSE stream endpoint.
     Accepts token as query param (?token=...) or Authorization: Bearer <token>.
-    Yields server-sent events for the authenticated user.
+    Yields server-sent events for the authenticated user, and a comment line every
+    SSE_HEARTBEAT_SECONDS while idle so dead connections are detected and proxies keep it open.
+    Events carry an `id:`; on reconnect the events after the `Last-Event-ID` header
+    (or ?last_event_id=...) are replayed first. If they can't all be replayed (too many, or
+    pruned), a "resync" event without a transaction follows, and the client refetches.
     """
     auth_token = token
     if not auth_token:
@@ -35,18 +56,61 @@ async def stream(request: Request, token: str | None = None):
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-    q = sse_manager.subscribe(user_id)
+    header_id = request.headers.get("last-event-id")
+    if header_id:
+        try:
+            last_event_id = int(header_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    try:
+        sub = sse_manager.subscribe(user_id)
+    except SSECapacityError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": "5"})
+
+    # subscribe before reading the backlog so nothing published in between is missed;
+    # live events already covered by the replay are skipped below
+    replayed, resync = [], None
+    if last_event_id is not None:
+        try:
+            replayed, resync = await run_in_threadpool(_load_missed, user_id, last_event_id)
+        except Exception:
+            sse_manager.unsubscribe(sub)
+            raise
+    if resync is not None:
+        # the client refetches everything up to here; don't send those events live either
+        replayed.append(resync)
+    seen_id = replayed[-1]["event_id"] if replayed else (last_event_id or 0)
 
     async def event_generator() -> AsyncGenerator[bytes, None]:
+        # one pending get() is reused across heartbeats so no event is lost to a timeout
+        get_task: asyncio.Task | None = None
         try:
+            for data in replayed:
+                yield Event(data).frame
             while True:
-                # if client disconnected, break loop
-                if await request.is_disconnected():
+                if get_task is None:
+                    get_task = asyncio.ensure_future(sub.queue.get())
+                done, _ = await asyncio.wait({get_task}, timeout=sse_manager.heartbeat_seconds)
+                if not done:
+                    # idle: check the client is still there, then keep the connection warm
+                    if await request.is_disconnected():
+                        break
+                    yield HEARTBEAT
+                    continue
+                event = get_task.result()
+                get_task = None
+                if event is EVICTED:
+                    # slow consumer or superseded stream; the client will reconnect
                     break
-                data = await q.get()
-                # ensure JSON string, send as SSE "data: <json>\n\n"
-                yield f"data: {json.dumps(data)}\n\n".encode("utf-8")
+                if event.event_id is not None and event.event_id <= seen_id:
+                    # already sent by the replay
+                    continue
+                # encoded once in the manager for every subscriber
+                yield event.frame
         finally:
-            sse_manager.unsubscribe(user_id, q)
+            if get_task is not None:
+                get_task.cancel()
+            sse_manager.unsubscribe(sub)
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
@@ -1,31 +1,147 @@
 import asyncio
+import logging
+import os
+import time
 from collections import defaultdict
 from typing import Any, Dict, List
 
+try:
+    from .broker import Broker, broker_from_env
+    from ..metrics import sse_fanout_seconds
+    from ..serialization import dumps
+except Exception:
+    from sse.broker import Broker, broker_from_env
+    from metrics import sse_fanout_seconds
+    from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_DISCONNECT = "disconnect"
+
+# queued in place of an event to tell the stream generator to close
+EVICTED = object()
+
+
+class Event:
+    """A published event as its SSE frame, encoded once and shared by every subscriber queue."""
+
+    __slots__ = ("event_id", "frame")
+
+    def __init__(self, data: Any) -> None:
+        # outbox events carry their id so the browser resends it as Last-Event-ID on reconnect
+        self.event_id = data.get("event_id") if isinstance(data, dict) else None
+        prefix = b"id: %d\n" % self.event_id if self.event_id is not None else b""
+        self.frame = prefix + b"data: " + dumps(data) + b"\n\n"
+
+
+class SSECapacityError(RuntimeError):
+    """Raised by `subscribe` when this worker already holds `max_streams` streams."""
+
+
+class Subscription:
+    """One open SSE stream: a bounded queue of pending events for one user."""
+
+    __slots__ = ("user_id", "queue", "evicted")
+
+    def __init__(self, user_id: int, maxsize: int) -> None:
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.evicted = False
+
+    def evict(self) -> None:
+        """Discard pending events and wake the stream so it closes."""
+        self.evicted = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(EVICTED)
+
 
 class SSEManager:
-    def __init__(self) -> None:
-        # map user_id -> list of asyncio.Queue
-        self._subs: Dict[int, List[asyncio.Queue]] = defaultdict(list)
+    """Per-process registry of SSE streams.
+
+    Configuration (environment):
+    - SSE_QUEUE_SIZE: pending events per stream (default 64).
+    - SSE_OVERFLOW_POLICY: what to do when a stream's queue is full: 'drop-oldest' (default)
+      discards its oldest pending event, 'disconnect' closes the stream (the client reconnects).
+    - SSE_HEARTBEAT_SECONDS: idle interval between heartbeat comments (default 15).
+    - SSE_MAX_STREAMS_PER_USER: a user's oldest stream is closed when they open one more (default 5).
+    - SSE_MAX_STREAMS: streams per worker; beyond it `subscribe` raises SSECapacityError (default 20000).
+    """
+
+    def __init__(self, broker: Broker | None = None) -> None:
+        # map user_id -> list of Subscription (streams held by this process), oldest first
+        self._subs: Dict[int, List[Subscription]] = defaultdict(list)
         self._loop: asyncio.AbstractEventLoop | None = None
+        # broker carries published events to the process(es) holding the streams
+        self._broker = broker if broker is not None else broker_from_env()
+        self._broker.attach(self._deliver_local)
+
+        self.queue_size = max(1, int(os.getenv("SSE_QUEUE_SIZE", "64")))
+        self.overflow_policy = os.getenv("SSE_OVERFLOW_POLICY", OVERFLOW_DROP_OLDEST)
+        if self.overflow_policy not in (OVERFLOW_DROP_OLDEST, OVERFLOW_DISCONNECT):
+            logger.warning("Unknown SSE_OVERFLOW_POLICY %r; using %s", self.overflow_policy, OVERFLOW_DROP_OLDEST)
+            self.overflow_policy = OVERFLOW_DROP_OLDEST
+        self.heartbeat_seconds = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+        self.max_streams_per_user = max(1, int(os.getenv("SSE_MAX_STREAMS_PER_USER", "5")))
+        self.max_streams = max(1, int(os.getenv("SSE_MAX_STREAMS", "20000")))
+
+        self._open = 0
+        # counters for observability
+        self.dropped = 0
+        self.evicted = 0
+        self.rejected = 0
 
     def init_loop(self, loop: asyncio.AbstractEventLoop) -> None:
-        """Store main event loop reference so publish can be called from sync threads."""
+        """Store main event loop reference so publish can be called from sync threads, and start the broker."""
         self._loop = loop
+        self._broker.start(loop)
+
+    def close(self) -> None:
+        self._broker.close()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Register a new stream. Must be called on the event loop."""
+        if self._open >= self.max_streams:
+            self.rejected += 1
+            raise SSECapacityError("Too many open event streams")
 
-    def subscribe(self, user_id: int) -> asyncio.Queue:
-        q: asyncio.Queue = asyncio.Queue()
-        self._subs[user_id].append(q)
-        return q
+        subs = self._subs[user_id]
+        while len(subs) >= self.max_streams_per_user:
+            # the oldest stream is usually a tab that has gone away
+            oldest = subs.pop(0)
+            self._open -= 1
+            self.evicted += 1
+            oldest.evict()
 
-    def unsubscribe(self, user_id: int, q: asyncio.Queue) -> None:
+        sub = Subscription(user_id, self.queue_size)
+        first = not subs
+        subs.append(sub)
+        self._open += 1
+        if first:
+            self._broker.subscribe(user_id)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        subs = self._subs.get(sub.user_id)
+        if not subs:
+            return
         try:
-            self._subs[user_id].remove(q)
-        except Exception:
-            pass
+            subs.remove(sub)
+        except ValueError:
+            # already dropped by an eviction
+            return
+        self._open -= 1
+        if not subs:
+            del self._subs[sub.user_id]
+            self._broker.unsubscribe(sub.user_id)
 
     def publish(self, user_id: int, data: Any) -> None:
-        """Thread-safe publish: schedule put_nowait on the main loop for each subscriber queue."""
+        """Thread-safe publish to every stream of `user_id`, in this or (with a shared broker) another worker."""
+        self._broker.publish(user_id, data)
+
+    def _deliver_local(self, user_id: int, data: Any) -> None:
+        """Thread-safe local fan-out: schedule delivery to this user's queues on the main loop."""
         loop = self._loop
         if loop is None:
             try:
@@ -35,10 +151,41 @@ class SSEManager:
         if not loop:
             # no loop available: drop silently
             return
+        loop.call_soon_threadsafe(self._fan_out, user_id, data)
+
+    def _fan_out(self, user_id: int, data: Any) -> None:
+        start = time.perf_counter()
+        subs = self._subs.get(user_id)
+        if not subs:
+            return
+        event = Event(data)
+        for sub in list(subs):
+            if sub.evicted:
+                continue
+            if sub.queue.full():
+                if self.overflow_policy == OVERFLOW_DISCONNECT:
+                    self.unsubscribe(sub)
+                    self.evicted += 1
+                    sub.evict()
+                    continue
+                sub.queue.get_nowait()
+                self.dropped += 1
+            sub.queue.put_nowait(event)
+        sse_fanout_seconds.observe(time.perf_counter() - start)
 
-        queues = list(self._subs.get(user_id, []))
-        for q in queues:
-            loop.call_soon_threadsafe(q.put_nowait, data)
+    def stats(self) -> Dict[str, Any]:
+        depths = [sub.queue.qsize() for subs in self._subs.values() for sub in subs]
+        return {
+            "open_streams": self._open,
+            "users": len(self._subs),
+            "queued_events": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "queue_size": self.queue_size,
+            "overflow_policy": self.overflow_policy,
+            "dropped_events": self.dropped,
+            "evicted_streams": self.evicted,
+            "rejected_streams": self.rejected,
+        }
 
 
 sse_manager = SSEManager()
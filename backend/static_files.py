@@ -0,0 +1,288 @@
+"""
+static_files.py
+
+Serving the built frontend (frontend/dist) and compressing large JSON responses.
+
+`PrecompressedStaticFiles` replaces `StaticFiles(..., html=True)`:
+- When it starts, it reads every file of the build into a bounded in-memory cache, along with
+  its gzip encoding and, if the optional `brotli` package is installed, its brotli encoding.
+  Encodings written at build time (`index-B6A7k1oV.js.gz` / `.br`, see below) are used as they
+  are; anything missing is compressed at startup.
+- Requests are served from memory in the best encoding the client accepts, with a strong
+  ETag per encoding. If-None-Match gets 304.
+- Vite's hashed build assets (`assets/<name>-<hash>.<ext>`) never change under the same name,
+  so they're sent with `Cache-Control: public, max-age=31536000, immutable`. Everything else
+  (index.html, vite.svg) gets `no-cache` and is revalidated with its ETag.
+- Files that didn't fit in STATIC_CACHE_MAX_BYTES go to StaticFiles, and so does everything
+  else it handles: directories, 404s and methods other than GET/HEAD.
+
+`CompressionMiddleware` compresses application/json response bodies of at least
+JSON_COMPRESS_MIN_BYTES when the client accepts it. Streaming responses (SSE, statement
+exports) and bodies that are already encoded pass through untouched.
+
+Precompress at build time with the best settings (the Dockerfile does this), from backend/:
+    python -m static_files precompress ../frontend/dist
+
+Configuration (environment):
+- STATIC_CACHE_MAX_BYTES: memory for cached files and their encodings (default 64 MiB).
+- STATIC_CACHE_MAX_FILE_BYTES: files larger than this are always served from disk (default 8 MiB).
+- JSON_COMPRESS_MIN_BYTES: smallest JSON body that is compressed (default 1400; 0 disables).
+- JSON_COMPRESS_LEVEL: gzip level for JSON responses (default 5).
+"""
+import argparse
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+try:
+    from .conditional import if_none_match
+except Exception:
+    from conditional import if_none_match
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip encodings are served then
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_CACHE_MAX_BYTES = int(os.getenv("STATIC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+STATIC_CACHE_MAX_FILE_BYTES = int(os.getenv("STATIC_CACHE_MAX_FILE_BYTES", str(8 * 1024 * 1024)))
+JSON_COMPRESS_MIN_BYTES = int(os.getenv("JSON_COMPRESS_MIN_BYTES", "1400"))
+JSON_COMPRESS_LEVEL = int(os.getenv("JSON_COMPRESS_LEVEL", "5"))
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Vite's default output: assets/<name>-<8 char content hash>.<ext>
+HASHED_ASSET = re.compile(r"^assets/(.+/)?[^/]+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+
+COMPRESSIBLE = {
+    "application/javascript", "application/json", "application/manifest+json", "application/wasm",
+    "application/xml", "image/svg+xml", "image/x-icon",
+}
+
+# preferred first; the file suffixes written by `precompress`
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+
+def _media_type(path: str) -> str:
+    return mimetypes.guess_type(path)[0] or "text/plain"
+
+
+def _compressible(media_type: str) -> bool:
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE
+
+
+def _compress(encoding: str, body: bytes, best: bool = False) -> bytes:
+    if encoding == "br":
+        # quality 11 is slow: only at build time
+        return brotli.compress(body, quality=11 if best else 5)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def accepted_encodings(header: str) -> List[str]:
+    """Content codings the client accepts (q > 0), from an Accept-Encoding header."""
+    accepted = []
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.append(coding.strip().lower())
+    return accepted
+
+
+@dataclass(frozen=True)
+class Asset:
+    """A cached file: its encodings (identity first) as encoding -> (body, ETag)."""
+
+    media_type: str
+    cache_control: str
+    variants: Dict[str, Tuple[bytes, str]]
+
+    @property
+    def size(self) -> int:
+        return sum(len(body) for body, _ in self.variants.values())
+
+
+def load_asset(path: Path, key: str) -> Asset:
+    body = path.read_bytes()
+    media_type = _media_type(key)
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    variants = {"identity": (body, f'"{digest}"')}
+    if _compressible(media_type):
+        for encoding, suffix in ENCODINGS.items():
+            sibling = path.with_name(path.name + suffix)
+            if sibling.is_file() and sibling.stat().st_mtime >= path.stat().st_mtime:
+                encoded = sibling.read_bytes()
+            elif encoding == "br" and brotli is None:
+                continue
+            else:
+                encoded = _compress(encoding, body)
+            # not worth a Vary and a second copy unless it saves at least a tenth
+            if len(encoded) < len(body) * 0.9:
+                variants[encoding] = (encoded, f'"{digest}-{suffix[1:]}"')
+    cache_control = IMMUTABLE if HASHED_ASSET.match(key) else REVALIDATE
+    return Asset(media_type=media_type, cache_control=cache_control, variants=variants)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """`StaticFiles` that serves the files of `directory` from memory, precompressed."""
+
+    def __init__(self, *, directory: str | os.PathLike, html: bool = False, max_bytes: Optional[int] = None) -> None:
+        super().__init__(directory=directory, html=html)
+        self.max_bytes = STATIC_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.assets: Dict[str, Asset] = {}
+        self.cached_bytes = 0
+        self._load(Path(directory))
+
+    def _load(self, root: Path) -> None:
+        files = []
+        for path in root.rglob("*"):
+            if not path.is_file() or path.suffix in ENCODINGS.values() and path.with_suffix("").is_file():
+                continue
+            size = path.stat().st_size
+            if size <= STATIC_CACHE_MAX_FILE_BYTES:
+                files.append((size, path))
+        skipped = 0
+        # smallest first: as many files as possible fit in the budget
+        for _, path in sorted(files):
+            key = path.relative_to(root).as_posix()
+            asset = load_asset(path, key)
+            if self.cached_bytes + asset.size > self.max_bytes:
+                skipped += 1
+                continue
+            self.assets[key] = asset
+            self.cached_bytes += asset.size
+        logger.info("Static files: %d cached (%d bytes), %d served from disk", len(self.assets), self.cached_bytes, skipped)
+
+    def _lookup(self, path: str) -> Optional[Asset]:
+        key = "" if path == "." else path.replace(os.sep, "/")
+        asset = self.assets.get(key)
+        if asset is None and self.html:
+            asset = self.assets.get(f"{key}/index.html" if key else "index.html")
+        return asset
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        asset = self._lookup(path) if scope["method"] in ("GET", "HEAD") else None
+        if asset is None:
+            return await super().get_response(path, scope)
+        request = Request(scope)
+        encoding = "identity"
+        if len(asset.variants) > 1:
+            accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+            encoding = next((e for e in ENCODINGS if e in asset.variants and e in accepted), "identity")
+        body, etag = asset.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control}
+        if len(asset.variants) > 1:
+            headers["Vary"] = "Accept-Encoding"
+        # every encoding is the same content: any of their tags revalidates
+        if any(if_none_match(request, tag) for _, tag in asset.variants.values()):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if scope["method"] == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            return Response(headers=headers, media_type=asset.media_type)
+        return Response(body, headers=headers, media_type=asset.media_type)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"files": len(self.assets), "bytes": self.cached_bytes, "max_bytes": self.max_bytes}
+
+
+class CompressionMiddleware:
+    """Gzip (brotli when installed) for large application/json responses sent in one body."""
+
+    def __init__(self, app: Any, minimum_size: int = JSON_COMPRESS_MIN_BYTES, level: int = JSON_COMPRESS_LEVEL) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or self.minimum_size <= 0:
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        encoding = "br" if brotli is not None and "br" in accepted else "gzip" if "gzip" in accepted else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[dict] = None
+
+        async def send_compressed(message: dict) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if headers.get("content-type", "").startswith("application/json") and "content-encoding" not in headers:
+                    # hold back until the body shows whether it's worth compressing
+                    start = message
+                    return
+            elif message["type"] == "http.response.body" and start is not None:
+                held, start = start, None
+                body = message.get("body", b"")
+                if not message.get("more_body", False) and len(body) >= self.minimum_size:
+                    if encoding == "br":
+                        body = brotli.compress(body, quality=4)
+                    else:
+                        body = gzip.compress(body, compresslevel=self.level, mtime=0)
+                    headers = MutableHeaders(raw=held["headers"])
+                    headers.add_vary_header("Accept-Encoding")
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    message = {**message, "body": body}
+                await send(held)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+def precompress(root: Path) -> int:
+    """Write `.gz` (and `.br`) next to every compressible file under `root`; return files written."""
+    written = 0
+    for path in sorted(root.rglob("*")):
+        if not path.is_file() or path.suffix in ENCODINGS.values() or not _compressible(_media_type(path.name)):
+            continue
+        body = path.read_bytes()
+        for encoding, suffix in ENCODINGS.items():
+            if encoding == "br" and brotli is None:
+                continue
+            encoded = _compress(encoding, body, best=True)
+            if len(encoded) < len(body) * 0.9:
+                path.with_name(path.name + suffix).write_bytes(encoded)
+                written += 1
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="frontend build precompression")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("precompress", help="write .gz/.br encodings next to the build's files")
+    command.add_argument("directory", type=Path)
+    args = parser.parse_args(argv)
+    if not args.directory.is_dir():
+        parser.error(f"{args.directory} is not a directory")
+    print(f"wrote {precompress(args.directory)} encoded files{'' if brotli else ' (gzip only: brotli is not installed)'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,145 @@
+from collections import defaultdict, namedtuple
+from dataclasses import dataclass
+from datetime import datetime
 from decimal import Decimal
-from typing import Tuple
+from itertools import chain, islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 
-from sqlalchemy.orm import Session
+import os
+import uuid
+
+from sqlalchemy import func, insert, or_, select, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
 
 try:
-    from .models import AuditLog
+    from .models import AuditLog, ShardTransfer
     from ..user.models import User
+    from ..user.user_cache import user_cache
+    from ..sse.outbox import enqueue_event
+    from ..user.controller import consume_payment_grant
+    from .partitions import Segment, live_segments, overlapping, read_consistent
+    from ..serialization import money
+    from ..sharding import SHARD_COUNT, scatter, shard_for_email, shard_for_user, shard_of_session
 except Exception:
-    from transaction.models import AuditLog
+    from transaction.models import AuditLog, ShardTransfer
     from user.models import User
+    from user.user_cache import user_cache
+    from sse.outbox import enqueue_event
+    from user.controller import consume_payment_grant
+    from transaction.partitions import Segment, live_segments, overlapping, read_consistent
+    from serialization import money
+    from sharding import SHARD_COUNT, scatter, shard_for_email, shard_for_user, shard_of_session
+
+
+@dataclass(frozen=True)
+class RemoteUser:
+    """The other party of a cross-shard transfer, as seen from this shard: its balance lives
+    (and changes) in the other database."""
+
+    id: int
+    name: str
+    balance: None = None
+
+
+def _enqueue_transfer_events(db: Session, sender: Any, receiver: Any, audit_id: int, amount: Decimal, note: str | None, created_at: datetime | None) -> None:
+    """Queue the 'transfer' SSE event for both parties; sent after the transaction commits.
+
+    A `RemoteUser` party gets its event from its own shard; its balance is left out here.
+    """
+    event = {
+        "event": "transfer",
+        "sender_id": sender.id,
+        "receiver_id": receiver.id,
+        "amount": money(amount),
+        "sender_balance": money(sender.balance) if sender.balance is not None else None,
+        "receiver_balance": money(receiver.balance) if receiver.balance is not None else None,
+    }
+    tx = {
+        "id": audit_id,
+        "sender_name": sender.name,
+        "receiver_name": receiver.name,
+        "amount": money(amount),
+        "note": note,
+        "created_at": created_at.isoformat() if created_at else None,
+    }
+    if not isinstance(receiver, RemoteUser):
+        enqueue_event(db, receiver.id, {**event, "transaction": {**tx, "type": "credited"}})
+    if not isinstance(sender, RemoteUser):
+        enqueue_event(db, sender.id, {**event, "transaction": {**tx, "type": "debited"}})
+
+
+def _remote_receivers(sender_id: int, emails: Iterable[str]) -> Dict[str, RemoteUser]:
+    """The accounts among `emails` that live on another shard than the sender's, by email.
+
+    Each of those shards is asked once, in parallel. Emails without an account are left out.
+    """
+    if SHARD_COUNT == 1:
+        return {}
+    home = shard_for_user(sender_id)
+    wanted: Dict[int, Set[str]] = defaultdict(set)
+    for email in emails:
+        if shard_for_email(email) != home:
+            wanted[shard_for_email(email)].add(email)
+    if not wanted:
+        return {}
+
+    def lookup(db: Session) -> list:
+        return db.query(User.id, User.name, User.email).filter(User.email.in_(wanted[shard_of_session(db)])).all()
+
+    return {r.email: RemoteUser(id=r.id, name=r.name) for rows in scatter(lookup, wanted) for r in rows}
+
 
+def prepare_outgoing(db: Session, sender: User, receiver: RemoteUser, amount: Decimal, note: Optional[str], audit_id: int) -> str:
+    """Record the outgoing half of a cross-shard transfer in the sender's transaction.
 
-def transfer_funds(db: Session, sender: User, receiver_email: str, amount: Decimal, note: str | None = None) -> Tuple[User, User, AuditLog]:
+    The sender has been debited by the caller. The 'out' row commits or rolls back with that
+    debit; after the commit `cross_shard` applies it on the receiver's shard. Returns its id.
+    """
+    transfer_id = uuid.uuid4().hex
+    db.add(ShardTransfer(
+        id=transfer_id, direction="out", sender_id=sender.id, receiver_id=receiver.id,
+        amount=amount, note=note, state="prepared", audit_id=audit_id,
+    ))
+    db.info.setdefault("cross_shard_pending", []).append(transfer_id)
+    return transfer_id
+
+
+def apply_incoming(db: Session, transfer_id: str, sender: RemoteUser, receiver_id: int, amount: Decimal, note: Optional[str]) -> Optional[User]:
+    """Credit the receiver of a prepared cross-shard transfer, on the receiver's shard.
+
+    Idempotent: the 'in' row written with the credit marks `transfer_id` as applied, and
+    applying it again returns None. Run it with `run_transaction`.
+    """
+    # lock first: a concurrent apply of the same transfer then sees the other's 'in' row
+    receiver = db.query(User).filter(User.id == receiver_id).with_for_update().one()
+    if db.get(ShardTransfer, transfer_id) is not None:
+        return None
+    receiver.balance = (receiver.balance or Decimal("0.00")) + amount
+    receiver.version += 1
+    audit = AuditLog(sender_id=sender.id, receiver_id=receiver.id, amount=amount, status="SUCCESS", note=note)
+    db.add(audit)
+    db.flush()
+    db.add(ShardTransfer(
+        id=transfer_id, direction="in", sender_id=sender.id, receiver_id=receiver.id,
+        amount=amount, note=note, state="applied", audit_id=audit.id,
+    ))
+    user_cache.invalidate_on_commit(db, receiver.id)
+    db.flush()
+    db.refresh(receiver)
+    db.refresh(audit)
+    _enqueue_transfer_events(db, sender, receiver, audit.id, audit.amount, audit.note, audit.created_at)
+    return receiver
+
+
+def transfer_funds(db: Session, sender: Any, receiver_email: str, amount: Decimal, note: str | None = None) -> Tuple[User, User, AuditLog]:
     """Transfer amount from sender to receiver atomically.
 
+    `sender` only needs an `id` (a `User` row or an `AuthUser` snapshot).
     Raises ValueError for validation errors.
-    Returns (sender, receiver, audit_log) with refreshed balances.
+    Returns (sender, receiver, audit_log) with refreshed balances. A receiver on another shard
+    is returned as a `RemoteUser`: only the sender's side is written here, the credit follows
+    once this transaction commits (see cross_shard.py).
     """
     if amount <= Decimal("0"):
         raise ValueError("Amount must be greater than zero")
@@ -27,25 +151,33 @@ def transfer_funds(db: Session, sender: User, receiver_email: str, amount: Decim
         tx_cm = db.begin()
 
     with tx_cm:
-        # reload sender with FOR UPDATE to avoid races when supported by the DB.
-        # Some dialects (SQLite) don't support FOR UPDATE; fall back to a plain select.
-        try:
-            sender_row = db.query(User).filter(User.id == sender.id).with_for_update().one_or_none()
-        except Exception:
-            sender_row = db.query(User).filter(User.id == sender.id).one_or_none()
+        remote = None
+        if shard_for_email(receiver_email) != shard_for_user(sender.id):
+            remote = _remote_receivers(sender.id, [receiver_email]).get(receiver_email)
+            receiver_id = remote.id if remote is not None else None
+        else:
+            receiver_id = db.query(User.id).filter(User.email == receiver_email).scalar()
+        if receiver_id is None:
+            raise ValueError("Receiver not found")
+
+        # lock both rows in one query ordered by id: opposite-direction transfers between the
+        # same pair then take the locks in the same order and cannot deadlock. SQLite ignores
+        # FOR UPDATE; there `run_transaction` serializes writers with BEGIN IMMEDIATE instead.
+        locked = {
+            u.id: u
+            for u in db.query(User).filter(User.id.in_({sender.id, receiver_id})).order_by(User.id).with_for_update()
+        }
+        sender_row = locked.get(sender.id)
         if not sender_row:
             raise ValueError("Sender not found")
-        try:
-            receiver = db.query(User).filter(User.email == receiver_email).with_for_update().one_or_none()
-        except Exception:
-            receiver = db.query(User).filter(User.email == receiver_email).one_or_none()
+        receiver = remote or locked.get(receiver_id)
         if not receiver:
             raise ValueError("Receiver not found")
 
         # ensure sufficient balance
         if sender_row.balance is None:
             sender_row.balance = Decimal("0.00")
-        if receiver.balance is None:
+        if remote is None and receiver.balance is None:
             receiver.balance = Decimal("0.00")
 
         if sender_row.balance < amount:
@@ -53,18 +185,467 @@ def transfer_funds(db: Session, sender: User, receiver_email: str, amount: Decim
 
         # perform balances update
         sender_row.balance = sender_row.balance - amount
-        receiver.balance = receiver.balance + amount
+        # both users get a new balance and history row: their ETags change (rows are locked)
+        sender_row.version += 1
+        if remote is None:
+            receiver.balance = receiver.balance + amount
+            receiver.version += 1
 
         # create audit log (include optional note)
         audit = AuditLog(sender_id=sender_row.id, receiver_id=receiver.id, amount=amount, status="SUCCESS", note=note)
         db.add(audit)
 
+        # cached auth snapshots of both users now hold stale balances
+        user_cache.invalidate_on_commit(db, sender_row.id, receiver.id)
+
         # flush to assign ids
         db.flush()
 
         # refresh to get latest values
         db.refresh(sender_row)
-        db.refresh(receiver)
+        if remote is None:
+            db.refresh(receiver)
         db.refresh(audit)
+        if remote is not None:
+            prepare_outgoing(db, sender_row, remote, audit.amount, audit.note, audit.id)
+
+        # SSE notifications commit (or roll back) together with the transfer itself
+        _enqueue_transfer_events(db, sender_row, receiver, audit.id, audit.amount, audit.note, audit.created_at)
 
     return sender_row, receiver, audit
+
+
+class PaymentLimitReached(Exception):
+    """A payment session is unknown, expired or has no room left for the charge."""
+
+
+async def transfer_funds_async(db: AsyncSession, sender: Any, receiver_email: str, amount: Decimal, note: str | None = None) -> Tuple[User, User, AuditLog]:
+    """Async `transfer_funds`: the same unit of work run on an AsyncSession's connection
+    through `run_sync`, so the caller doesn't hold a thread while the database works.
+    """
+    return await db.run_sync(transfer_funds, sender, receiver_email, amount, note)
+
+
+def charge_payment_grant(db: Session, grant_id: str, user_id: int, amount: Decimal) -> None:
+    """Charge a payment session inside the caller's transaction (rolled back with it)."""
+    if not consume_payment_grant(db, grant_id, user_id, amount):
+        raise PaymentLimitReached("Payment session limit reached")
+
+
+def apply_transfer(db: Session, sender: Any, receiver_email: str, amount: Decimal, note: Optional[str] = None, grant_id: Optional[str] = None) -> dict:
+    """One /transfer unit of work: charge the payment session (if any), move the money, and
+    return the response body. The body is built here because commit expires the rows.
+    """
+    if grant_id is not None:
+        charge_payment_grant(db, grant_id, sender.id, amount)
+    sender_row, receiver, audit = transfer_funds(db, sender, receiver_email, amount, note)
+    return {
+        "sender_id": sender_row.id,
+        "receiver_id": receiver.id,
+        "amount": float(audit.amount),
+        "sender_balance": float(sender_row.balance),
+        # unknown here when the receiver is on another shard
+        "receiver_balance": float(receiver.balance) if receiver.balance is not None else None,
+    }
+
+
+# upper bound on items in one POST /transfers/batch request
+BATCH_MAX_ITEMS = int(os.getenv("TRANSFER_BATCH_MAX_ITEMS", "500"))
+
+
+def transfer_funds_batch(db: Session, sender: Any, items: List[Tuple[str, Decimal, Optional[str]]], atomic: bool = True) -> Tuple[User, List[dict]]:
+    """Apply several transfers from `sender` in one transaction.
+
+    `items` is a list of (receiver_email, amount, note). The sender and every receiver are
+    loaded and locked by a single query ordered by id, so concurrent batches touching the
+    same accounts always lock them in the same order and cannot deadlock. Items are applied
+    in order against the running sender balance and the audit rows are inserted in bulk.
+
+    Receivers on another shard are looked up there and their transfers prepared here, in the
+    same transaction (see `prepare_outgoing`), so `atomic` covers them too.
+
+    With `atomic` any failing item raises ValueError("Transfer <index>: <reason>") and nothing
+    is applied; otherwise failing items are reported and the rest go through.
+    Returns (sender, results) with one dict per item: index, status ('ok'|'failed'),
+    receiver_id, amount, audit_id, error.
+    """
+    if not items:
+        raise ValueError("No transfers given")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f"At most {BATCH_MAX_ITEMS} transfers per batch")
+
+    if db.in_transaction():
+        tx_cm = db.begin_nested()
+    else:
+        tx_cm = db.begin()
+
+    with tx_cm:
+        emails = {email for email, _, _ in items}
+        remote = _remote_receivers(sender.id, emails)
+        home = shard_for_user(sender.id)
+        local_emails = {email for email in emails if shard_for_email(email) == home}
+        users = (
+            db.query(User)
+            .filter(or_(User.id == sender.id, User.email.in_(local_emails)))
+            .order_by(User.id)
+            .with_for_update()
+            .all()
+        )
+        by_id = {u.id: u for u in users}
+        by_email: Dict[str, Any] = {**remote, **{u.email: u for u in users}}
+
+        sender_row = by_id.get(sender.id)
+        if not sender_row:
+            raise ValueError("Sender not found")
+        for u in users:
+            if u.balance is None:
+                u.balance = Decimal("0.00")
+
+        results: List[dict] = []
+        applied: List[Tuple[int, User, Decimal, Optional[str]]] = []
+        for index, (email, amount, note) in enumerate(items):
+            result = {"index": index, "status": "ok", "receiver_id": None, "amount": float(amount), "audit_id": None, "error": None}
+            results.append(result)
+            receiver = by_email.get(email)
+            if amount <= Decimal("0"):
+                error = "Amount must be greater than zero"
+            elif receiver is None:
+                error = "Receiver not found"
+            elif sender_row.balance < amount:
+                error = "Insufficient balance"
+            else:
+                error = None
+            if error:
+                if atomic:
+                    raise ValueError(f"Transfer {index}: {error}")
+                result.update(status="failed", error=error)
+                continue
+
+            sender_row.balance = sender_row.balance - amount
+            if not isinstance(receiver, RemoteUser):
+                receiver.balance = receiver.balance + amount
+            result["receiver_id"] = receiver.id
+            applied.append((index, receiver, amount, note))
+
+        if applied:
+            local = {receiver for _, receiver, _, _ in applied if not isinstance(receiver, RemoteUser)}
+            for u in {sender_row, *local}:
+                u.version += 1
+            # one multi-row INSERT; RETURNING rows come back in parameter order
+            inserted = db.execute(
+                insert(AuditLog).returning(AuditLog.id, AuditLog.created_at, sort_by_parameter_order=True),
+                [
+                    {"sender_id": sender_row.id, "receiver_id": receiver.id, "amount": amount, "status": "SUCCESS", "note": note}
+                    for _, receiver, amount, note in applied
+                ],
+            ).all()
+            db.flush()
+
+            for (index, receiver, amount, note), row in zip(applied, inserted):
+                results[index]["audit_id"] = row.id
+                if isinstance(receiver, RemoteUser):
+                    prepare_outgoing(db, sender_row, receiver, amount, note, row.id)
+                _enqueue_transfer_events(db, sender_row, receiver, row.id, amount, note, row.created_at)
+
+            user_cache.invalidate_on_commit(db, sender_row.id, *{receiver.id for receiver in local})
+
+    return sender_row, results
+
+
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 200
+CHANGES_MAX_LIMIT = 500
+# rows fetched per round trip by iter_statement (GET /transactions/export)
+EXPORT_BATCH_SIZE = max(1, int(os.getenv("TRANSACTION_EXPORT_BATCH_SIZE", "1000")))
+
+
+def encode_history_cursor(created_at: datetime, audit_id: int) -> str:
+    """Encode the position of a history row as `<created_at ISO>,<id>`."""
+    return f"{created_at.isoformat()},{audit_id}"
+
+
+def decode_history_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Parse a cursor produced by `encode_history_cursor`.
+
+    Raises ValueError for malformed cursors.
+    """
+    try:
+        raw_ts, raw_id = cursor.rsplit(",", 1)
+        # an unencoded "+" in the UTC offset arrives as a space after URL decoding
+        return datetime.fromisoformat(raw_ts.strip().replace(" ", "+")), int(raw_id)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def _history_query(db: Session):
+    """History rows with both counterparty names joined in."""
+    sender_user = aliased(User)
+    receiver_user = aliased(User)
+    return (
+        db.query(
+            AuditLog.id,
+            AuditLog.sender_id,
+            AuditLog.receiver_id,
+            AuditLog.amount,
+            AuditLog.note,
+            AuditLog.created_at,
+            sender_user.name.label("sender_name"),
+            receiver_user.name.label("receiver_name"),
+        )
+        .join(sender_user, sender_user.id == AuditLog.sender_id)
+        .join(receiver_user, receiver_user.id == AuditLog.receiver_id)
+    )
+
+
+_HISTORY_COLUMNS = ("id", "sender_id", "receiver_id", "amount", "note", "created_at")
+
+
+def _window(
+    table: Any,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+) -> List[Any]:
+    """created_at window (`start` inclusive, `end` exclusive) and keyset cursor conditions on
+    `table` (audit_logs or one of its segments)."""
+    c = table.c
+    where = []
+    if start is not None:
+        where.append(c.created_at >= start)
+    if end is not None:
+        where.append(c.created_at < end)
+    if before is not None:
+        where.append(tuple_(c.created_at, c.id) < tuple_(*before, types=[c.created_at.type, c.id.type]))
+        # a plain bound as well: Postgres prunes partitions on it, not on the row comparison
+        where.append(c.created_at <= before[0])
+    return where
+
+
+def _user_branches(
+    table: Any,
+    user_id: int,
+    direction: Optional[str] = None,
+    counterparty_id: Optional[int] = None,
+    where: Sequence[Any] = (),
+    order_by: Sequence[Any] = (),
+    limit: Optional[int] = None,
+) -> List[Any]:
+    """The user's rows in `table` as one select per side of the transfer.
+
+    `sender_id = u OR receiver_id = u` can't walk one index in (created_at, id) order, so it
+    degrades to a scan and sort as audit_logs grows. Instead the sent side is read from
+    ix_audit_logs_sender_created and the received side from ix_audit_logs_receiver_created,
+    each already in order and cut at `limit`; `_merge` combines them with UNION ALL.
+    """
+    c = table.c
+    sides = []
+    if direction in (None, "debited"):
+        sides.append([c.sender_id == user_id] + ([c.receiver_id == counterparty_id] if counterparty_id is not None else []))
+    if direction in (None, "credited"):
+        side = [c.receiver_id == user_id] + ([c.sender_id == counterparty_id] if counterparty_id is not None else [])
+        if sides:
+            # a row on both sides would otherwise be listed twice
+            side.append(c.sender_id != user_id)
+        sides.append(side)
+    if not sides:
+        raise ValueError("direction must be 'debited' or 'credited'")
+
+    branches = []
+    for side in sides:
+        branch = select(*(c[name] for name in _HISTORY_COLUMNS)).where(*side, *where).order_by(*order_by)
+        if limit is not None:
+            branch = branch.limit(limit)
+        branches.append(branch)
+    return branches
+
+
+def _merge(branches: List[Any]):
+    """The rows of `branches` as one subquery. Rows are not joined to users here; callers join
+    names onto the (small) merged result."""
+    if len(branches) == 1:
+        return branches[0].subquery("history")
+    # SQLite doesn't allow ORDER BY / LIMIT on the members of a compound select directly
+    return union_all(*[select(*branch.subquery().c) for branch in branches]).subquery("history")
+
+
+def _with_names(db: Session, rows):
+    """Query over the `rows` subquery with both counterparty names joined in.
+
+    Outer joins: a counterparty on another shard isn't in this database, its name stays NULL
+    until `_fill_names`.
+    """
+    sender_user = aliased(User)
+    receiver_user = aliased(User)
+    return (
+        db.query(*rows.c, sender_user.name.label("sender_name"), receiver_user.name.label("receiver_name"))
+        .outerjoin(sender_user, sender_user.id == rows.c.sender_id)
+        .outerjoin(receiver_user, receiver_user.id == rows.c.receiver_id)
+    )
+
+
+HistoryRow = namedtuple("HistoryRow", (*_HISTORY_COLUMNS, "sender_name", "receiver_name"))
+
+
+def _user_names(user_ids: Set[int]) -> Dict[int, str]:
+    """Names of `user_ids` by primary key, from the shards they live on."""
+    wanted: Dict[int, Set[int]] = defaultdict(set)
+    for user_id in user_ids:
+        wanted[shard_for_user(user_id)].add(user_id)
+
+    def lookup(db: Session) -> list:
+        return db.query(User.id, User.name).filter(User.id.in_(wanted[shard_of_session(db)])).all()
+
+    return {r.id: r.name for rows in scatter(lookup, wanted) for r in rows}
+
+
+def _fill_names(rows: List[Any]) -> List[Any]:
+    """`rows` of `_with_names` with the names of counterparties on other shards filled in."""
+    missing = {r.sender_id for r in rows if r.sender_name is None} | {r.receiver_id for r in rows if r.receiver_name is None}
+    if not missing:
+        return rows
+    names = _user_names(missing)
+    return [
+        r if r.sender_name is not None and r.receiver_name is not None
+        else HistoryRow(*r[:len(_HISTORY_COLUMNS)], r.sender_name or names.get(r.sender_id), r.receiver_name or names.get(r.receiver_id))
+        for r in rows
+    ]
+
+
+def list_transactions(
+    db: Session,
+    user_id: int,
+    limit: int = HISTORY_DEFAULT_LIMIT,
+    before: Optional[Tuple[datetime, int]] = None,
+    direction: Optional[str] = None,
+    counterparty_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> Tuple[List[Any], Optional[str]]:
+    """Return one page of the user's history, newest first, and the cursor of the next page.
+
+    Rows are ordered by (created_at, id) descending and paged by keyset, so the cost of a
+    page does not depend on how far back it is. Counterparty names are joined in the same
+    query. `direction` is 'debited' (sent) or 'credited' (received); `start` is inclusive
+    and `end` exclusive. Segments of the audit log (see partitions.py) are read newest
+    first, skipping those outside the window, until one can no longer reach the page.
+    """
+    limit = max(1, min(int(limit), HISTORY_MAX_LIMIT))
+
+    def page(segments: List[Segment]) -> List[Any]:
+        # fetch one extra row to learn whether another page exists
+        rows: List[Any] = []
+        for segment in overlapping(segments, start, end, before[0] if before is not None else None):
+            # every row of this segment is older than its end
+            if len(rows) > limit and segment.ends is not None and segment.ends <= rows[limit].created_at:
+                break
+            t = segment.table
+            merged = _merge(_user_branches(
+                t, user_id, direction, counterparty_id, _window(t, start, end, before),
+                order_by=(t.c.created_at.desc(), t.c.id.desc()), limit=limit + 1,
+            ))
+            rows += _with_names(db, merged).order_by(merged.c.created_at.desc(), merged.c.id.desc()).limit(limit + 1).all()
+            rows = sorted(rows, key=lambda r: (r.created_at, r.id), reverse=True)[: limit + 1]
+        return rows
+
+    rows = read_consistent(db, page)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_history_cursor(last.created_at, last.id)
+    return _fill_names(rows), next_cursor
+
+
+async def list_transactions_async(db: AsyncSession, user_id: int, **filters: Any) -> Tuple[List[Any], Optional[str]]:
+    """Async `list_transactions` on an AsyncSession; accepts the same keyword filters."""
+    return await db.run_sync(list_transactions, user_id, **filters)
+
+
+def transaction_totals(
+    db: Session, user_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """Amount sent, amount received and number of rows over the user's whole history (or the
+    `start`..`end` window), computed in the database rather than from a page of rows.
+
+    Each side is aggregated over the same per-side selects as `list_transactions`, so a
+    transfer to oneself counts once, as sent.
+    """
+
+    def totals(segments: List[Segment]) -> Dict[str, Any]:
+        out = {"sent": Decimal("0.00"), "received": Decimal("0.00"), "count": 0}
+        for segment in overlapping(segments, start, end):
+            t = segment.table
+            sent, received = _user_branches(t, user_id, where=_window(t, start, end))
+            for key, branch in (("sent", sent), ("received", received)):
+                rows = branch.subquery()
+                amount, count = db.execute(select(func.sum(rows.c.amount), func.count()).select_from(rows)).one()
+                out[key] += amount or 0
+                out["count"] += count
+        return out
+
+    return read_consistent(db, totals)
+
+
+def iter_statement(
+    db: Session,
+    user_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[Any]:
+    """Yield all of the user's history rows, oldest first, with counterparty names joined in.
+
+    Rows come off a server-side cursor `batch_size` at a time (`yield_per`), so only one
+    batch is held in memory however long the history is. All segments in the window are
+    merged in one ordered statement. `start` is inclusive, `end` exclusive.
+    """
+    while True:
+        segments = live_segments(db)
+        branches = []
+        for segment in overlapping(segments, start, end):
+            t = segment.table
+            branches += _user_branches(t, user_id, where=_window(t, start, end), order_by=(t.c.created_at, t.c.id))
+        merged = _merge(branches)
+        rows = iter(_with_names(db, merged).order_by(merged.c.created_at, merged.c.id).yield_per(batch_size))
+        first = next(rows, None)
+        # the statement is running now; if no month moved since `segments` was read, it sees them all
+        if segments == live_segments(db):
+            break
+    if first is not None:
+        rows = chain([first], rows)
+        # names from other shards are looked up a batch at a time
+        for batch in iter(lambda: list(islice(rows, batch_size)), []):
+            yield from _fill_names(batch)
+
+
+def list_transaction_changes(db: Session, user_id: int, since: int = 0, limit: int = CHANGES_MAX_LIMIT) -> Tuple[List[Any], Optional[Decimal], bool]:
+    """Return the user's history rows with id > `since` (oldest first), their balance, and
+    whether more rows remain beyond `limit`.
+
+    AuditLog ids only grow and rows are never updated or deleted, so the id of the last row a
+    client has seen is a complete sync cursor. Each side is read separately (see
+    `_user_branches`) and cut at `limit` before the merge; segments wholly at or below
+    `since` are skipped, the rest read in id order until the page is full.
+    """
+    limit = max(1, min(int(limit), CHANGES_MAX_LIMIT))
+
+    def page(segments: List[Segment]) -> List[Any]:
+        candidates = [s for s in segments if s.max_id is None or s.max_id > since]
+        # the hot table holds the newest ids
+        candidates.sort(key=lambda s: (s.min_id is None, s.min_id or 0))
+        rows: List[Any] = []
+        for segment in candidates:
+            if len(rows) > limit and segment.min_id is not None and segment.min_id > rows[limit].id:
+                break
+            t = segment.table
+            merged = _merge(_user_branches(t, user_id, where=[t.c.id > since], order_by=(t.c.id,), limit=limit + 1))
+            rows += _with_names(db, merged).order_by(merged.c.id).limit(limit + 1).all()
+            rows = sorted(rows, key=lambda r: r.id)[: limit + 1]
+        return rows
+
+    rows = read_consistent(db, page)
+    has_more = len(rows) > limit
+    rows = _fill_names(rows[:limit])
+
+    balance = db.query(User.balance).filter(User.id == user_id).scalar()
+    return rows, balance, has_more
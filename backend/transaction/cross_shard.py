@@ -0,0 +1,193 @@
+"""
+cross_shard.py
+
+Transfers between users on different shards (see sharding.py).
+
+One database transaction can't span two shards, so such a transfer is two local transactions
+tied together by a recovery log, the `shard_transfers` table of each shard:
+
+1. Prepare, on the sender's shard, in the transfer's own transaction (`transfer_funds` /
+   `transfer_funds_batch`): the sender is debited and gets their audit row and SSE event,
+   and an 'out' row records the transfer as 'prepared'. If anything fails nothing happened.
+2. Apply, on the receiver's shard (`controller.apply_incoming`): the receiver is credited and
+   gets their audit row and SSE event, and an 'in' row with the same id is written in the same
+   transaction. Applying a transfer whose 'in' row exists does nothing, so this step can be
+   retried, and run by several workers, safely.
+3. Commit, on the sender's shard: the 'out' row is marked 'committed'.
+
+Once step 1 has committed the transfer is decided; it is only ever rolled forward, never
+back. The receiver was found before the prepare and accounts are never deleted, so step 2
+cannot be refused. Steps 2 and 3 run right after step 1 commits, before the response is sent.
+If the worker dies in between or a shard is unreachable, `CrossShardRecovery` (every worker,
+at startup and then every CROSS_SHARD_RECOVERY_SECONDS) finds 'out' rows still 'prepared'
+after that long and completes them. Until then the money is debited but not yet credited;
+balances across shards add up again once every 'out' row is committed.
+
+Each side's audit row has an id from its own shard, so a user's history, /transactions/changes
+cursors and SSE event ids stay on the user's shard.
+
+Configuration (environment):
+- CROSS_SHARD_RECOVERY_SECONDS: sweep interval, and how old a 'prepared' row must be before
+  the sweep takes it over from the request that created it (default 5).
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, SessionTransaction
+
+try:
+    from ..database import SHARDED, run_transaction
+    from ..sharding import SHARD_COUNT, scatter, session_for_shard, shard_for_user, shard_of_session
+    from ..user.models import User
+    from .controller import RemoteUser, apply_incoming
+    from .models import ShardTransfer
+except Exception:
+    from database import SHARDED, run_transaction
+    from sharding import SHARD_COUNT, scatter, session_for_shard, shard_for_user, shard_of_session
+    from user.models import User
+    from transaction.controller import RemoteUser, apply_incoming
+    from transaction.models import ShardTransfer
+
+logger = logging.getLogger(__name__)
+
+# prepared transfers taken per shard and sweep
+RECOVERY_BATCH = 500
+
+
+def _mark_committed(db: Session, transfer_id: str) -> None:
+    db.query(ShardTransfer).filter(ShardTransfer.id == transfer_id, ShardTransfer.state == "prepared").update(
+        {ShardTransfer.state: "committed", ShardTransfer.completed_at: func.now()}, synchronize_session=False
+    )
+
+
+def complete(shard: int, transfer_id: str) -> bool:
+    """Apply the prepared transfer `transfer_id` of `shard` on the receiver's shard and mark it
+    committed. Returns False if it was already committed (or doesn't exist)."""
+    db = session_for_shard(shard)
+    try:
+        transfer = (
+            db.query(
+                ShardTransfer.state, ShardTransfer.sender_id, ShardTransfer.receiver_id,
+                ShardTransfer.amount, ShardTransfer.note, User.name.label("sender_name"),
+            )
+            .join(User, User.id == ShardTransfer.sender_id)
+            .filter(ShardTransfer.id == transfer_id, ShardTransfer.direction == "out")
+            .first()
+        )
+        # end the read: the update below runs in its own write transaction
+        db.rollback()
+        if transfer is None or transfer.state != "prepared":
+            return False
+        target = session_for_shard(shard_for_user(transfer.receiver_id))
+        try:
+            run_transaction(
+                target, apply_incoming, transfer_id, RemoteUser(id=transfer.sender_id, name=transfer.sender_name),
+                transfer.receiver_id, transfer.amount, transfer.note,
+            )
+        finally:
+            target.close()
+        run_transaction(db, _mark_committed, transfer_id)
+        return True
+    finally:
+        db.close()
+
+
+class CrossShardRecovery:
+    def __init__(self) -> None:
+        self.interval = float(os.getenv("CROSS_SHARD_RECOVERY_SECONDS", "5"))
+        self._task: asyncio.Task | None = None
+        # counters for observability
+        self.completed = 0
+        self.recovered = 0
+        self.failed = 0
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        if not SHARDED or self._task is not None:
+            return
+        self._task = loop.create_task(self._run())
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def complete_after_commit(self, shard: int, transfer_ids: List[str]) -> None:
+        """Steps 2 and 3 for transfers the request just prepared; failures are left to `recover`."""
+        for transfer_id in transfer_ids:
+            try:
+                complete(shard, transfer_id)
+                self.completed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Cross-shard transfer %s not completed; recovery will retry it", transfer_id)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.recover)
+            except Exception:
+                logger.exception("Cross-shard recovery failed")
+            await asyncio.sleep(self.interval)
+
+    def recover(self) -> int:
+        """Complete the transfers prepared more than `interval` seconds ago; return how many."""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.interval)
+        recovered = 0
+        for shard in range(SHARD_COUNT):
+            db = session_for_shard(shard)
+            try:
+                stuck = [
+                    r.id
+                    for r in db.query(ShardTransfer.id)
+                    .filter(ShardTransfer.state == "prepared", ShardTransfer.created_at < cutoff)
+                    .order_by(ShardTransfer.created_at)
+                    .limit(RECOVERY_BATCH)
+                ]
+            finally:
+                db.close()
+            for transfer_id in stuck:
+                try:
+                    recovered += complete(shard, transfer_id)
+                except Exception:
+                    self.failed += 1
+                    logger.exception("Recovery of cross-shard transfer %s failed", transfer_id)
+        if recovered:
+            logger.info("Completed %d cross-shard transfers left prepared", recovered)
+        self.recovered += recovered
+        return recovered
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"shards": SHARD_COUNT}
+        if SHARDED:
+            out.update(
+                completed=self.completed,
+                recovered=self.recovered,
+                failed=self.failed,
+                # across all workers: debited but not yet credited
+                prepared=sum(scatter(lambda db: db.query(func.count(ShardTransfer.id)).filter(ShardTransfer.state == "prepared").scalar())),
+            )
+        return out
+
+
+cross_shard_recovery = CrossShardRecovery()
+
+
+@event.listens_for(Session, "after_commit")
+def _complete_after_commit(session: Session) -> None:
+    # also called when a SAVEPOINT is released; the transfers wait for the real commit
+    if session.in_nested_transaction():
+        return
+    pending = session.info.pop("cross_shard_pending", None)
+    if pending:
+        cross_shard_recovery.complete_after_commit(shard_of_session(session), pending)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_after_rollback(session: Session, previous_transaction: SessionTransaction) -> None:
+    if previous_transaction.parent is None:
+        session.info.pop("cross_shard_pending", None)
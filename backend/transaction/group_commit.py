@@ -0,0 +1,144 @@
+"""
+group_commit.py
+
+Optional group-commit pipeline for /transfer.
+
+With one writer at a time (SQLite), every transfer committing on its own pays a full disk
+sync and contends for the write lock. When enabled, /transfer hands its validated request to
+`transfer_writer` instead: a single writer task collects whatever transfers are queued (up to
+a batch limit, optionally waiting a little for more), applies them in one transaction with a
+savepoint per transfer, commits once, and resolves each request's future with its own result
+or error. A transfer that fails validation only rolls back its own savepoint.
+
+Configuration (environment):
+- TRANSFER_GROUP_COMMIT: '1' to route /transfer through the writer (default off). The
+  writer commits on shard 0 only, so it stays off with DB_SHARDS.
+- TRANSFER_GROUP_COMMIT_MAX_BATCH: transfers per transaction (default 64).
+- TRANSFER_GROUP_COMMIT_MAX_WAIT_MS: how long the writer waits for a batch to fill
+  before committing a partial one (default 0: commit whatever queued up meanwhile).
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+try:
+    from ..database import SessionLocal, SHARDED, run_transaction
+    from .controller import apply_transfer, PaymentLimitReached
+except Exception:
+    from database import SessionLocal, SHARDED, run_transaction
+    from transaction.controller import apply_transfer, PaymentLimitReached
+
+logger = logging.getLogger(__name__)
+
+
+class GroupCommitWriter:
+    def __init__(self) -> None:
+        self.enabled = os.getenv("TRANSFER_GROUP_COMMIT", "0").lower() in ("1", "true", "yes")
+        if self.enabled and SHARDED:
+            logger.warning("TRANSFER_GROUP_COMMIT is not supported with DB_SHARDS; transfers commit one by one")
+            self.enabled = False
+        self.max_batch = max(1, int(os.getenv("TRANSFER_GROUP_COMMIT_MAX_BATCH", "64")))
+        self.max_wait = max(0.0, float(os.getenv("TRANSFER_GROUP_COMMIT_MAX_WAIT_MS", "0")) / 1000)
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        # one thread does all the writing, so batches never contend with each other
+        self._executor: ThreadPoolExecutor | None = None
+        # counters for observability
+        self.batches = 0
+        self.transfers = 0
+        self.largest_batch = 0
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transfer-writer")
+        self._task = loop.create_task(self._run())
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError("Transfer writer stopped"))
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def submit(self, sender: Any, receiver_email: str, amount: Decimal, note: Optional[str], grant_id: Optional[str]) -> dict:
+        """Queue one transfer and wait for the commit of the batch it lands in.
+
+        Returns the same body as `apply_transfer`; raises its ValueError / PaymentLimitReached.
+        """
+        if self._queue is None:
+            raise RuntimeError("Transfer writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(((sender, receiver_email, amount, note, grant_id), future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            if self.max_wait and self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                outcomes = await loop.run_in_executor(self._executor, self._commit, [args for args, _ in batch])
+            except Exception as exc:
+                # the whole transaction failed (after retries): every transfer in it failed
+                logger.exception("Group commit of %d transfers failed", len(batch))
+                outcomes = [(False, exc)] * len(batch)
+
+            self.batches += 1
+            self.transfers += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            for (_, future), (ok, value) in zip(batch, outcomes):
+                if future.done():
+                    # the request was cancelled (client went away); its transfer still committed
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _commit(self, items: List[tuple]) -> List[Tuple[bool, Any]]:
+        db = SessionLocal()
+        try:
+            return run_transaction(db, self._apply_all, items)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _apply_all(db: Session, items: List[tuple]) -> List[Tuple[bool, Any]]:
+        outcomes: List[Tuple[bool, Any]] = []
+        for sender, receiver_email, amount, note, grant_id in items:
+            try:
+                with db.begin_nested():
+                    outcomes.append((True, apply_transfer(db, sender, receiver_email, amount, note, grant_id)))
+            except (ValueError, PaymentLimitReached) as exc:
+                outcomes.append((False, exc))
+        return outcomes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "transfers": self.transfers,
+            "avg_batch": round(self.transfers / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
+
+
+transfer_writer = GroupCommitWriter()
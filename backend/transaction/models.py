@@ -10,20 +10,39 @@ from sqlalchemy import (
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
 
 try:
-    from ..database import Base
+    from ..database import Base, IS_SQLITE, SHARDED
 except Exception:
-    from database import Base
+    from database import Base, IS_SQLITE, SHARDED
+
+
+# SQLite stores the CURRENT_TIMESTAMP server default as second-precision text. Bind
+# parameters must use the same text format so keyset comparisons on created_at
+# (history cursors) compare equal values as equal.
+Timestamp = DateTime(timezone=True).with_variant(
+    SQLITE_DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d",
+    ),
+    "sqlite",
+)
+
+
+def _user_fk() -> list:
+    # on a shard, the other party of a transfer may be a user of another database
+    return [] if SHARDED else [ForeignKey("users.id", ondelete="RESTRICT")]
 
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    # monthly range partitions on Postgres (see partitions.py); SQLite ignores this
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
 
-    sender_id = Column(Integer, ForeignKey("users.id", ondelete="RESTRICT"), nullable=False)
-    receiver_id = Column(Integer, ForeignKey("users.id", ondelete="RESTRICT"), nullable=False)
+    sender_id = Column(Integer, *_user_fk(), nullable=False)
+    receiver_id = Column(Integer, *_user_fk(), nullable=False)
 
     amount = Column(Numeric(18, 2), nullable=False)
 
@@ -32,17 +51,24 @@ class AuditLog(Base):
 
     status = Column(String(20), nullable=False)
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Postgres requires the partition key in the primary key. SQLite keeps `id` alone as the
+    # primary key so it stays the autoincrementing rowid.
+    created_at = Column(Timestamp, server_default=func.now(), nullable=False, primary_key=not IS_SQLITE)
+
+    sender = relationship("User", primaryjoin="foreign(AuditLog.sender_id) == User.id", back_populates="sent_logs")
+    receiver = relationship("User", primaryjoin="foreign(AuditLog.receiver_id) == User.id", back_populates="received_logs")
 
-    sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_logs")
-    receiver = relationship("User", foreign_keys=[receiver_id], back_populates="received_logs")
+    # rows are identified by id alone, whatever the table's primary key
+    __mapper_args__ = {"primary_key": [id]}
 
     def __repr__(self) -> str:  # pragma: no cover - convenience
         return f"<AuditLog id={self.id} {self.sender_id}->{self.receiver_id} amount={self.amount} status={self.status}>"
 
 
-Index("ix_audit_logs_sender", AuditLog.sender_id)
-Index("ix_audit_logs_receiver", AuditLog.receiver_id)
+# one ordered range per side of a user's history (see controller._user_branches); they also
+# serve the sender/receiver foreign keys
+Index("ix_audit_logs_sender_created", AuditLog.sender_id, AuditLog.created_at, AuditLog.id)
+Index("ix_audit_logs_receiver_created", AuditLog.receiver_id, AuditLog.created_at, AuditLog.id)
 Index("ix_audit_logs_created", AuditLog.created_at)
 
 
@@ -54,3 +80,61 @@ def _prevent_audit_update(mapper, connection, target):
 @event.listens_for(AuditLog, "before_delete", propagate=True)
 def _prevent_audit_delete(mapper, connection, target):
     raise ValueError("AuditLog is immutable: delete operations are not allowed")
+
+
+class AuditSegment(Base):
+    """One month of audit_logs moved out of the hot table (see partitions.py): a live SQLite
+    segment table, or an archive file once the month has gone cold."""
+
+    __tablename__ = "audit_segments"
+
+    # table name, audit_logs_YYYYMM
+    name = Column(String(32), primary_key=True)
+    starts = Column(Timestamp, nullable=False)
+    ends = Column(Timestamp, nullable=False)
+    # 'live' (segment table) or 'archived' (file)
+    state = Column(String(10), nullable=False)
+
+    rows = Column(Integer, nullable=False)
+    min_id = Column(Integer, nullable=True)
+    max_id = Column(Integer, nullable=True)
+
+    archive_path = Column(String(512), nullable=True)
+    sha256 = Column(String(64), nullable=True)
+
+    sealed_at = Column(Timestamp, server_default=func.now(), nullable=False)
+    archived_at = Column(Timestamp, nullable=True)
+
+
+class ShardTransfer(Base):
+    """Recovery log of a transfer between users on different shards (see cross_shard.py).
+
+    The sender's shard gets an 'out' row in the transaction that debits the sender; the
+    receiver's shard gets an 'in' row with the same id in the transaction that credits the
+    receiver, so a transfer is never applied twice.
+    """
+
+    __tablename__ = "shard_transfers"
+
+    # uuid4 hex, the same on both shards
+    id = Column(String(32), primary_key=True)
+    # 'out' on the sender's shard, 'in' on the receiver's
+    direction = Column(String(3), nullable=False)
+    sender_id = Column(Integer, nullable=False)
+    receiver_id = Column(Integer, nullable=False)
+    amount = Column(Numeric(18, 2), nullable=False)
+    note = Column(String(512), nullable=True)
+    # 'out': 'prepared' until the receiver's shard applied it, then 'committed'; 'in': 'applied'
+    state = Column(String(10), nullable=False)
+    # this shard's audit_logs row of the transfer
+    audit_id = Column(Integer, nullable=True)
+
+    created_at = Column(Timestamp, server_default=func.now(), nullable=False)
+    completed_at = Column(Timestamp, nullable=True)
+
+    def __repr__(self) -> str:  # pragma: no cover - convenience
+        return f"<ShardTransfer id={self.id} {self.direction} {self.sender_id}->{self.receiver_id} {self.state}>"
+
+
+# the recovery sweep looks for old 'prepared' rows
+Index("ix_shard_transfers_state", ShardTransfer.state, ShardTransfer.created_at)
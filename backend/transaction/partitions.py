@@ -0,0 +1,578 @@
+"""
+partitions.py
+
+Monthly partitioning and cold archival of audit_logs.
+
+AuditLog rows are never updated or deleted, so the table only grows, and with it index
+maintenance and vacuum work. Rows are split by the month of created_at:
+
+- Postgres: audit_logs is a partitioned table (PARTITION BY RANGE (created_at), declared on
+  the model) with one partition per month, `audit_logs_YYYYMM`, and a default partition as a
+  safety net. `install_partitions` creates the partitions for the current month and
+  AUDIT_PARTITIONS_AHEAD months ahead. The planner prunes partitions using the created_at
+  bounds of each query (from/to and the history cursor).
+- SQLite has no partitioning. The app keeps writing to `audit_logs` (the hot table), and
+  `seal_months` moves each complete month before the newest row's month into a segment table
+  `audit_logs_YYYYMM`. Segment tables have the same columns and indexes, and each one is
+  recorded in `audit_segments`. History queries read the hot table and the segments that
+  overlap their window (`live_segments`, `overlapping`), newest first. They stop as soon as
+  the page is full.
+
+`archive_months` takes months older than AUDIT_HOT_MONTHS out of the database. The rows are
+written to `AUDIT_ARCHIVE_DIR/audit_logs_YYYYMM.ndjson.gz` (read-only, never overwritten),
+then read back and counted. Only then is the partition or segment dropped. The file's SHA-256
+and row count stay in `audit_segments`, and `verify_archives` rechecks them. Archived months
+are no longer served by /transactions, /transactions/changes or the export.
+
+Immutability is enforced by the database as well as by the ORM listeners in models.py:
+- Postgres: a BEFORE UPDATE OR DELETE row trigger on audit_logs, which every partition
+  inherits (PostgreSQL 13+), plus a TRUNCATE trigger. Archival detaches and drops whole
+  partitions, which deletes no rows.
+- SQLite: triggers reject UPDATE on the hot table and UPDATE and DELETE on segments. A row
+  can only be deleted from the hot table once its month is registered in audit_segments.
+  That happens only in `seal_months`, in the same transaction that copied the row.
+
+With DB_SHARDS every shard has its own audit_logs; the commands below go through all of them,
+and shard k > 0 archives to AUDIT_ARCHIVE_DIR/shard<k>/.
+
+Run the maintenance monthly (e.g. from cron), from backend/:
+    python -m transaction.partitions maintain   # Postgres: partitions ahead + archive; SQLite: seal + archive
+    python -m transaction.partitions status     # segments, partitions, archive checksums (exit 1 on mismatch)
+    python -m transaction.partitions migrate    # Postgres: partition an existing audit_logs (app stopped)
+
+Configuration (environment):
+- AUDIT_HOT_MONTHS: months kept in the database, including the current one (default 24).
+- AUDIT_ARCHIVE_DIR: where archives are written (default ./audit_archive).
+- AUDIT_PARTITIONS_AHEAD: future monthly partitions kept ready on Postgres (default 3).
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import Column, Index, MetaData, Table, and_, delete, func, insert, select, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+try:
+    from ..database import IS_SQLITE, OBSOLETE_INDEXES, shard_engines
+    from .models import AuditLog, AuditSegment
+except Exception:
+    from database import IS_SQLITE, OBSOLETE_INDEXES, shard_engines
+    from transaction.models import AuditLog, AuditSegment
+
+logger = logging.getLogger(__name__)
+
+AUDIT_HOT_MONTHS = max(1, int(os.getenv("AUDIT_HOT_MONTHS", "24")))
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "./audit_archive")
+AUDIT_PARTITIONS_AHEAD = max(0, int(os.getenv("AUDIT_PARTITIONS_AHEAD", "3")))
+# rows per fetch while writing an archive
+ARCHIVE_BATCH_SIZE = 5000
+
+T = TypeVar("T")
+
+_NAME = re.compile(r"^audit_logs_(\d{4})(\d{2})$")
+
+
+@dataclass(frozen=True)
+class Segment:
+    """A table holding part of the online audit log.
+
+    `starts`/`ends` bound its created_at (end exclusive) and `min_id`/`max_id` its ids;
+    None means unbounded (the hot table).
+    """
+
+    table: Table
+    starts: Optional[datetime] = None
+    ends: Optional[datetime] = None
+    min_id: Optional[int] = None
+    max_id: Optional[int] = None
+
+
+HOT = Segment(AuditLog.__table__)
+
+
+def month_start(moment: datetime) -> datetime:
+    """First instant of `moment`'s month, UTC (naive datetimes are taken as UTC)."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"audit_logs_{month:%Y%m}"
+
+
+def _month_of(name: str) -> Optional[datetime]:
+    match = _NAME.match(name)
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc) if match else None
+
+
+def _naive_utc(moment: datetime) -> datetime:
+    # segment bounds come back from SQLite as naive UTC
+    return moment.astimezone(timezone.utc).replace(tzinfo=None) if moment.tzinfo is not None else moment
+
+
+_segment_metadata = MetaData()
+_segment_lock = threading.Lock()
+
+
+def segment_table(name: str) -> Table:
+    """Table for one month of audit_logs under `name`: the same columns and indexes (no foreign
+    keys; the rows were checked when they were written)."""
+    with _segment_lock:
+        table = _segment_metadata.tables.get(name)
+        if table is None:
+            source = AuditLog.__table__
+            table = Table(
+                name, _segment_metadata,
+                *(Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in source.columns),
+            )
+            for index in source.indexes:
+                Index(index.name.replace(source.name, name, 1), *(table.c[c.name] for c in index.columns))
+        return table
+
+
+# --- reading ----------------------------------------------------------------------------
+
+def live_segments(db: Session) -> List[Segment]:
+    """Tables holding the online audit log: the hot table, then SQLite segments newest first.
+
+    On Postgres this is audit_logs alone; its partitions are pruned by the planner.
+    """
+    if not IS_SQLITE:
+        return [HOT]
+    rows = db.execute(
+        select(AuditSegment.name, AuditSegment.starts, AuditSegment.ends, AuditSegment.min_id, AuditSegment.max_id)
+        .where(AuditSegment.state == "live")
+        .order_by(AuditSegment.starts.desc())
+    ).all()
+    return [HOT] + [Segment(segment_table(r.name), r.starts, r.ends, r.min_id, r.max_id) for r in rows]
+
+
+def overlapping(
+    segments: List[Segment],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    latest: Optional[datetime] = None,
+) -> List[Segment]:
+    """The segments that can hold rows with start <= created_at < end and created_at <= latest."""
+    out = []
+    for segment in segments:
+        if segment.starts is not None:
+            if end is not None and segment.starts >= _naive_utc(end):
+                continue
+            if latest is not None and segment.starts > _naive_utc(latest):
+                continue
+        if segment.ends is not None and start is not None and segment.ends <= _naive_utc(start):
+            continue
+        out.append(segment)
+    return out
+
+
+def read_consistent(db: Session, fn: Callable[[List[Segment]], T]) -> T:
+    """Return `fn(live_segments(db))`, re-running it if a seal or archive committed meanwhile.
+
+    Moving a month changes audit_segments in the same transaction, and the registry only
+    moves forward, so an unchanged registry after `fn` means every query `fn` ran saw the
+    rows where the segment list says they are.
+    """
+    while True:
+        segments = live_segments(db)
+        result = fn(segments)
+        if not IS_SQLITE or live_segments(db) == segments:
+            return result
+        logger.debug("audit segments changed during a read, retrying")
+
+
+# --- immutability and Postgres partitions -----------------------------------------------
+
+_IMMUTABLE = "audit_logs rows are immutable"
+
+_SQLITE_HOT_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS audit_logs_no_update BEFORE UPDATE ON audit_logs "
+    f"BEGIN SELECT RAISE(ABORT, '{_IMMUTABLE}'); END",
+    # seal_months registers the month before deleting the rows it has just copied
+    "CREATE TRIGGER IF NOT EXISTS audit_logs_no_delete BEFORE DELETE ON audit_logs "
+    "WHEN NOT EXISTS (SELECT 1 FROM audit_segments s WHERE old.created_at >= s.starts AND old.created_at < s.ends) "
+    f"BEGIN SELECT RAISE(ABORT, '{_IMMUTABLE}'); END",
+]
+
+_POSTGRES_FUNCTION = (
+    "CREATE OR REPLACE FUNCTION audit_logs_immutable() RETURNS trigger LANGUAGE plpgsql AS "
+    f"$$ BEGIN RAISE EXCEPTION '{_IMMUTABLE}'; END $$"
+)
+
+_POSTGRES_TRIGGERS = {
+    "audit_logs_immutable": "CREATE TRIGGER audit_logs_immutable BEFORE UPDATE OR DELETE ON audit_logs "
+    "FOR EACH ROW EXECUTE FUNCTION audit_logs_immutable()",
+    "audit_logs_no_truncate": "CREATE TRIGGER audit_logs_no_truncate BEFORE TRUNCATE ON audit_logs "
+    "FOR EACH STATEMENT EXECUTE FUNCTION audit_logs_immutable()",
+}
+
+
+def _sqlite_segment_triggers(conn: Connection, name: str) -> None:
+    for op in ("UPDATE", "DELETE"):
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {name}_no_{op.lower()} BEFORE {op} ON {name} "
+            f"BEGIN SELECT RAISE(ABORT, '{_IMMUTABLE}'); END"
+        )
+
+
+def _postgres_kind(conn: Connection) -> Optional[str]:
+    """'p' if audit_logs is partitioned, 'r' for a plain table, None if it doesn't exist."""
+    return conn.exec_driver_sql("SELECT relkind FROM pg_class WHERE oid = to_regclass('audit_logs')").scalar()
+
+
+def _postgres_partitions(conn: Connection) -> List[str]:
+    return list(conn.exec_driver_sql(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('audit_logs') ORDER BY c.relname"
+    ).scalars())
+
+
+def ensure_partitions(conn: Connection, first: datetime, last: datetime) -> None:
+    """Create the missing monthly partitions from `first`'s month through `last`'s (Postgres)."""
+    conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS audit_logs_default PARTITION OF audit_logs DEFAULT")
+    month, last = month_start(first), month_start(last)
+    while month <= last:
+        name, ends = partition_name(month), add_months(month, 1)
+        try:
+            with conn.begin_nested():
+                conn.exec_driver_sql(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF audit_logs "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{ends.isoformat()}')"
+                )
+        except DBAPIError as exc:
+            # the default partition already holds rows of this month; they stay there
+            logger.warning("Could not create partition %s: %s", name, exc.orig)
+        month = ends
+
+
+def install_partitions(bind: Engine) -> str:
+    """Install the immutability triggers and upcoming partitions; return the scheme in use.
+
+    Idempotent, run at startup on every worker.
+    """
+    dialect = bind.dialect.name
+    try:
+        if dialect == "sqlite":
+            with bind.begin() as conn:
+                for stmt in _SQLITE_HOT_TRIGGERS:
+                    conn.exec_driver_sql(stmt)
+                live = conn.execute(select(AuditSegment.name).where(AuditSegment.state == "live")).scalars().all()
+                for name in live:
+                    _sqlite_segment_triggers(conn, name)
+            return f"sqlite segments ({len(live)} live)"
+        if dialect == "postgresql":
+            with bind.begin() as conn:
+                conn.exec_driver_sql(_POSTGRES_FUNCTION)
+                existing = set(conn.exec_driver_sql(
+                    "SELECT tgname FROM pg_trigger WHERE tgrelid = to_regclass('audit_logs')"
+                ).scalars())
+                for name, stmt in _POSTGRES_TRIGGERS.items():
+                    if name not in existing:
+                        conn.exec_driver_sql(stmt)
+                if _postgres_kind(conn) != "p":
+                    logger.warning("audit_logs is not partitioned; run `python -m transaction.partitions migrate`")
+                    return "postgres (unpartitioned)"
+                now = datetime.now(timezone.utc)
+                ensure_partitions(conn, now, add_months(month_start(now), AUDIT_PARTITIONS_AHEAD))
+            return "postgres monthly partitions"
+    except Exception:
+        logger.exception("Audit log partitioning setup failed")
+    return "none"
+
+
+# --- sealing (SQLite) -------------------------------------------------------------------
+
+def _record_segment(conn: Connection, name: str, **values: Any) -> None:
+    """Insert or update the audit_segments row `name`."""
+    if not conn.execute(update(AuditSegment).where(AuditSegment.name == name).values(**values)).rowcount:
+        conn.execute(insert(AuditSegment).values(name=name, **values))
+
+
+def _seal_month(bind: Engine, month: datetime) -> int:
+    """Move one month of the hot table into its segment table; return the rows moved."""
+    name, ends = partition_name(month), add_months(month, 1)
+    hot = AuditLog.__table__
+    in_month = and_(hot.c.created_at >= month, hot.c.created_at < ends)
+    with bind.begin() as conn:
+        # take the write lock first: no transfer may commit between the copy and the delete
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        count = conn.execute(select(func.count()).select_from(hot).where(in_month)).scalar()
+        if not count:
+            return 0
+        state = conn.execute(select(AuditSegment.state).where(AuditSegment.name == name)).scalar()
+        if state == "archived":
+            logger.warning("%d late rows for archived month %s stay in the hot table", count, name)
+            return 0
+
+        table = segment_table(name)
+        table.create(conn, checkfirst=True)
+        _sqlite_segment_triggers(conn, name)
+        columns = [c.name for c in hot.columns]
+        copied = conn.execute(table.insert().from_select(columns, select(*hot.c).where(in_month))).rowcount
+        rows, min_id, max_id = conn.execute(select(func.count(), func.min(table.c.id), func.max(table.c.id))).one()
+        _record_segment(conn, name, starts=month, ends=ends, state="live", rows=rows, min_id=min_id, max_id=max_id)
+        deleted = conn.execute(delete(hot).where(in_month)).rowcount
+        if not count == copied == deleted:
+            raise RuntimeError(f"sealing {name}: {count} rows, {copied} copied, {deleted} deleted")
+    logger.info("Sealed %s: %d rows", name, count)
+    return count
+
+
+def seal_months(bind: Engine) -> List[str]:
+    """Move every complete month before the newest row's month out of the hot table (SQLite).
+
+    The newest row's month stays hot, so the table's highest id stays in place and new ids
+    keep growing past every sealed one. One transaction per month.
+    """
+    hot = AuditLog.__table__
+    with bind.connect() as conn:
+        oldest, newest = conn.execute(select(func.min(hot.c.created_at), func.max(hot.c.created_at))).one()
+    if oldest is None:
+        return []
+    sealed = []
+    month, last = month_start(oldest), month_start(newest)
+    while month < last:
+        if _seal_month(bind, month):
+            sealed.append(partition_name(month))
+        month = add_months(month, 1)
+    return sealed
+
+
+# --- archival -----------------------------------------------------------------------------
+
+def _archive_record(row: Any) -> dict:
+    out = {}
+    for key, value in row._mapping.items():
+        if isinstance(value, Decimal):
+            value = str(value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        out[key] = value
+    return out
+
+
+def _read_archive(path: str) -> Tuple[str, int]:
+    """SHA-256 of the archive file and the number of rows it holds."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    with gzip.open(path, "rb") as f:
+        rows = sum(1 for _ in f)
+    return digest.hexdigest(), rows
+
+
+def _archive_dir(bind: Engine) -> str:
+    # every shard has its own audit_logs_YYYYMM
+    if bind in shard_engines[1:]:
+        return os.path.join(AUDIT_ARCHIVE_DIR, f"shard{shard_engines.index(bind)}")
+    return AUDIT_ARCHIVE_DIR
+
+
+def _write_archive(bind: Engine, name: str) -> Tuple[str, str, int, Optional[int], Optional[int]]:
+    """Write table `name` to its archive file; return (path, sha256, rows, min_id, max_id)."""
+    directory = _archive_dir(bind)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.ndjson.gz")
+    if os.path.exists(path):
+        raise RuntimeError(f"{path} already exists; archives are never overwritten")
+    table = segment_table(name)
+    partial = path + ".partial"
+    rows, min_id, max_id = 0, None, None
+    try:
+        with bind.connect() as conn:
+            expected = conn.execute(select(func.count()).select_from(table)).scalar()
+            result = conn.execution_options(yield_per=ARCHIVE_BATCH_SIZE).execute(select(table).order_by(table.c.id))
+            with open(partial, "wb") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb") as out:
+                    for row in result:
+                        out.write(json.dumps(_archive_record(row), separators=(",", ":")).encode() + b"\n")
+                        rows += 1
+                        min_id = row.id if min_id is None else min_id
+                        max_id = row.id
+                raw.flush()
+                os.fsync(raw.fileno())
+        sha256, written = _read_archive(partial)
+        if not expected == rows == written:
+            raise RuntimeError(f"archiving {name}: {expected} rows in the table, {rows} read, {written} in the file")
+        os.chmod(partial, 0o444)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return path, sha256, rows, min_id, max_id
+
+
+def archive_months(bind: Engine, hot_months: int = AUDIT_HOT_MONTHS, now: Optional[datetime] = None) -> List[str]:
+    """Archive and drop every month that ended before the last `hot_months` months."""
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -(max(1, hot_months) - 1))
+    dialect = bind.dialect.name
+    with bind.connect() as conn:
+        if dialect == "sqlite":
+            names = conn.execute(
+                select(AuditSegment.name).where(AuditSegment.state == "live", AuditSegment.ends <= cutoff)
+                .order_by(AuditSegment.starts)
+            ).scalars().all()
+        elif dialect == "postgresql":
+            names = [n for n in _postgres_partitions(conn) if _month_of(n) is not None and add_months(_month_of(n), 1) <= cutoff]
+        else:
+            return []
+
+    archived = []
+    for name in names:
+        month = _month_of(name)
+        path, sha256, rows, min_id, max_id = _write_archive(bind, name)
+        with bind.begin() as conn:
+            if dialect == "sqlite":
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+            else:
+                conn.exec_driver_sql(f"ALTER TABLE audit_logs DETACH PARTITION {name}")
+            # the month's rows leave GET /transactions: change the ETags of everyone in them
+            conn.exec_driver_sql(
+                f"UPDATE users SET version = version + 1 "
+                f"WHERE id IN (SELECT sender_id FROM {name} UNION SELECT receiver_id FROM {name})"
+            )
+            conn.exec_driver_sql(f"DROP TABLE {name}")
+            _record_segment(
+                conn, name, starts=month, ends=add_months(month, 1), state="archived", rows=rows, min_id=min_id,
+                max_id=max_id, archive_path=path, sha256=sha256, archived_at=datetime.now(timezone.utc),
+            )
+        logger.info("Archived %s: %d rows to %s", name, rows, path)
+        archived.append(name)
+    return archived
+
+
+def verify_archives(bind: Engine) -> List[str]:
+    """Check every archive file against its recorded checksum and row count; return the problems."""
+    with bind.connect() as conn:
+        archived = conn.execute(select(AuditSegment).where(AuditSegment.state == "archived").order_by(AuditSegment.starts)).all()
+    problems = []
+    for row in archived:
+        if not os.path.exists(row.archive_path):
+            problems.append(f"{row.name}: {row.archive_path} is missing")
+            continue
+        sha256, rows = _read_archive(row.archive_path)
+        if sha256 != row.sha256 or rows != row.rows:
+            problems.append(f"{row.name}: {row.archive_path} doesn't match its record")
+    return problems
+
+
+# --- Postgres migration -------------------------------------------------------------------
+
+def migrate_postgres(bind: Engine) -> int:
+    """Rebuild a plain audit_logs table as a partitioned one; return the rows copied.
+
+    Runs in one transaction; stop the app first. Ids and the id sequence carry over.
+    """
+    table = AuditLog.__table__
+    with bind.begin() as conn:
+        kind = _postgres_kind(conn)
+        if kind == "p":
+            return 0
+        copied = 0
+        if kind is not None:
+            conn.exec_driver_sql("ALTER TABLE audit_logs RENAME TO audit_logs_unpartitioned")
+            # index and sequence names are per schema; free them for the new table
+            conn.exec_driver_sql("ALTER TABLE audit_logs_unpartitioned RENAME CONSTRAINT audit_logs_pkey TO audit_logs_unpartitioned_pkey")
+            for name in [index.name for index in table.indexes] + OBSOLETE_INDEXES:
+                conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+            conn.exec_driver_sql("ALTER SEQUENCE IF EXISTS audit_logs_id_seq RENAME TO audit_logs_unpartitioned_id_seq")
+        table.create(conn)
+        now = datetime.now(timezone.utc)
+        oldest = conn.exec_driver_sql("SELECT min(created_at) FROM audit_logs_unpartitioned").scalar() if kind else None
+        ensure_partitions(conn, oldest or now, add_months(month_start(now), AUDIT_PARTITIONS_AHEAD))
+        if kind is not None:
+            columns = ", ".join(c.name for c in table.columns)
+            copied = conn.exec_driver_sql(
+                f"INSERT INTO audit_logs ({columns}) SELECT {columns} FROM audit_logs_unpartitioned"
+            ).rowcount
+            conn.exec_driver_sql(
+                "SELECT setval(pg_get_serial_sequence('audit_logs', 'id'), "
+                "COALESCE((SELECT max(id) FROM audit_logs), 0) + 1, false)"
+            )
+            conn.exec_driver_sql("DROP TABLE audit_logs_unpartitioned")
+    install_partitions(bind)
+    return copied
+
+
+# --- command line -------------------------------------------------------------------------
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="audit_logs partition maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    maintain = commands.add_parser("maintain", help="seal (SQLite) or create partitions (Postgres), then archive")
+    maintain.add_argument("--hot-months", type=int, default=AUDIT_HOT_MONTHS)
+    commands.add_parser("status", help="list segments/partitions and verify archive checksums")
+    commands.add_parser("migrate", help="partition an existing Postgres audit_logs table")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    # every table the app expects, so init_db can create them
+    try:
+        from ..database import shard_engines, init_db
+        from ..sse import models as _sse_models  # noqa: F401
+        from ..user import models as _user_models  # noqa: F401
+    except Exception:
+        from database import shard_engines, init_db
+        import sse.models  # noqa: F401
+        import user.models  # noqa: F401
+
+    dialect = shard_engines[0].dialect.name
+    if args.command == "migrate" and dialect != "postgresql":
+        parser.error("migrate is for Postgres only")
+
+    # each shard (DB_SHARDS) has its own audit_logs
+    failed = 0
+    for shard, engine in enumerate(shard_engines):
+        if len(shard_engines) > 1:
+            print(f"shard {shard}:")
+        if args.command == "migrate":
+            print(f"copied {migrate_postgres(engine)} rows into the partitioned audit_logs")
+            continue
+
+        init_db(engine)
+        install_partitions(engine)
+        if args.command == "maintain":
+            if dialect == "sqlite":
+                print("sealed:", ", ".join(seal_months(engine)) or "nothing")
+            elif dialect == "postgresql":
+                with engine.begin() as conn:
+                    now = datetime.now(timezone.utc)
+                    ensure_partitions(conn, now, add_months(month_start(now), AUDIT_PARTITIONS_AHEAD))
+            print("archived:", ", ".join(archive_months(engine, args.hot_months)) or "nothing")
+            continue
+
+        with engine.connect() as conn:
+            for row in conn.execute(select(AuditSegment).order_by(AuditSegment.starts)):
+                print(f"{row.name}  {row.state:8}  {row.rows:>10} rows  ids {row.min_id}-{row.max_id}  {row.archive_path or ''}")
+            if dialect == "postgresql":
+                print("partitions:", ", ".join(_postgres_partitions(conn)) or "none")
+        problems = verify_archives(engine)
+        for problem in problems:
+            print(problem)
+        failed += bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
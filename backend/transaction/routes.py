@@ -1,123 +1,364 @@
+from datetime import datetime
 from decimal import Decimal
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 try:
-    from ..database import get_db
-    from ..user.routes import _get_current_user_from_token
-    from .controller import transfer_funds
-    from .schema import TransferRequest, TransferResult
+    from ..database import get_async_db, run_transaction, run_transaction_async, DB_ASYNC
+    from ..user.routes import _get_current_user_from_token, _get_current_user_from_token_async, get_user_db
+    from .controller import (
+        apply_transfer,
+        charge_payment_grant,
+        PaymentLimitReached,
+        transfer_funds_batch,
+        BATCH_MAX_ITEMS,
+        list_transactions,
+        list_transactions_async,
+        list_transaction_changes,
+        transaction_totals,
+        decode_history_cursor,
+        HISTORY_DEFAULT_LIMIT,
+        HISTORY_MAX_LIMIT,
+        CHANGES_MAX_LIMIT,
+    )
+    from .group_commit import transfer_writer
+    from .export import stream_statement, MEDIA_TYPES
+    from .schema import TransferRequest, TransferResult, BatchTransferRequest, BatchTransferResult
     from .models import AuditLog
     from ..user.models import User
-    from ..user.auth import verify_password
-    # sse manager
-    from ..sse.sse_manager import sse_manager
+    from ..user.auth import verify_password_async, decode_payment_token
+    from ..user.controller import get_user_version, get_user_version_async, get_hashed_pin, get_hashed_pin_async
+    from ..serialization import FastJSONResponse, money
+    from ..conditional import if_none_match, make_etag, not_modified, tag_response
+    from ..rate_limit import client_ip, rate_limiter
 except Exception:
-    from database import get_db
-    from user.routes import _get_current_user_from_token
-    from transaction.controller import transfer_funds
-    from transaction.schema import TransferRequest, TransferResult
+    from database import get_async_db, run_transaction, run_transaction_async, DB_ASYNC
+    from user.routes import _get_current_user_from_token, _get_current_user_from_token_async, get_user_db
+    from transaction.controller import (
+        apply_transfer,
+        charge_payment_grant,
+        PaymentLimitReached,
+        transfer_funds_batch,
+        BATCH_MAX_ITEMS,
+        list_transactions,
+        list_transactions_async,
+        list_transaction_changes,
+        transaction_totals,
+        decode_history_cursor,
+        HISTORY_DEFAULT_LIMIT,
+        HISTORY_MAX_LIMIT,
+        CHANGES_MAX_LIMIT,
+    )
+    from transaction.group_commit import transfer_writer
+    from transaction.export import stream_statement, MEDIA_TYPES
+    from transaction.schema import TransferRequest, TransferResult, BatchTransferRequest, BatchTransferResult
     from transaction.models import AuditLog
     from user.models import User
-    from user.auth import verify_password
-    from sse.sse_manager import sse_manager
+    from user.auth import verify_password_async, decode_payment_token
+    from user.controller import get_user_version, get_user_version_async, get_hashed_pin, get_hashed_pin_async
+    from serialization import FastJSONResponse, money
+    from conditional import if_none_match, make_etag, not_modified, tag_response
+    from rate_limit import client_ip, rate_limiter
 
 
 router = APIRouter()
 
 
-@router.post("/transfer", response_model=TransferResult)
-def transfer(payload: TransferRequest, current_user=Depends(_get_current_user_from_token), db: Session = Depends(get_db)):
+async def _release(db) -> None:
+    # return the pooled connection (sync or async session) before slow work
+    if isinstance(db, AsyncSession):
+        await db.close()
+    else:
+        await run_in_threadpool(db.close)
+
+
+async def _authorize_payment(payload, request: Request, current_user, db) -> Optional[str]:
+    """Check the PIN or payment session of a transfer request.
+
+    Returns the payment grant id to charge, or None when the PIN was verified.
+    """
+    if payload.payment_token:
+        # Payment session: no PIN hash
+        try:
+            grant = decode_payment_token(payload.payment_token)
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired payment session")
+        if grant.get("sub") != str(current_user.id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired payment session")
+        return grant["jti"]
+
+    # Verify payment PIN
+    if not payload.pin:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="PIN or payment_token required")
+    # the hash comes from the database: the cached snapshot may predate a /auth/set-pin on another worker
+    if isinstance(db, AsyncSession):
+        hashed_pin = await get_hashed_pin_async(db, current_user.id)
+    else:
+        hashed_pin = await run_in_threadpool(get_hashed_pin, db, current_user.id)
+    if not hashed_pin:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Payment PIN not set for this account")
+    # PIN guessing is throttled before it costs a hash
+    await rate_limiter.admit("pin", ip=client_ip(request), user=current_user.id)
+    # PIN check runs in the KDF pool; the DB work runs in the threadpool.
+    # Return the pooled connection first so slow PIN checks don't exhaust the DB pool.
+    await _release(db)
+    if not await verify_password_async(payload.pin, hashed_pin):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid payment PIN")
+    return None
+
+
+async def _transfer(payload: TransferRequest, request: Request, current_user, db) -> dict:
     try:
         amount = Decimal(str(payload.amount))
     except Exception:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid amount")
 
-    # Verify payment PIN
-    if not getattr(current_user, "hashed_pin", None):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Payment PIN not set for this account")
-    if not verify_password(payload.pin, current_user.hashed_pin):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid payment PIN")
+    if amount <= Decimal("0"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Amount must be greater than zero")
+
+    grant_id = await _authorize_payment(payload, request, current_user, db)
+    # start from a clean session so the transfer runs (and is retried) as one transaction
+    await _release(db)
 
     try:
-        sender, receiver, audit = transfer_funds(db, current_user, payload.receiver_email, amount, getattr(payload, 'note', None))
+        # SSE events for both parties are queued in the outbox and published after the commit
+        if transfer_writer.enabled:
+            # group commit: applied and committed together with other queued transfers
+            return await transfer_writer.submit(current_user, payload.receiver_email, amount, payload.note, grant_id)
+        if isinstance(db, AsyncSession):
+            return await run_transaction_async(
+                db, apply_transfer, current_user, payload.receiver_email, amount, payload.note, grant_id
+            )
+        return await run_in_threadpool(
+            run_transaction, db, apply_transfer, current_user, payload.receiver_email, amount, payload.note, grant_id
+        )
+    except PaymentLimitReached as exc:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(exc))
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
     except Exception as exc:
         # unexpected — include message to aid debugging (remove in production)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Transfer failed: {exc}")
 
-    result = {
-        "sender_id": sender.id,
-        "receiver_id": receiver.id,
-        "amount": float(audit.amount),
-        "sender_balance": float(sender.balance),
-        "receiver_balance": float(receiver.balance),
+
+async def transfer(
+    payload: TransferRequest, request: Request, current_user=Depends(_get_current_user_from_token), db: Session = Depends(get_user_db)
+):
+    return await _transfer(payload, request, current_user, db)
+
+
+async def transfer_async(
+    payload: TransferRequest, request: Request, current_user=Depends(_get_current_user_from_token_async), db: AsyncSession = Depends(get_async_db)
+):
+    return await _transfer(payload, request, current_user, db)
+
+
+router.post("/transfer", response_model=TransferResult)(transfer_async if DB_ASYNC else transfer)
+
+
+def _apply_batch(db: Session, sender, items, atomic: bool, grant_id: Optional[str]) -> dict:
+    sender_row, results = transfer_funds_batch(db, sender, items, atomic=atomic)
+    total = sum((items[r["index"]][1] for r in results if r["status"] == "ok"), Decimal("0"))
+    if grant_id is not None and total > 0:
+        charge_payment_grant(db, grant_id, sender.id, total)
+    succeeded = sum(1 for r in results if r["status"] == "ok")
+    return {
+        "sender_id": sender_row.id,
+        "sender_balance": float(sender_row.balance),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "results": results,
     }
 
-    # publish SSE events to receiver and sender (non-blocking, thread-safe)
+
+@router.post("/transfers/batch", response_model=BatchTransferResult)
+async def transfer_batch(
+    payload: BatchTransferRequest, request: Request, current_user=Depends(_get_current_user_from_token), db: Session = Depends(get_user_db)
+):
+    """Send many transfers from the current user in one transaction (e.g. payroll).
+
+    With `atomic` (default) every transfer is applied or none is, and the first failing item
+    is reported as a 400. Otherwise each item gets its own status and the valid ones are
+    applied. A payment session is charged once, for the total of the applied transfers.
+    """
+    if not payload.transfers:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No transfers given")
+    if len(payload.transfers) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {BATCH_MAX_ITEMS} transfers per batch")
     try:
-        sse_manager.publish(receiver.id, {"event": "transfer", **result})
-        sse_manager.publish(sender.id, {"event": "transfer", **result})
+        items = [(t.receiver_email, Decimal(str(t.amount)), t.note) for t in payload.transfers]
     except Exception:
-        # don't break the API if SSE publish fails
-        pass
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid amount")
 
-    return result
+    grant_id = await _authorize_payment(payload, request, current_user, db)
+    await run_in_threadpool(db.close)
 
+    try:
+        return await run_in_threadpool(run_transaction, db, _apply_batch, current_user, items, payload.atomic, grant_id)
+    except PaymentLimitReached as exc:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(exc))
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    except Exception as exc:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Transfer failed: {exc}")
 
-@router.get("/transactions")
-def transactions(current_user=Depends(_get_current_user_from_token), db: Session = Depends(get_db)):
-    """Return sent and received transactions for the current user, newest first.
 
-    Each item contains: id, type ('debited'|'credited'), sender_name, receiver_name, amount, created_at (ISO).
+def transactions(
+    request: Request,
+    limit: int = Query(HISTORY_DEFAULT_LIMIT, ge=1, le=HISTORY_MAX_LIMIT),
+    before: Optional[str] = None,
+    direction: Optional[Literal["debited", "credited"]] = None,
+    counterparty_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    current_user=Depends(_get_current_user_from_token),
+    db: Session = Depends(get_user_db),
+):
+    """Return one page of sent and received transactions for the current user, newest first.
+
+    Each item contains: id, type ('debited'|'credited'), sender_name, receiver_name, amount
+    (decimal string), note, created_at (ISO).
+    Paging is keyset based: pass the `X-Next-Cursor` response header back as `?before=` to get
+    the next page. The header is absent on the last page.
+    Pages carry an ETag; a matching If-None-Match gets 304 without reading the history.
     """
+    filters = _history_filters(limit, before, direction, counterparty_id, start, end)
     try:
-        rows = (
-            db.query(AuditLog)
-            .filter((AuditLog.sender_id == current_user.id) | (AuditLog.receiver_id == current_user.id))
-            .order_by(AuditLog.created_at.desc())
-            .all()
-        )
+        # the version is read before the page (see conditional.py)
+        etag = _history_etag(current_user.id, get_user_version(db, current_user.id), filters)
+        if if_none_match(request, etag):
+            return not_modified(etag)
+        rows, next_cursor = list_transactions(db, current_user.id, **filters)
     except Exception as exc:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(exc))
+    return _history_page(rows, next_cursor, current_user.id, etag)
 
-    out = []
-    for r in rows:
-        # determine type: if current user is the sender they were debited, otherwise they were credited
-        txn_type = "debited" if r.sender_id == current_user.id else "credited"
 
-        # get names from relationship if available, else query fallback
-        sender_name = None
-        receiver_name = None
-        try:
-            sender_name = getattr(r.sender, "name", None)
-        except Exception:
-            sender_name = None
-        try:
-            receiver_name = getattr(r.receiver, "name", None)
-        except Exception:
-            receiver_name = None
-
-        if sender_name is None:
-            u = db.query(User).filter(User.id == r.sender_id).first()
-            sender_name = u.name if u else None
-        if receiver_name is None:
-            u = db.query(User).filter(User.id == r.receiver_id).first()
-            receiver_name = u.name if u else None
-
-        created_at = r.created_at.isoformat() if getattr(r, "created_at", None) is not None else None
-
-        out.append(
-            {
-                "id": r.id,
-                "type": txn_type,
-                "sender_name": sender_name,
-                "receiver_name": receiver_name,
-                "amount": float(r.amount) if r.amount is not None else None,
-                "note": getattr(r, "note", None),
-                "created_at": created_at,
-            }
-        )
+async def transactions_async(
+    request: Request,
+    limit: int = Query(HISTORY_DEFAULT_LIMIT, ge=1, le=HISTORY_MAX_LIMIT),
+    before: Optional[str] = None,
+    direction: Optional[Literal["debited", "credited"]] = None,
+    counterparty_id: Optional[int] = None,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    current_user=Depends(_get_current_user_from_token_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """`transactions` on the async database path (DB_ASYNC=1)."""
+    filters = _history_filters(limit, before, direction, counterparty_id, start, end)
+    try:
+        etag = _history_etag(current_user.id, await get_user_version_async(db, current_user.id), filters)
+        if if_none_match(request, etag):
+            return not_modified(etag)
+        rows, next_cursor = await list_transactions_async(db, current_user.id, **filters)
+    except Exception as exc:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(exc))
+    return _history_page(rows, next_cursor, current_user.id, etag)
+
+
+router.get("/transactions")(transactions_async if DB_ASYNC else transactions)
+
+
+def _history_filters(limit, before, direction, counterparty_id, start, end) -> dict:
+    try:
+        cursor = decode_history_cursor(before) if before else None
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return {"limit": limit, "before": cursor, "direction": direction, "counterparty_id": counterparty_id, "start": start, "end": end}
+
+
+def _history_etag(user_id: int, version: Optional[int], filters: dict) -> str:
+    return make_etag("transactions", user_id, version, *sorted(filters.items()))
+
+
+def _history_page(rows, next_cursor: Optional[str], user_id: int, etag: str) -> FastJSONResponse:
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return tag_response(FastJSONResponse([_history_item(r, user_id) for r in rows], headers=headers), etag)
+
+
+@router.get("/transactions/changes")
+def transaction_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(CHANGES_MAX_LIMIT, ge=1, le=CHANGES_MAX_LIMIT),
+    current_user=Depends(_get_current_user_from_token),
+    db: Session = Depends(get_user_db),
+):
+    """Return the current user's transactions newer than `since` plus their current balance.
 
-    return out
+    `since` is the highest transaction id the client already has (0 for everything). Items
+    have the same shape as GET /transactions but are ordered oldest first; `cursor` is the
+    value to pass as `since` next time, and `has_more` means another call is needed to
+    catch up.
+    """
+    try:
+        rows, balance, has_more = list_transaction_changes(db, current_user.id, since=since, limit=limit)
+    except Exception as exc:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(exc))
+
+    return FastJSONResponse({
+        "transactions": [_history_item(r, current_user.id) for r in rows],
+        "balance": money(balance) if balance is not None else "0.00",
+        "cursor": rows[-1].id if rows else since,
+        "has_more": has_more,
+    })
+
+
+@router.get("/transactions/summary")
+def transaction_summary(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    current_user=Depends(_get_current_user_from_token),
+    db: Session = Depends(get_user_db),
+):
+    """Return the current user's total sent, total received and transaction count.
+
+    Covers the whole history (or the `from`..`to` window, `to` exclusive), whereas
+    GET /transactions only returns one page; clients show these totals instead of summing
+    the rows they have loaded.
+    """
+    try:
+        totals = transaction_totals(db, current_user.id, start, end)
+    except Exception as exc:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(exc))
+    return FastJSONResponse({"sent": money(totals["sent"]), "received": money(totals["received"]), "count": totals["count"]})
+
+
+@router.get("/transactions/export")
+def export_transactions(
+    fmt: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    current_user=Depends(_get_current_user_from_token),
+):
+    """Stream the current user's full statement as CSV or NDJSON, oldest first.
+
+    `from` is inclusive and `to` exclusive. Rows are read with a server-side cursor and sent
+    as they are encoded, so the statement is never built in memory.
+    """
+    filename = f"statement-{current_user.id}.{fmt}"
+    return StreamingResponse(
+        stream_statement(current_user.id, fmt, start, end),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _history_item(r, user_id: int) -> dict:
+    # determine type: if current user is the sender they were debited, otherwise they were credited
+    txn_type = "debited" if r.sender_id == user_id else "credited"
+    # created_at stays a datetime: the encoder writes it as ISO 8601
+    return {
+        "id": r.id,
+        "type": txn_type,
+        "sender_name": r.sender_name,
+        "receiver_name": r.receiver_name,
+        "amount": money(r.amount),
+        "note": r.note,
+        "created_at": r.created_at,
+    }
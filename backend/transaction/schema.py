@@ -1,15 +1,17 @@
-from pydantic import BaseModel, PositiveFloat
+from pydantic import BaseModel, Field, PositiveFloat
 from decimal import Decimal
-from typing import Any, Optional
+from typing import Any, List, Optional
 
 
 class TransferRequest(BaseModel):
     receiver_email: str
     amount: float
     # Payment PIN supplied by the sender for verification
-    pin: str
-    # Optional note describing the payment (user-supplied)
-    note: Optional[str] = None
+    pin: Optional[str] = None
+    # Alternatively, a token from POST /auth/payment-session (skips the PIN hash)
+    payment_token: Optional[str] = None
+    # Optional note describing the payment (user-supplied; audit_logs.note is VARCHAR(512))
+    note: Optional[str] = Field(None, max_length=512)
 
 
 class TransferResult(BaseModel):
@@ -17,4 +19,36 @@ class TransferResult(BaseModel):
     receiver_id: int
     amount: float
     sender_balance: float
-    receiver_balance: float
+    # null when the receiver is on another shard (see cross_shard.py)
+    receiver_balance: Optional[float] = None
+
+
+class BatchTransferItem(BaseModel):
+    receiver_email: str
+    amount: float
+    note: Optional[str] = Field(None, max_length=512)
+
+
+class BatchTransferRequest(BaseModel):
+    transfers: List[BatchTransferItem]
+    # all-or-nothing (default); with false, failing items are reported and the rest applied
+    atomic: bool = True
+    pin: Optional[str] = None
+    payment_token: Optional[str] = None
+
+
+class BatchTransferItemResult(BaseModel):
+    index: int
+    status: str
+    receiver_id: Optional[int] = None
+    amount: float
+    audit_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BatchTransferResult(BaseModel):
+    sender_id: int
+    sender_balance: float
+    succeeded: int
+    failed: int
+    results: List[BatchTransferItemResult]
@@ -5,6 +5,11 @@ import json
 import base64
 import hashlib
 
+try:
+    from .kdf_pool import kdf_pool
+except Exception:
+    from user.kdf_pool import kdf_pool
+
 SECRET = os.getenv("SECRET_KEY", "dev-secret-key")
 _SECRET_BYTES = SECRET.encode("utf-8")
 
@@ -32,13 +37,22 @@ def verify_password(password: str, stored_hex: str) -> bool:
     return hmac.compare_digest(got, expected)
 
 
+async def hash_password_async(password: str) -> str:
+    """`hash_password` run in the dedicated KDF pool. Raises KDFPoolBusy when saturated."""
+    return await kdf_pool.run(hash_password, password)
+
+
+async def verify_password_async(password: str, stored_hex: str) -> bool:
+    """`verify_password` run in the dedicated KDF pool. Raises KDFPoolBusy when saturated."""
+    return await kdf_pool.run(verify_password, password, stored_hex)
+
+
 def _sign(message: bytes) -> bytes:
     return hmac.new(_SECRET_BYTES, message, hashlib.sha256).digest()
 
 
-def create_access_token(subject: str | int, expires_seconds: int = 3600) -> str:
+def _encode_token(payload: dict) -> str:
     header = {"alg": "HS256", "typ": "JWT"}
-    payload = {"sub": str(subject), "exp": int(time.time()) + expires_seconds}
     header_b64 = _b64u(json.dumps(header, separators=(",", ":")).encode("utf-8"))
     payload_b64 = _b64u(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
     signing_input = f"{header_b64}.{payload_b64}".encode("utf-8")
@@ -46,7 +60,7 @@ def create_access_token(subject: str | int, expires_seconds: int = 3600) -> str:
     return f"{header_b64}.{payload_b64}.{_b64u(sig)}"
 
 
-def decode_access_token(token: str) -> dict:
+def _decode_token(token: str) -> dict:
     try:
         header_b64, payload_b64, sig_b64 = token.split(".")
     except ValueError:
@@ -63,3 +77,29 @@ def decode_access_token(token: str) -> dict:
     if exp is None or int(time.time()) > int(exp):
         raise ValueError("Token expired")
     return payload
+
+
+def create_access_token(subject: str | int, expires_seconds: int = 3600) -> str:
+    payload = {"sub": str(subject), "exp": int(time.time()) + expires_seconds}
+    return _encode_token(payload)
+
+
+def decode_access_token(token: str) -> dict:
+    payload = _decode_token(token)
+    # scoped tokens (e.g. payment grants) must not authenticate as the user
+    if payload.get("scope") is not None:
+        raise ValueError("Invalid token scope")
+    return payload
+
+
+def create_payment_token(subject: str | int, grant_id: str, expires_seconds: int) -> str:
+    """Signed payment-session grant. Its caps and usage live in the `payment_grants` row `grant_id`."""
+    payload = {"sub": str(subject), "scope": "payment", "jti": grant_id, "exp": int(time.time()) + expires_seconds}
+    return _encode_token(payload)
+
+
+def decode_payment_token(token: str) -> dict:
+    payload = _decode_token(token)
+    if payload.get("scope") != "payment" or not payload.get("jti"):
+        raise ValueError("Invalid token scope")
+    return payload
@@ -1,10 +1,31 @@
+import asyncio
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from decimal import Decimal
+from typing import List, Optional
 
-from .models import User
-from .auth import hash_password, verify_password, create_access_token
+from .models import User, PaymentGrant
+from .search_index import search_users, search_users_sharded
+try:
+    from ..database import SHARDED, run_transaction
+    from ..sharding import allocate_user_id
+except Exception:
+    from database import SHARDED, run_transaction
+    from sharding import allocate_user_id
+from .auth import hash_password, verify_password, hash_password_async, verify_password_async, create_access_token
 INITIAL_BALANCE = Decimal("10000.00")
 
+# Payment sessions: upper bounds for what one PIN entry can authorize
+PAYMENT_SESSION_TTL_SECONDS = int(os.getenv("PAYMENT_SESSION_TTL_SECONDS", "300"))
+PAYMENT_SESSION_MAX_AMOUNT = Decimal(os.getenv("PAYMENT_SESSION_MAX_AMOUNT", "10000.00"))
+PAYMENT_SESSION_MAX_COUNT = int(os.getenv("PAYMENT_SESSION_MAX_COUNT", "10"))
+
 
 def create_user(db: Session, name: str, email: str, password: str, pin: str | None = None) -> User:
     """Create a new user with an initial test balance.
@@ -17,9 +38,34 @@ def create_user(db: Session, name: str, email: str, password: str, pin: str | No
         # reuse same hashing for PINs (PBKDF2 + salt)
         hashed_pin = hash_password(pin)
 
-    user = User(name=name, email=email, hashed_password=hashed, hashed_pin=hashed_pin, balance=INITIAL_BALANCE)
-    db.add(user)
-    db.commit()
+    return create_user_record(db, name, email, hashed, hashed_pin)
+
+
+async def create_user_async(db: Session, name: str, email: str, password: str, pin: str | None = None) -> User:
+    """Async `create_user`: hashing runs in the KDF pool, the insert in the threadpool."""
+    if pin is not None:
+        hashed, hashed_pin = await asyncio.gather(hash_password_async(password), hash_password_async(pin))
+    else:
+        hashed, hashed_pin = await hash_password_async(password), None
+    return await run_in_threadpool(create_user_record, db, name, email, hashed, hashed_pin)
+
+
+def create_user_record(db: Session, name: str, email: str, hashed_password: str, hashed_pin: str | None) -> User:
+    """Insert a user whose password (and optional PIN) are already hashed.
+
+    `db` is a session on the email's shard (`sharding.shard_for_email`).
+    """
+    user = User(name=name, email=email, hashed_password=hashed_password, hashed_pin=hashed_pin, balance=INITIAL_BALANCE)
+    if SHARDED:
+        def insert(db: Session) -> None:
+            # the id places the user on this shard; it's allocated under the write lock
+            user.id = allocate_user_id(db)
+            db.add(user)
+
+        run_transaction(db, insert)
+    else:
+        db.add(user)
+        db.commit()
     db.refresh(user)
     return user
 
@@ -33,5 +79,97 @@ def authenticate_user(db: Session, email: str, password: str):
     return user
 
 
+async def authenticate_user_async(db: Session, email: str, password: str):
+    """Async `authenticate_user`: the lookup runs in the threadpool, the hash check in the KDF pool."""
+    def _lookup():
+        user = db.query(User).filter(User.email == email).first()
+        # return the pooled connection before the slow hash check; `user` stays usable detached
+        db.close()
+        return user
+
+    user = await run_in_threadpool(_lookup)
+    if not user:
+        return None
+    if not await verify_password_async(password, user.hashed_password):
+        return None
+    return user
+
+
+async def search_users_async(db: AsyncSession, q: str, exclude_user_id: Optional[int] = None, limit: int = 10) -> List[User]:
+    """Async `search_users` on an AsyncSession (same queries, async driver)."""
+    return await db.run_sync(search_users, q, exclude_user_id, limit)
+
+
+def get_user_version(db: Session, user_id: int) -> Optional[int]:
+    """The user's current `version` (see conditional.py), or None if there is no such user."""
+    return db.query(User.version).filter(User.id == user_id).scalar()
+
+
+async def get_user_version_async(db: AsyncSession, user_id: int) -> Optional[int]:
+    """Async `get_user_version` on an AsyncSession."""
+    return await db.scalar(select(User.version).where(User.id == user_id))
+
+
+def get_hashed_pin(db: Session, user_id: int) -> Optional[str]:
+    """The user's current PIN hash, read from the database (never from `user_cache`: another
+    worker may have changed the PIN since the snapshot was cached)."""
+    return db.query(User.hashed_pin).filter(User.id == user_id).scalar()
+
+
+async def get_hashed_pin_async(db: AsyncSession, user_id: int) -> Optional[str]:
+    """Async `get_hashed_pin` on an AsyncSession."""
+    return await db.scalar(select(User.hashed_pin).where(User.id == user_id))
+
+
 def create_token_for_user(user: User, expires_seconds: int = 3600) -> str:
     return create_access_token(user.id, expires_seconds=expires_seconds)
+
+
+def create_payment_grant(db: Session, user_id: int, max_amount: Decimal, max_count: int, ttl_seconds: int) -> PaymentGrant:
+    """Store a new payment session for an already PIN-verified user.
+
+    Expired grants of the same user are pruned here so the table stays small.
+    """
+    now = datetime.now(timezone.utc)
+    db.query(PaymentGrant).filter(PaymentGrant.user_id == user_id, PaymentGrant.expires_at < now).delete(
+        synchronize_session=False
+    )
+    grant = PaymentGrant(
+        id=secrets.token_urlsafe(24),
+        user_id=user_id,
+        max_amount=max_amount,
+        max_count=max_count,
+        spent=Decimal("0.00"),
+        used_count=0,
+        expires_at=now + timedelta(seconds=ttl_seconds),
+    )
+    db.add(grant)
+    db.commit()
+    return grant
+
+
+def consume_payment_grant(db: Session, grant_id: str, user_id: int, amount: Decimal) -> bool:
+    """Charge `amount` against a payment session; return False if it is unknown or its caps are exhausted.
+
+    A single conditional UPDATE, so concurrent transfers can't overspend a grant. It is not
+    committed here: the caller's transaction commits it together with the transfer.
+    """
+    updated = (
+        db.query(PaymentGrant)
+        .filter(
+            PaymentGrant.id == grant_id,
+            PaymentGrant.user_id == user_id,
+            PaymentGrant.used_count < PaymentGrant.max_count,
+            PaymentGrant.spent + amount <= PaymentGrant.max_amount,
+        )
+        .update(
+            {PaymentGrant.spent: PaymentGrant.spent + amount, PaymentGrant.used_count: PaymentGrant.used_count + 1},
+            synchronize_session=False,
+        )
+    )
+    return updated == 1
+
+
+def revoke_payment_grants(db: Session, user_id: int) -> None:
+    """Invalidate all payment sessions of a user (e.g. after a PIN change). Not committed here."""
+    db.query(PaymentGrant).filter(PaymentGrant.user_id == user_id).delete(synchronize_session=False)
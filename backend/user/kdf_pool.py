@@ -0,0 +1,109 @@
+"""
+kdf_pool.py
+
+Dedicated worker pool for password/PIN key derivation.
+
+PBKDF2 with 100k iterations costs tens of milliseconds of CPU per call. Running it in sync
+handlers occupies Starlette's shared threadpool, so a login burst makes cheap endpoints such
+as /auth/me queue behind it. KDF work is instead submitted to its own bounded process pool
+and awaited from async handlers.
+
+Configuration (environment):
+- KDF_POOL_WORKERS: number of worker processes (default: min(4, cpu count)).
+- KDF_POOL_MAX_PENDING: maximum submitted-but-unfinished calls before new work is rejected
+  with `KDFPoolBusy` (default: 16 per worker). Routes turn this into a 503.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Tuple
+
+try:
+    from ..metrics import record_kdf
+except Exception:
+    from metrics import record_kdf
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(fn: Callable[..., Any], *args: Any) -> Tuple[Any, float]:
+    """Runs in the worker: `fn(*args)` and how long it took, excluding queueing."""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+class KDFPoolBusy(RuntimeError):
+    """Raised when the KDF pool already has `max_pending` calls in flight."""
+
+
+class KDFPool:
+    def __init__(self, workers: int | None = None, max_pending: int | None = None) -> None:
+        if workers is None:
+            workers = int(os.getenv("KDF_POOL_WORKERS", min(4, os.cpu_count() or 1)))
+        if max_pending is None:
+            max_pending = int(os.getenv("KDF_POOL_MAX_PENDING", workers * 16))
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending = 0
+        # counters for observability
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        """Create the executor and spawn its workers so the first request doesn't pay for it."""
+        if self._executor is not None:
+            return
+        # spawn rather than fork: the server process has live threads (event loop, threadpool)
+        ctx = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+        # submitting no-op work forces the worker processes to start now
+        for _ in range(self.workers):
+            self._executor.submit(os.getpid)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run `fn(*args)` in a worker process and await its result.
+
+        `fn` must be a module-level function so it can be pickled. Raises KDFPoolBusy
+        without submitting anything when the pending limit is reached.
+        """
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise KDFPoolBusy("Too many pending password hashing requests")
+
+        self.start()
+        executor = self._executor
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        submitted = time.perf_counter()
+        try:
+            result, compute = await loop.run_in_executor(executor, _timed, fn, *args)
+        except BrokenProcessPool:
+            # a worker died (e.g. OOM-killed); drop the executor so the next call recreates it
+            if self._executor is executor:
+                logger.exception("KDF worker pool is broken; recreating on next use")
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            self._pending -= 1
+        self.completed += 1
+        record_kdf(fn.__name__, max(0.0, time.perf_counter() - submitted - compute), compute)
+        return result
+
+
+kdf_pool = KDFPool()
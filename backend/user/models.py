@@ -1,7 +1,7 @@
 from datetime import datetime
 from decimal import Decimal
 
-from sqlalchemy import Column, Integer, String, Numeric, DateTime, func
+from sqlalchemy import Column, Integer, String, Numeric, DateTime, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 
 try:
@@ -25,12 +25,16 @@ class User(Base):
     # Balance stored as Numeric(18, 2)
     balance = Column(Numeric(18, 2), nullable=False, default=Decimal("0.00"), server_default="0")
 
+    # Bumped in the same transaction as every change to the user's balance, PIN or history;
+    # the ETags of GET /auth/me and GET /transactions are derived from it (see conditional.py)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     # Relationships to AuditLog will be declared by AuditLog (string names used)
     sent_logs = relationship(
         "AuditLog",
-        foreign_keys="AuditLog.sender_id",
+        primaryjoin="foreign(AuditLog.sender_id) == User.id",
         back_populates="sender",
         cascade="none",
         passive_deletes=True,
@@ -38,7 +42,7 @@ class User(Base):
 
     received_logs = relationship(
         "AuditLog",
-        foreign_keys="AuditLog.receiver_id",
+        primaryjoin="foreign(AuditLog.receiver_id) == User.id",
         back_populates="receiver",
         cascade="none",
         passive_deletes=True,
@@ -46,3 +50,36 @@ class User(Base):
 
     def __repr__(self) -> str:  # pragma: no cover - convenience
         return f"<User id={self.id} email={self.email} balance={self.balance}>"
+
+
+class PaymentGrant(Base):
+    """Server-side state of a payment session issued by POST /auth/payment-session.
+
+    The signed payment token only carries this row's id; the caps and how much of them has
+    been used live here so they are enforced across workers and roll back with a failed transfer.
+    """
+
+    __tablename__ = "payment_grants"
+
+    id = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    max_amount = Column(Numeric(18, 2), nullable=False)
+    max_count = Column(Integer, nullable=False)
+    spent = Column(Numeric(18, 2), nullable=False, default=Decimal("0.00"), server_default="0")
+    used_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self) -> str:  # pragma: no cover - convenience
+        return f"<PaymentGrant id={self.id} user_id={self.user_id} used={self.used_count}/{self.max_count}>"
+
+
+Index("ix_payment_grants_user", PaymentGrant.user_id)
+
+# case-insensitive prefix search (see user/search_index.py); also created on existing databases at startup
+USER_SEARCH_INDEXES = [
+    Index("ix_users_name_lower", func.lower(User.name)),
+    Index("ix_users_email_lower", func.lower(User.email)),
+]
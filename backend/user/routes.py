@@ -1,21 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from starlette.concurrency import run_in_threadpool
+from decimal import Decimal
+from typing import Generator, List, Optional
 import re
 
 try:
-    from ..database import get_db
-    from .schema import Signup, Login, Token, UserOut, SignupResponse, SearchOut, SetPin
-    from .controller import create_user, authenticate_user, create_token_for_user
+    from ..database import get_db, get_async_db, DB_ASYNC, SHARDED
+    from ..sharding import get_shard_db, session_for_shard, shard_for_email, shard_for_user
+    from .schema import Signup, Login, Token, UserOut, SignupResponse, SearchOut, SetPin, PaymentSessionRequest, PaymentSessionOut
+    from .controller import (
+        create_user_async,
+        authenticate_user_async,
+        create_token_for_user,
+        create_payment_grant,
+        revoke_payment_grants,
+        get_hashed_pin,
+        search_users,
+        search_users_async,
+        search_users_sharded,
+        PAYMENT_SESSION_TTL_SECONDS,
+        PAYMENT_SESSION_MAX_AMOUNT,
+        PAYMENT_SESSION_MAX_COUNT,
+    )
     from .models import User
-    from .auth import decode_access_token, hash_password
+    from .user_cache import user_cache, AuthUser
+    from .auth import decode_access_token, hash_password_async, verify_password_async, create_payment_token
+    from ..serialization import FastJSONResponse, money
+    from ..conditional import if_none_match, make_etag, not_modified, tag_response
+    from ..rate_limit import client_ip, rate_limiter
 except Exception:
-    from database import get_db
-    from user.schema import Signup, Login, Token, UserOut, SignupResponse, SearchOut, SetPin
-    from user.controller import create_user, authenticate_user, create_token_for_user
+    from database import get_db, get_async_db, DB_ASYNC, SHARDED
+    from sharding import get_shard_db, session_for_shard, shard_for_email, shard_for_user
+    from user.schema import Signup, Login, Token, UserOut, SignupResponse, SearchOut, SetPin, PaymentSessionRequest, PaymentSessionOut
+    from user.controller import (
+        create_user_async,
+        authenticate_user_async,
+        create_token_for_user,
+        create_payment_grant,
+        revoke_payment_grants,
+        get_hashed_pin,
+        search_users,
+        search_users_async,
+        search_users_sharded,
+        PAYMENT_SESSION_TTL_SECONDS,
+        PAYMENT_SESSION_MAX_AMOUNT,
+        PAYMENT_SESSION_MAX_COUNT,
+    )
     from user.models import User
-    from user.auth import decode_access_token, hash_password
+    from user.user_cache import user_cache, AuthUser
+    from user.auth import decode_access_token, hash_password_async, verify_password_async, create_payment_token
+    from serialization import FastJSONResponse, money
+    from conditional import if_none_match, make_etag, not_modified, tag_response
+    from rate_limit import client_ip, rate_limiter
 
 
 router = APIRouter()
@@ -24,38 +63,101 @@ router = APIRouter()
 bearer_scheme = HTTPBearer()
 
 
+# Handlers that hash passwords/PINs are async: the KDF runs in the dedicated pool (user/kdf_pool.py)
+# and short DB calls go to the threadpool, so hashing bursts don't hold threadpool threads.
+# Each of them first passes `rate_limiter` (rate_limit.py), before any DB or hashing work.
+
+
+# Signup and login only know the email, which decides the account's shard (see sharding.py),
+# so they open their session themselves instead of using `get_db`.
+
+
 @router.post("/signup", response_model=SignupResponse)
-def signup(payload: Signup, db: Session = Depends(get_db)):
-    # check for existing email
-    existing = db.query(User).filter(User.email == payload.email).first()
-    if existing:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
-
-    # create user with optional PIN
-    pin = getattr(payload, "pin", None)
-    if pin is not None:
-        # normalize empty strings to None
-        if isinstance(pin, str) and pin.strip() == "":
-            pin = None
-    # validate pin format if provided
-    if pin is not None and not re.fullmatch(r"\d{4,6}", pin):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="PIN must be 4-6 digits")
-    user = create_user(db, payload.name, payload.email, payload.password, pin)
+async def signup(payload: Signup, request: Request):
+    await rate_limiter.admit("signup", ip=client_ip(request))
+    db = session_for_shard(shard_for_email(payload.email))
+    try:
+        # check for existing email
+        existing = await run_in_threadpool(lambda: db.query(User).filter(User.email == payload.email).first())
+        # return the pooled connection before hashing
+        await run_in_threadpool(db.close)
+        if existing:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
+
+        # create user with optional PIN
+        pin = getattr(payload, "pin", None)
+        if pin is not None:
+            # normalize empty strings to None
+            if isinstance(pin, str) and pin.strip() == "":
+                pin = None
+        # validate pin format if provided
+        if pin is not None and not re.fullmatch(r"\d{4,6}", pin):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="PIN must be 4-6 digits")
+        user = await create_user_async(db, payload.name, payload.email, payload.password, pin)
+    finally:
+        await run_in_threadpool(db.close)
     token = create_token_for_user(user)
     return {"user": user, "access_token": token, "token_type": "bearer"}
 
 
 @router.post("/login", response_model=Token)
-def login(payload: Login, db: Session = Depends(get_db)):
-    user = authenticate_user(db, payload.email, payload.password)
+async def login(payload: Login, request: Request):
+    await rate_limiter.admit("login", ip=client_ip(request), email=payload.email)
+    db = session_for_shard(shard_for_email(payload.email))
+    try:
+        user = await authenticate_user_async(db, payload.email, payload.password)
+    finally:
+        await run_in_threadpool(db.close)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     token = create_token_for_user(user)
     return {"access_token": token, "token_type": "bearer"}
 
+
+def _token_subject(credentials: HTTPAuthorizationCredentials) -> int:
+    """The user id of a bearer token; 401 if it is invalid or expired."""
+    try:
+        return int(decode_access_token(credentials.credentials).get("sub"))
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
+
+
+def get_user_db(credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)) -> Generator[Session, None, None]:
+    """`get_db` for authenticated requests: a session on the shard of the token's user.
+
+    The same session (FastAPI caches dependencies per request) serves the auth dependency
+    and the handler.
+    """
+    if not SHARDED:
+        yield from get_db()
+        return
+    yield from get_shard_db(shard_for_user(_token_subject(credentials)))
+
 def _get_current_user_from_token(
-    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme), db: Session = Depends(get_db)
-):
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme), db: Session = Depends(get_user_db)
+) -> AuthUser:
+    """Resolve the bearer token to an `AuthUser` snapshot, from `user_cache` when possible.
+
+    The snapshot is not attached to `db`; handlers that modify the user must load or update
+    the row themselves.
+    """
+    user_id = _token_subject(credentials)
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    snapshot = AuthUser.from_user(user)
+    user_cache.put(snapshot)
+    return snapshot
+
+
+async def _get_current_user_from_token_async(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme), db: AsyncSession = Depends(get_async_db)
+) -> AuthUser:
+    """`_get_current_user_from_token` on the async database path (DB_ASYNC=1)."""
     token = credentials.credentials
     try:
         payload = decode_access_token(token)
@@ -63,19 +165,45 @@ def _get_current_user_from_token(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
 
     user_id = int(payload.get("sub"))
-    user = db.query(User).filter(User.id == user_id).first()
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+    snapshot = AuthUser.from_user(user)
+    user_cache.put(snapshot)
+    return snapshot
+
+
+def _user_out(user: AuthUser) -> FastJSONResponse:
+    return FastJSONResponse({"id": user.id, "name": user.name, "email": user.email, "balance": money(user.balance)})
+
+
+def _me_response(request: Request, user: AuthUser):
+    # the snapshot carries the version its fields were read with
+    etag = make_etag("me", user.id, user.version)
+    if if_none_match(request, etag):
+        return not_modified(etag)
+    return tag_response(_user_out(user), etag)
+
+
+def me(request: Request, current_user: AuthUser = Depends(_get_current_user_from_token)):
+    return _me_response(request, current_user)
 
 
-@router.get("/me", response_model=UserOut)
-def me(current_user: User = Depends(_get_current_user_from_token)):
-    return current_user
+async def me_async(request: Request, current_user: AuthUser = Depends(_get_current_user_from_token_async)):
+    return _me_response(request, current_user)
+
+
+router.get("/me", response_model=UserOut)(me_async if DB_ASYNC else me)
 
 
 @router.post("/set-pin")
-def set_pin(payload: SetPin, current_user: User = Depends(_get_current_user_from_token), db: Session = Depends(get_db)):
+async def set_pin(
+    payload: SetPin, request: Request, current_user: AuthUser = Depends(_get_current_user_from_token), db: Session = Depends(get_user_db)
+):
     """Set or update the authenticated user's payment PIN."""
     # hash and store the PIN
     if not getattr(payload, "pin", None):
@@ -83,15 +211,86 @@ def set_pin(payload: SetPin, current_user: User = Depends(_get_current_user_from
     pin = payload.pin
     if not re.fullmatch(r"\d{4,6}", pin):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="PIN must be 4-6 digits")
-    hashed = hash_password(pin)
-    current_user.hashed_pin = hashed
-    db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
+    await rate_limiter.admit("pin", ip=client_ip(request), user=current_user.id)
+    # return the pooled connection before hashing
+    await run_in_threadpool(db.close)
+    hashed = await hash_password_async(pin)
+
+    def _store_pin() -> None:
+        db.query(User).filter(User.id == current_user.id).update(
+            {User.hashed_pin: hashed, User.version: User.version + 1}, synchronize_session=False
+        )
+        # payment sessions were authorized with the old PIN
+        revoke_payment_grants(db, current_user.id)
+        user_cache.invalidate_on_commit(db, current_user.id)
+        db.commit()
+
+    await run_in_threadpool(_store_pin)
     return {"success": True}
 
 
-@router.get("/search", response_model=List[SearchOut])
+@router.post("/payment-session", response_model=PaymentSessionOut)
+async def payment_session(
+    payload: PaymentSessionRequest,
+    request: Request,
+    current_user: AuthUser = Depends(_get_current_user_from_token),
+    db: Session = Depends(get_user_db),
+):
+    """Verify the payment PIN once and issue a short-lived, amount- and count-capped payment token.
+
+    Pass the token to /transfer as `payment_token` instead of `pin` to skip the per-transfer
+    PIN hash until the token expires or its caps are used up.
+    """
+    # read the hash from the database, not the cached snapshot (the PIN may have just changed)
+    hashed_pin = await run_in_threadpool(get_hashed_pin, db, current_user.id)
+    if not hashed_pin:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Payment PIN not set for this account")
+
+    max_amount = PAYMENT_SESSION_MAX_AMOUNT
+    if payload.max_amount is not None:
+        try:
+            requested = Decimal(str(payload.max_amount)).quantize(Decimal("0.01"))
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid max_amount")
+        if requested <= 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="max_amount must be greater than zero")
+        max_amount = min(requested, PAYMENT_SESSION_MAX_AMOUNT)
+    max_count = PAYMENT_SESSION_MAX_COUNT
+    if payload.max_count is not None:
+        if payload.max_count < 1:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="max_count must be at least 1")
+        max_count = min(payload.max_count, PAYMENT_SESSION_MAX_COUNT)
+
+    await rate_limiter.admit("pin", ip=client_ip(request), user=current_user.id)
+    # return the pooled connection before hashing
+    await run_in_threadpool(db.close)
+    if not await verify_password_async(payload.pin, hashed_pin):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid payment PIN")
+
+    grant = await run_in_threadpool(
+        create_payment_grant, db, current_user.id, max_amount, max_count, PAYMENT_SESSION_TTL_SECONDS
+    )
+    token = create_payment_token(current_user.id, grant.id, PAYMENT_SESSION_TTL_SECONDS)
+    return {
+        "payment_token": token,
+        "expires_in": PAYMENT_SESSION_TTL_SECONDS,
+        "max_amount": float(max_amount),
+        "max_count": max_count,
+    }
+
+
+def _token_user_id(credentials: Optional[HTTPAuthorizationCredentials]) -> Optional[int]:
+    # If a bearer token was provided, try to decode it so that user can be excluded from results
+    if credentials and credentials.credentials:
+        try:
+            payload = decode_access_token(credentials.credentials)
+            return int(payload.get("sub")) if payload.get("sub") is not None else None
+        except Exception:
+            # ignore invalid/expired tokens for search; treat as unauthenticated
+            return None
+    return None
+
+
 def search(
     q: str = "",
     db: Session = Depends(get_db),
@@ -103,24 +302,25 @@ def search(
     Returns a list of matching users (max 10).
     """
     if not q or not q.strip():
-        return []
+        return _search_out([])
+    if SHARDED:
+        return _search_out(search_users_sharded(q, exclude_user_id=_token_user_id(credentials)))
+    return _search_out(search_users(db, q, exclude_user_id=_token_user_id(credentials)))
 
-    # Use case-insensitive partial match on name or email and limit results
-    pattern = f"%{q}%"
 
-    # If a bearer token was provided, try to decode it and exclude that user from results
-    current_user_id: Optional[int] = None
-    if credentials and credentials.credentials:
-        try:
-            payload = decode_access_token(credentials.credentials)
-            current_user_id = int(payload.get("sub")) if payload.get("sub") is not None else None
-        except Exception:
-            # ignore invalid/expired tokens for search; treat as unauthenticated
-            current_user_id = None
+async def search_async(
+    q: str = "",
+    db: AsyncSession = Depends(get_async_db),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
+):
+    """`search` on the async database path (DB_ASYNC=1)."""
+    if not q or not q.strip():
+        return _search_out([])
+    return _search_out(await search_users_async(db, q, exclude_user_id=_token_user_id(credentials)))
+
+
+def _search_out(users: List[User]) -> FastJSONResponse:
+    return FastJSONResponse([{"id": u.id, "name": u.name, "email": u.email} for u in users])
 
-    query_stmt = db.query(User).filter((User.email.ilike(pattern)) | (User.name.ilike(pattern)))
-    if current_user_id is not None:
-        query_stmt = query_stmt.filter(User.id != current_user_id)
 
-    users = query_stmt.limit(10).all()
-    return users
+router.get("/search", response_model=List[SearchOut])(search_async if DB_ASYNC else search)
@@ -1,9 +1,11 @@
-from pydantic import BaseModel, EmailStr
+from decimal import Decimal
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 from typing import Optional
 
 
 class Signup(BaseModel):
-    name: str
+    # users.name is VARCHAR(255); names also travel in every SSE event of their transfers
+    name: str = Field(max_length=255)
     email: EmailStr
     password: str
     # PIN: optional 4-6 digits used for payments (validated server-side)
@@ -21,13 +23,13 @@ class Token(BaseModel):
 
 
 class UserOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     name: str
     email: EmailStr
-    balance: float
-
-    class Config:
-        orm_mode = True
+    # serialized as an exact decimal string
+    balance: Decimal
 
 
 class SignupResponse(BaseModel):
@@ -38,13 +40,26 @@ class SignupResponse(BaseModel):
 
 class SearchOut(BaseModel):
     """Response model for user search results."""
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     name: str
     email: EmailStr
 
-    class Config:
-        orm_mode = True
-
 
 class SetPin(BaseModel):
     pin: str
+
+
+class PaymentSessionRequest(BaseModel):
+    pin: str
+    # Optional caps; server-side maximums apply when omitted or larger
+    max_amount: Optional[float] = None
+    max_count: Optional[int] = None
+
+
+class PaymentSessionOut(BaseModel):
+    payment_token: str
+    expires_in: int
+    max_amount: float
+    max_count: int
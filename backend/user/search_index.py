@@ -0,0 +1,165 @@
+"""
+search_index.py
+
+Indexed recipient search for GET /auth/search.
+
+`name ILIKE '%q%'` can't use a b-tree, so every keystroke of the autocomplete scanned the
+whole users table. Search now runs in two bounded steps:
+
+1. Prefix matches on lower(name) / lower(email), answered by the expression indexes
+   declared on `User` as index range scans. These rank first.
+2. If that didn't fill the page and the query has at least 3 characters, substring matches
+   from a trigram index:
+   - SQLite: an FTS5 table `users_fts` (trigram tokenizer, external content on `users`)
+     kept current by triggers on insert, delete and name/email updates.
+   - Postgres: GIN indexes on lower(name) / lower(email) with pg_trgm, used by LIKE '%q%'.
+
+Both steps stop at `limit` rows, so latency doesn't grow with the table. `install_search_index`
+creates whatever is missing at startup (idempotent, safe from several workers); if the
+database can't provide a trigram index the substring step falls back to a scan.
+
+With several shards (sharding.py) `search_users_sharded` runs the same search on every shard
+in parallel and ranks the combined rows again.
+"""
+import logging
+from typing import List, Optional
+
+from sqlalchemy import column, func, literal_column, table
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.orm import Session
+
+try:
+    from .models import User, USER_SEARCH_INDEXES
+    from ..sharding import scatter
+except Exception:
+    from user.models import User, USER_SEARCH_INDEXES
+    from sharding import scatter
+
+logger = logging.getLogger(__name__)
+
+# shorter queries only get prefix matches: a 1-2 character substring matches too much to be useful
+MIN_SUBSTRING_LENGTH = 3
+
+# which substring index this process uses: 'fts5', 'pg_trgm' or 'scan' (set by install_search_index)
+search_backend = "scan"
+
+_SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "name, email, content='users', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); END",
+    # balance updates don't touch name/email, so transfers never fire this
+    "CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF name, email ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email); "
+    "INSERT INTO users_fts(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+]
+
+_POSTGRES_TRGM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_users_name_trgm ON users USING gin (lower(name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (lower(email) gin_trgm_ops)",
+]
+
+
+def install_search_index(bind: Engine) -> str:
+    """Create the search indexes that are missing and return the substring backend in use."""
+    global search_backend
+    with bind.begin() as conn:
+        # not `checkfirst`: reflection doesn't see expression indexes
+        for index in USER_SEARCH_INDEXES:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+    dialect = bind.dialect.name
+    try:
+        if dialect == "sqlite":
+            with bind.begin() as conn:
+                existed = conn.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'"
+                ).first()
+                for stmt in _SQLITE_FTS:
+                    conn.exec_driver_sql(stmt)
+                if not existed:
+                    # index the users created before the triggers existed
+                    conn.exec_driver_sql("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+            search_backend = "fts5"
+        elif dialect == "postgresql":
+            with bind.begin() as conn:
+                for stmt in _POSTGRES_TRGM:
+                    conn.exec_driver_sql(stmt)
+            search_backend = "pg_trgm"
+    except Exception:
+        # e.g. SQLite built without FTS5 trigram, or no permission to create the extension
+        logger.exception("Trigram search index unavailable; substring search will scan")
+        search_backend = "scan"
+    return search_backend
+
+
+def _fts_phrase(needle: str) -> str:
+    # one quoted phrase: matches the trigrams of `needle` in order, i.e. the substring
+    return '"' + needle.replace('"', '""') + '"'
+
+
+def _prefix_matches(db: Session, needle: str, exclude_user_id: Optional[int], limit: int) -> List[User]:
+    # [needle, needle + U+FFFF) is an index range scan, unlike LIKE 'needle%' on most collations
+    upper = needle + "\uffff"
+    found = {}
+    for key in (func.lower(User.name), func.lower(User.email)):
+        query = db.query(User).filter(key >= needle, key < upper)
+        if exclude_user_id is not None:
+            query = query.filter(User.id != exclude_user_id)
+        for user in query.order_by(key).limit(limit):
+            found.setdefault(user.id, user)
+    return sorted(found.values(), key=lambda u: (u.name.lower(), u.id))[:limit]
+
+
+def _substring_matches(db: Session, needle: str, exclude: set, limit: int) -> List[User]:
+    query = db.query(User)
+    if search_backend == "fts5":
+        # drive the loop from the FTS index so LIMIT stops it after `limit` hits
+        fts = table("users_fts", column("rowid"))
+        query = (
+            query.select_from(fts)
+            .join(User, User.id == fts.c.rowid)
+            .filter(literal_column("users_fts").op("MATCH")(_fts_phrase(needle)))
+        )
+    else:
+        # pg_trgm GIN indexes serve these LIKEs; elsewhere this is the old scan
+        query = query.filter(
+            func.lower(User.name).contains(needle, autoescape=True)
+            | func.lower(User.email).contains(needle, autoescape=True)
+        )
+    if exclude:
+        query = query.filter(User.id.notin_(exclude))
+    return sorted(query.limit(limit).all(), key=lambda u: (u.name.lower(), u.id))
+
+
+def search_users(db: Session, q: str, exclude_user_id: Optional[int] = None, limit: int = 10) -> List[User]:
+    """Up to `limit` users whose name or email starts with `q` (ranked first) or contains it, case-insensitive."""
+    needle = q.strip().lower()
+    if not needle:
+        return []
+    found = _prefix_matches(db, needle, exclude_user_id, limit)
+    if len(found) < limit and len(needle) >= MIN_SUBSTRING_LENGTH:
+        exclude = {u.id for u in found}
+        if exclude_user_id is not None:
+            exclude.add(exclude_user_id)
+        found += _substring_matches(db, needle, exclude, limit - len(found))
+    return found
+
+
+def search_users_sharded(q: str, exclude_user_id: Optional[int] = None, limit: int = 10) -> List[User]:
+    """`search_users` over every shard: each returns up to `limit` rows, and the merged rows are
+    ranked as one shard would rank them (prefix matches first, then by name)."""
+    needle = q.strip().lower()
+    if not needle:
+        return []
+    found = [u for users in scatter(lambda db: search_users(db, q, exclude_user_id, limit)) for u in users]
+
+    def rank(u: User) -> tuple:
+        prefix = u.name.lower().startswith(needle) or u.email.lower().startswith(needle)
+        return (not prefix, u.name.lower(), u.id)
+
+    return sorted(found, key=rank)[:limit]
@@ -0,0 +1,139 @@
+"""
+user_cache.py
+
+In-process TTL + LRU cache of the user fields needed to authenticate a request.
+
+`_get_current_user_from_token` runs on every authenticated request; with this cache a hit
+needs no DB round trip. Entries are invalidated when a user's balance or PIN changes
+(`transfer_funds`, `/auth/set-pin`): immediately, and once more after the session commits
+so a concurrent reader can't re-cache a value from before the commit.
+
+The cache is per process. With several workers, a change made by one worker is seen by the
+others after at most USER_CACHE_TTL_SECONDS. Nothing that authorizes money movement is taken
+from a snapshot: transfers re-read balances under lock, and the PIN hash isn't cached at all
+(PIN checks read it from the database), so only reads like /auth/me and the version-based
+ETags can be briefly stale.
+
+Configuration (environment):
+- USER_CACHE_TTL_SECONDS: entry lifetime (default 30; 0 disables the cache).
+- USER_CACHE_MAX_ENTRIES: LRU capacity (default 10000).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+@dataclass(frozen=True)
+class AuthUser:
+    """Snapshot of the auth-relevant columns of a `User` row."""
+
+    id: int
+    name: str
+    email: str
+    balance: Decimal
+    version: int
+
+    @classmethod
+    def from_user(cls, user) -> "AuthUser":
+        return cls(
+            id=user.id, name=user.name, email=user.email, balance=user.balance, version=user.version,
+        )
+
+
+class UserCache:
+    def __init__(self, ttl_seconds: float | None = None, max_entries: int | None = None) -> None:
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+        if max_entries is None:
+            max_entries = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        # user_id -> (expires_at monotonic, snapshot); ordered oldest-used first
+        self._entries: "OrderedDict[int, Tuple[float, AuthUser]]" = OrderedDict()
+        # accessed from threadpool threads
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> Optional[AuthUser]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, user = entry
+            if expires_at <= now:
+                del self._entries[user_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return user
+
+    def put(self, user: AuthUser) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl_seconds, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *user_ids: int) -> None:
+        with self._lock:
+            for user_id in user_ids:
+                if self._entries.pop(user_id, None) is not None:
+                    self.invalidations += 1
+
+    def invalidate_on_commit(self, db: Session, *user_ids: int) -> None:
+        """Drop `user_ids` now and again after `db` commits."""
+        self.invalidate(*user_ids)
+        db.info.setdefault("user_cache_invalidate", set()).update(user_ids)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    user_ids = session.info.pop("user_cache_invalidate", None)
+    if user_ids:
+        user_cache.invalidate(*user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop("user_cache_invalidate", None)
@@ -5,7 +5,8 @@ export interface TransferResponse {
   receiver_id: number;
   amount: number;
   sender_balance: number;
-  receiver_balance: number;
+  // null when the receiver is on another shard
+  receiver_balance: number | null;
 }
 
 export async function transfer(receiver_email: string, amount: number, pin: string, note?: string) {
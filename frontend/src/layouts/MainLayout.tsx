@@ -52,6 +52,11 @@ const MainLayout: React.FC = () => {
 
   // Start SSE and handle incoming transfer events
   useSSE((data: any) => {
+    if (data?.event === 'resync') {
+      // missed events couldn't all be replayed; the balance is refetched like the history
+      axiosInstance.get('/auth/me').then(res => setUserDetails(res.data)).catch(err => console.error('Failed to fetch user details', err))
+      return
+    }
     if (!data || data.event !== 'transfer') return
     const meId = userDetails?.id
     if (!meId) {
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react'
+import React, { useEffect, useRef, useState } from 'react'
 import { useOutletContext } from 'react-router-dom'
 import axiosInstance from '../api/axiosInstance'
 
@@ -7,18 +7,32 @@ type Tx = {
   type: 'debited' | 'credited'
   sender_name: string
   receiver_name: string
-  amount: number
+  // exact decimal string, e.g. "12.50"
+  amount: string
   created_at: string
   note?: string | null
 }
 
 type LayoutContext = { userDetails: any }
 
+// totals over the whole history, from GET /transactions/summary (amounts are decimal strings)
+type Summary = { sent: string; received: string; count: number }
+
 const History: React.FC = () => {
   const { userDetails } = useOutletContext<LayoutContext>()
   const [txs, setTxs] = useState<Tx[]>([])
   const [loading, setLoading] = useState<boolean>(false)
   const [error, setError] = useState<string | null>(null)
+  const [summary, setSummary] = useState<Summary | null>(null)
+  // X-Next-Cursor of the last page loaded; null once the oldest page is shown
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState<boolean>(false)
+  // highest transaction id shown; the delta-sync cursor
+  const lastIdRef = useRef<number>(0)
+
+  useEffect(() => {
+    lastIdRef.current = txs.reduce((m, t) => Math.max(m, t.id), 0)
+  }, [txs])
 
   useEffect(() => {
     let mounted = true
@@ -32,6 +46,7 @@ const History: React.FC = () => {
         const data: Tx[] = Array.isArray(res.data) ? res.data : []
         data.sort((a, b) => new Date(b.created_at).getTime() - new Date(a.created_at).getTime())
         setTxs(data)
+        setNextCursor(res.headers['x-next-cursor'] || null)
       } catch (err: any) {
         console.error('Failed to load transactions', err)
         setError(err?.response?.data || err.message || 'Failed to load')
@@ -40,27 +55,83 @@ const History: React.FC = () => {
       }
     }
 
+    // a page holds at most 50 rows; the totals cover every transaction, so the server sums them
+    const fetchSummary = async () => {
+      try {
+        const res = await axiosInstance.get('/transactions/summary')
+        if (mounted) setSummary(res.data)
+      } catch (err) {
+        console.warn('Failed to load transaction totals', err)
+      }
+    }
+
     fetchTx()
+    fetchSummary()
 
-    // listen for SSE-triggered transaction refreshes
-    const handler = (e: Event) => {
+    // fetch only the rows newer than the newest one already shown
+    const catchUp = async () => {
       try {
-        const detail = (e as CustomEvent).detail
-        if (!mounted) return
-        const data: Tx[] = Array.isArray(detail) ? detail : []
-        data.sort((a, b) => new Date(b.created_at).getTime() - new Date(a.created_at).getTime())
-        setTxs(data)
+        let since = lastIdRef.current
+        let more = true
+        while (more && mounted) {
+          const res = await axiosInstance.get('/transactions/changes', { params: { since } })
+          const fresh: Tx[] = res.data?.transactions || []
+          if (!mounted) return
+          if (fresh.length) {
+            setTxs(prev => {
+              const known = new Set(prev.map(t => t.id))
+              return [...fresh.filter(t => !known.has(t.id)).reverse(), ...prev]
+            })
+          }
+          since = res.data?.cursor ?? since
+          more = !!res.data?.has_more
+        }
+        fetchSummary()
       } catch (err) {
-        console.warn('transactions:updated handler error', err)
+        console.warn('transactions:stale handler error', err)
       }
     }
-    window.addEventListener('transactions:updated', handler as EventListener)
+    window.addEventListener('transactions:stale', catchUp)
+
+    // a single new row pushed over SSE; replays after a reconnect may repeat a row
+    const onNew = (e: Event) => {
+      if (!mounted) return
+      const tx = (e as CustomEvent).detail as Tx
+      if (!tx) return
+      setTxs(prev => (prev.some(t => t.id === tx.id) ? prev : [tx, ...prev]))
+      fetchSummary()
+    }
+    window.addEventListener('transactions:new', onNew as EventListener)
 
-    return () => { mounted = false; window.removeEventListener('transactions:updated', handler as EventListener) }
+    return () => {
+      mounted = false
+      window.removeEventListener('transactions:stale', catchUp)
+      window.removeEventListener('transactions:new', onNew as EventListener)
+    }
   }, [])
 
-  const totalSent = txs.filter(t => t.type === 'debited').reduce((s, t) => s + t.amount, 0)
-  const totalReceived = txs.filter(t => t.type === 'credited').reduce((s, t) => s + t.amount, 0)
+  // older rows, following X-Next-Cursor
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return
+    setLoadingMore(true)
+    try {
+      const res = await axiosInstance.get('/transactions', { params: { before: nextCursor } })
+      const older: Tx[] = Array.isArray(res.data) ? res.data : []
+      setTxs(prev => {
+        const known = new Set(prev.map(t => t.id))
+        return [...prev, ...older.filter(t => !known.has(t.id))]
+      })
+      setNextCursor(res.headers['x-next-cursor'] || null)
+    } catch (err: any) {
+      console.error('Failed to load older transactions', err)
+      setError(err?.response?.data?.detail || err.message || 'Failed to load')
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
+  const totalSent = Number(summary?.sent ?? 0)
+  const totalReceived = Number(summary?.received ?? 0)
 
   return (
     <div className="w-full md:w-3/4 p-6 md:p-10">
@@ -80,7 +151,7 @@ const History: React.FC = () => {
         </div>
         <div className="bg-white rounded-lg shadow p-4">
           <div className="text-xs text-gray-500">Transactions</div>
-          <div className="text-xl font-semibold text-gray-900">{txs.length}</div>
+          <div className="text-xl font-semibold text-gray-900">{summary?.count ?? txs.length}</div>
         </div>
       </div>
 
@@ -126,7 +197,7 @@ const History: React.FC = () => {
                         {t.note && <div className="text-sm text-gray-600 mt-1">{t.note}</div>}
                       </div>
                       <div>
-                        <div className={`text-lg md:text-2xl font-semibold ${t.type === 'credited' ? 'text-green-600' : 'text-red-600'}`}>{t.type === 'credited' ? '+' : '-'} ₹ {t.amount.toLocaleString()}</div>
+                        <div className={`text-lg md:text-2xl font-semibold ${t.type === 'credited' ? 'text-green-600' : 'text-red-600'}`}>{t.type === 'credited' ? '+' : '-'} ₹ {Number(t.amount).toLocaleString()}</div>
                       </div>
                     </div>
                 </div>
@@ -134,6 +205,19 @@ const History: React.FC = () => {
             ))}
           </ul>
         )}
+
+        {!loading && nextCursor && (
+          <div className="mt-6 text-center">
+            <button
+              type="button"
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="px-4 py-2 rounded-md bg-gray-100 text-gray-700 hover:bg-gray-200 disabled:opacity-50"
+            >
+              {loadingMore ? 'Loading...' : 'Load older transactions'}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   )
@@ -1,5 +1,4 @@
 import { useEffect } from 'react'
-import axiosInstance from '../api/axiosInstance'
 
 export type SSEHandler = (data: any) => void
 
@@ -17,18 +16,17 @@ export default function useSSE(onMessage: SSEHandler) {
     es.onmessage = async (e: MessageEvent) => {
       try {
         const parsed = JSON.parse(e.data)
-        // call transactions API to refresh latest transactions
+        // events carry the new history row, so listeners update in place instead of refetching.
+        // After a reconnect the browser sends Last-Event-ID and the server replays missed events.
         try {
-          const res = await axiosInstance.get('/transactions')
-          // dispatch a DOM event so interested components can update
-          try {
-            window.dispatchEvent(new CustomEvent('transactions:updated', { detail: res.data }))
-          } catch (evErr) {
-            // fallback: call onMessage with original payload if dispatch fails
-            console.warn('failed to dispatch transactions:updated event', evErr)
+          if (parsed && parsed.transaction) {
+            window.dispatchEvent(new CustomEvent('transactions:new', { detail: parsed.transaction }))
+          } else {
+            // no row attached: listeners catch up through /transactions/changes
+            window.dispatchEvent(new CustomEvent('transactions:stale'))
           }
-        } catch (apiErr) {
-          console.error('Failed to fetch transactions on SSE event', apiErr)
+        } catch (evErr) {
+          console.warn('failed to update transactions from SSE event', evErr)
         }
 
         onMessage(parsed)